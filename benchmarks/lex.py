@@ -0,0 +1,99 @@
+"""Compares the peak memory of lexing a file read into a string with
+lexing it through an MmapInputStream
+
+Run from the repository root: python -m benchmarks.lex [front end] [MB]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from antlr4 import InputStream, Token
+
+from compiler.input_stream import MmapInputStream
+from compiler.lexer import iter_tokens
+
+FUNCTION = """
+/* f{0} */
+fun f{0}(a: Int, b: Int) => Int where
+    var x = a * {0} + b - (a << 2);
+    return x + 'ünïcödé'.length;
+end
+"""
+
+
+def write_source(f, megabytes: int):
+    size = 0
+    i = 0
+
+    while size < megabytes << 20:
+        text = FUNCTION.format(i).encode("utf-8")
+        f.write(text)
+
+        size += len(text)
+        i += 1
+
+
+def lex(source, front_end: str) -> int:
+    if front_end == "pratt":
+        return sum(1 for _ in iter_tokens(source))
+
+    from gen.WappaLexer import WappaLexer
+
+    if isinstance(source, str):
+        source = InputStream(source)
+
+    lexer = WappaLexer(source)
+
+    count = 0
+    while lexer.nextToken().type != Token.EOF:
+        count += 1
+
+    return count
+
+
+def from_string(path: str, front_end: str) -> int:
+    with open(path, "rb") as f:
+        return lex(f.read().decode("utf-8"), front_end)
+
+
+def from_mmap(path: str, front_end: str) -> int:
+    with MmapInputStream(path) as source:
+        return lex(source, front_end)
+
+
+def measure(read, path: str, front_end: str):
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    tokens = read(path, front_end)
+
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print("{:>7}: {:9d} tokens, {:8.1f}s, peak {:7.1f}MB".format(
+        read.__name__[5:], tokens, elapsed, peak / (1 << 20)))
+
+
+def main():
+    front_end = sys.argv[1] if len(sys.argv) > 1 else "antlr"
+    megabytes = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    with tempfile.NamedTemporaryFile(suffix=".wappa", delete=False) as f:
+        write_source(f, megabytes)
+
+    try:
+        print("{}, {}MB".format(front_end, megabytes))
+
+        for read in (from_string, from_mmap):
+            measure(read, f.name, front_end)
+
+    finally:
+        os.unlink(f.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Reports the memory the AST keeps alive once parsed, per node
+
+Run from the repository root: python -m benchmarks.nodes [front end]
+"""
+
+import gc
+import sys
+import tracemalloc
+
+from compiler.IDGenerator import IDGenerator
+from compiler.parser import Parser
+from compiler.parsing import parse
+from compiler.structs.Function import Function
+from compiler.structs.Type import WappaType
+from compiler.traversal import walk
+from compiler.util import EXCEPTION_LIST
+from compiler.visitor import WappaVisitor
+
+SIZES = [50, 100, 200]
+
+FUNCTION = """
+fun f{0}(a: Int, b: Int) => Int where
+    var x = a * {0} + b - (a << 2);
+    var y = x > a ? x % 7 : (b & a) | {0};
+    while (x < y && a != b || y >= {0}) where
+        x += a * (b - y) + (x >> 1);
+    end
+    for (var i = 0; i < b; i++) where
+        y -= i * x;
+    end
+    return x + y * (a - b);
+end
+"""
+
+
+def source(functions: int) -> str:
+    return "".join(FUNCTION.format(i) for i in range(functions))
+
+
+def build(text: str, front_end: str) -> WappaVisitor:
+    EXCEPTION_LIST.clear()
+    WappaType.idgen = IDGenerator()
+
+    visitor = WappaVisitor()
+
+    if front_end == "pratt":
+        Parser(text, visitor).parse()
+    else:
+        visitor.visit(parse(text))
+
+    return visitor
+
+
+def main():
+    front_end = sys.argv[1] if len(sys.argv) > 1 else "antlr"
+
+    print("{:>9} {:>8} {:>12} {:>10}".format(
+        "functions", "nodes", "retained", "per node"))
+
+    for functions in SIZES:
+        text = source(functions)
+
+        gc.collect()
+        tracemalloc.start()
+
+        # Only what the visitor holds on to survives, the tokens and parse
+        # tree are dropped as soon as the nodes stop referencing them
+        visitor = build(text, front_end)
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        nodes = sum(
+            sum(1 for _ in walk(f.block))
+            for f in visitor.global_scope.symbols(values=True)
+            if isinstance(f, Function))
+
+        print("{:9d} {:8d} {:11d}B {:9.1f}B".format(
+            functions, nodes, retained, retained / nodes))
+
+
+if __name__ == "__main__":
+    main()
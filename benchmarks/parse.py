@@ -0,0 +1,53 @@
+"""Compares the parse time of full LL prediction with two-stage SLL/LL
+
+Run from the repository root: python -m benchmarks.parse [functions]
+"""
+
+import sys
+import time
+
+from compiler.parsing import PREDICTION_MODES, parse
+
+FUNCTION = """
+fun f{0}(a: Int, b: Int) => Int where
+    var x = a * {0} + b - (a << 2) / (b + 1);
+    var y = x > a ? x % 7 : (b & a) | {0};
+    while (x < y && a != b || y >= {0}) where
+        x += a * (b - y) + (x >> 1);
+    end
+    return x + y * (a - b);
+end
+"""
+
+
+def source(functions: int) -> str:
+    return "".join(FUNCTION.format(i) for i in range(functions))
+
+
+def bench(text: str, prediction: str, repeat: int = 3) -> float:
+    best = float("inf")
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(text, prediction)
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def main():
+    functions = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    text = source(functions)
+
+    print("{} functions, {} bytes".format(functions, len(text)))
+
+    times = {}
+    for prediction in PREDICTION_MODES:
+        times[prediction] = bench(text, prediction)
+        print("{:>4}: {:8.3f}s".format(prediction, times[prediction]))
+
+    print("speedup: {:.2f}x".format(times["ll"] / times["sll"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Compares the peak memory of compiling a whole module at once with
+streaming it one declaration at a time
+
+Run from the repository root: python -m benchmarks.stream [front end]
+"""
+
+import io
+import sys
+import tracemalloc
+
+from compiler.IDGenerator import IDGenerator
+from compiler.parser import Parser
+from compiler.parsing import parse
+from compiler.streaming import StreamingCompiler
+from compiler.structs.Type import WappaType
+from compiler.util import EXCEPTION_LIST
+from compiler.visitor import WappaVisitor
+
+SIZES = [100, 200, 400, 800]
+
+# Calls the previous function, as the batch compiler cannot look ahead
+FIRST = """
+fun f0(a: Int, b: Int) => Int = a + b;
+"""
+
+FUNCTION = """
+fun f{0}(a: Int, b: Int) => Int where
+    var x = a * {0} + b - (a << 2);
+    var y = x > a ? x % 7 : (b & a) | {0};
+    while (x < y && a != b || y >= {0}) where
+        x += a * (b - y) + (x >> 1);
+    end
+    return f{1}(x, y) + y * (a - b);
+end
+"""
+
+
+def source(functions: int) -> str:
+    return FIRST + "".join(FUNCTION.format(i, i - 1)
+                           for i in range(1, functions))
+
+
+def batch(text: str, front_end: str):
+    visitor = WappaVisitor()
+
+    if front_end == "pratt":
+        Parser(text, visitor).parse()
+        visitor.compile()
+    else:
+        visitor.visit(parse(text))
+
+
+def stream(text: str, front_end: str):
+    StreamingCompiler(front_end=front_end).compile(text, io.StringIO())
+
+
+def peak(compile, text: str, front_end: str) -> int:
+    EXCEPTION_LIST.clear()
+    WappaType.idgen = IDGenerator()
+
+    tracemalloc.start()
+    compile(text, front_end)
+    ret = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return ret
+
+
+def main():
+    front_end = sys.argv[1] if len(sys.argv) > 1 else "antlr"
+
+    print("{:>9} {:>10} {:>12} {:>12}".format(
+        "functions", "source", "batch", "stream"))
+
+    for functions in SIZES:
+        text = source(functions)
+
+        # Streamed IR only exists in the output, so both leave it out
+        print("{:9d} {:9d}B {:11d}B {:11d}B".format(
+            functions, len(text), peak(batch, text, front_end),
+            peak(stream, text, front_end)))
+
+
+if __name__ == "__main__":
+    main()
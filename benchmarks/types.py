@@ -0,0 +1,77 @@
+"""Shows the time to type and compile an expression growing linearly with
+its size, each subexpression's type being resolved once
+
+Run from the repository root: python -m benchmarks.types [front end]
+"""
+
+import sys
+import time
+
+from compiler.IDGenerator import IDGenerator
+from compiler.parser import Parser
+from compiler.parsing import parse
+from compiler.structs.Expression import CompoundExpression
+from compiler.structs.Type import WappaType
+from compiler.util import EXCEPTION_LIST
+from compiler.visitor import WappaVisitor
+
+SIZES = [500, 1000, 2000, 4000, 8000]
+
+OPERANDS = ["a", "(b - a)", "b * 3", "(a > b ? a : b)"]
+
+
+def source(terms: int) -> str:
+    expr = " + ".join(OPERANDS[i % len(OPERANDS)] for i in range(terms))
+
+    return "fun f(a: Int, b: Int) => Int = {};\n".format(expr)
+
+
+def compile_text(text: str, front_end: str):
+    EXCEPTION_LIST.clear()
+    WappaType.idgen = IDGenerator()
+
+    visitor = WappaVisitor()
+
+    if front_end == "pratt":
+        Parser(text, visitor).parse()
+        visitor.compile()
+    else:
+        visitor.visit(parse(text))
+
+
+def main():
+    front_end = sys.argv[1] if len(sys.argv) > 1 else "antlr"
+
+    # Counts the types resolved, wrapping the class attribute lookup
+    resolved = [0]
+    type_node = {}
+
+    for cls in CompoundExpression.__subclasses__():
+        type_node[cls] = cls.type_node
+
+        def counted(self, type_node=type_node[cls]):
+            resolved[0] += 1
+            return type_node(self)
+
+        cls.type_node = counted
+
+    print("{:>6} {:>10} {:>10} {:>10}".format(
+        "terms", "time", "per term", "resolved"))
+
+    for terms in SIZES:
+        text = source(terms)
+        resolved[0] = 0
+
+        start = time.perf_counter()
+        compile_text(text, front_end)
+        elapsed = time.perf_counter() - start
+
+        print("{:6d} {:9.3f}s {:8.1f}us {:10d}".format(
+            terms, elapsed, elapsed / terms * 1e6, resolved[0]))
+
+    for cls, method in type_node.items():
+        cls.type_node = method
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,28 @@
 from __future__ import annotations
 
-from typing import List
+import re
+from typing import Dict, List, Set
+
+# Characters LLVM accepts in an unquoted name, which can't start with a digit
+UNSAFE = re.compile(r'[^-A-Za-z0-9$._]')
 
 
 class IDGenerator:
+    """Interns identifiers and mangles them into unique LLVM names
+
+    One is shared by everything in a compilation that names symbols, so
+    names are unique across the whole module, and the same on every run.
+    """
+
     def __init__(self):
+        # Prefixes of generated names, e.g. the enclosing classes
         self.IDs: List[str] = []
 
-        self.usedIDs: List[str] = []
-        self.unnameds: int = 0
+        self.interned: Dict[str, str] = {}
+        self.usedIDs: Set[str] = set()
+
+        # How many names were generated from each base name
+        self.counters: Dict[str, int] = {}
 
     def append(self, ID):
         self.IDs.append(ID)
@@ -16,21 +30,33 @@ class IDGenerator:
     def pop(self):
         self.IDs.pop()
 
-    def generate_id(self, ID: str = ''):
-        if ID == '':
-            ret = '{}gen'.format(self.unnameds)
+    def intern(self, ID: str) -> str:
+        """Returns the single copy of an identifier"""
+
+        return self.interned.setdefault(ID, ID)
+
+    def generate_id(self, ID: str = '') -> str:
+        """Returns a new name, the prefixed ID or 'gen' for anonymous ones,
+        numbered from its second use"""
+
+        ret = ".".join(self.IDs + [ID or 'gen'])
+
+        ret = UNSAFE.sub('_', ret)
+        if ret[0].isdigit():
+            ret = '_' + ret
 
-        else:
-            ret = "_".join(self.IDs + [ID])
+        base = ret
+        num = self.counters.get(base, 0)
 
-            num = 1
-            nret = ret
-            while nret in self.usedIDs:
-                nret = ret + str(num)
-                num += 1
+        # Only a name that is itself a numbered one can already be taken
+        if num:
+            ret = '{}.{}'.format(base, num)
 
-            del nret
+        while ret in self.usedIDs:
+            num += 1
+            ret = '{}.{}'.format(base, num)
 
-            self.usedIDs.append(ret)
+        self.counters[base] = num + 1
+        self.usedIDs.add(ret)
 
-        return ret
+        return self.intern(ret)
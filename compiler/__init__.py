@@ -1,3 +1,5 @@
+__version__ = "0.1.0"
+
 from gen.Wappa import Wappa
 from gen.WappaLexer import WappaLexer
 
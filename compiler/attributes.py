@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import llvmlite.ir as ir
+
+# What a function does to memory other than its own locals, in the order
+# calling another function can only raise it
+NONE, READ, WRITE = range(3)
+
+EFFECT_ATTRIBUTES = {NONE: 'readnone', READ: 'readonly'}
+
+# Effect and whether it never unwinds
+Summary = Tuple[int, bool]
+
+
+def is_local(ptr: ir.Value) -> bool:
+    """Whether a pointer points into one of its function's allocas"""
+
+    while isinstance(ptr, (ir.GEPInstr, ir.CastInstr)):
+        ptr = ptr.operands[0]
+
+    return isinstance(ptr, ir.AllocaInstr)
+
+
+def callees(func: ir.Function) -> Iterator[ir.Value]:
+    for block in func.blocks:
+        for instr in block.instructions:
+            if isinstance(instr, ir.CallInstr):
+                yield instr.callee
+
+
+def declared(callee: ir.Value) -> Summary:
+    """Returns what the attributes of a function defined elsewhere say"""
+
+    if not isinstance(callee, ir.Function):
+        return WRITE, False
+
+    attributes = callee.attributes
+
+    if 'readnone' in attributes:
+        effect = NONE
+    elif 'readonly' in attributes:
+        effect = READ
+    else:
+        effect = WRITE
+
+    return effect, 'nounwind' in attributes
+
+
+def summarize(func: ir.Function,
+              summaries: Dict[ir.Function, Summary]) -> Summary:
+    effect, nounwind = NONE, True
+
+    for block in func.blocks:
+        for instr in block.instructions:
+            if isinstance(instr, ir.LoadInstr):
+                if not is_local(instr.operands[0]):
+                    effect = max(effect, READ)
+
+            elif isinstance(instr, ir.StoreInstr):
+                if not is_local(instr.operands[1]):
+                    effect = WRITE
+
+            elif isinstance(instr, ir.CallInstr):
+                callee = summaries.get(instr.callee) or declared(instr.callee)
+
+                effect = max(effect, callee[0])
+                nounwind = nounwind and callee[1]
+
+            elif instr.opname in ['atomicrmw', 'cmpxchg', 'fence']:
+                effect = WRITE
+
+    return effect, nounwind
+
+
+def bottom_up(functions: List[ir.Function]) -> List[ir.Function]:
+    """Returns the functions in post-order over their call graph, callees
+    before their callers"""
+
+    ret: List[ir.Function] = []
+    defined = set(functions)
+    visited = set()
+
+    for root in functions:
+        if root in visited:
+            continue
+
+        visited.add(root)
+        stack = [(root, callees(root))]
+
+        while stack:
+            func, remaining = stack[-1]
+
+            for callee in remaining:
+                if callee in defined and callee not in visited:
+                    visited.add(callee)
+                    stack.append((callee, callees(callee)))
+                    break
+
+            else:
+                stack.pop()
+                ret.append(func)
+
+    return ret
+
+
+def infer_attributes(functions: Iterable[ir.Function]):
+    """Marks the defined functions 'readnone' or 'readonly' when they leave
+    memory other than their locals untouched or only read it, and
+    'nounwind' when everything they call is
+
+    Every function starts out assumed to do neither, and is summarized
+    again, callees first, until no summary changes: one pass unless there
+    is recursion. Functions defined elsewhere are taken at their
+    attributes' word.
+    """
+
+    order = bottom_up([f for f in functions if f.blocks])
+    summaries: Dict[ir.Function, Summary] = {f: (NONE, True) for f in order}
+
+    changed = True
+    while changed:
+        changed = False
+
+        for func in order:
+            summary = summarize(func, summaries)
+
+            if summary != summaries[func]:
+                summaries[func] = summary
+                changed = True
+
+    for func, (effect, nounwind) in summaries.items():
+        if effect in EFFECT_ATTRIBUTES:
+            func.attributes.add(EFFECT_ATTRIBUTES[effect])
+
+        if nounwind:
+            func.attributes.add('nounwind')
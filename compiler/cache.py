@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from functools import lru_cache
+from typing import Callable, Optional, Tuple
+
+import llvmlite.binding as llvm
+
+from . import __version__
+
+
+@lru_cache(maxsize=None)
+def compiler_digest() -> str:
+    """Returns a hash of the compiler's own sources and LLVM's version, so
+    entries written by any other build of either are never loaded"""
+
+    digest = hashlib.sha256(str(llvm.llvm_version_info).encode("utf-8"))
+    root = os.path.dirname(os.path.abspath(__file__))
+
+    for path, dirs, files in os.walk(root):
+        dirs.sort()
+
+        for name in sorted(files):
+            if name.endswith(".py"):
+                digest.update(os.path.relpath(
+                    os.path.join(path, name), root).encode("utf-8"))
+
+                with open(os.path.join(path, name), "rb") as f:
+                    digest.update(f.read())
+
+    return digest.hexdigest()
+
+
+class CompilationCache:
+    """Content-addressed store of optimized bitcode and object code"""
+
+    def __init__(self, path: str = ".wappa_cache"):
+        self.path = path
+
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, source: bytes, *config) -> str:
+        """Returns the cache key for a source compiled with a configuration,
+        e.g. the optimization level and code generation options"""
+
+        digest = hashlib.sha256()
+
+        for part in (__version__, compiler_digest(),
+                     llvm.get_default_triple(), *config):
+            digest.update(str(part).encode("utf-8"))
+            digest.update(b"\0")
+
+        digest.update(source)
+
+        return digest.hexdigest()
+
+    def load(self, key: str) -> Optional[llvm.ModuleRef]:
+        """Returns the cached, already optimized module, if any"""
+
+        data = self.__read(key + ".bc")
+
+        if data is None:
+            return None
+
+        return llvm.parse_bitcode(data)
+
+    def store(self, key: str, llvm_module: llvm.ModuleRef):
+        self.__write(key + ".bc", llvm_module.as_bitcode())
+
+    def load_declarations(self, key: str) -> Optional[str]:
+        """Returns the cached C declarations of the module's functions"""
+
+        data = self.__read(key + ".h")
+
+        if data is None:
+            return None
+
+        return data.decode("utf-8")
+
+    def store_declarations(self, key: str, declarations: str):
+        self.__write(key + ".h", declarations.encode("utf-8"))
+
+    def object_cache(self, key: str) -> Tuple[
+            Callable[[llvm.ModuleRef, bytes], None],
+            Callable[[llvm.ModuleRef], Optional[bytes]]]:
+        """Returns the (notify, getbuffer) pair for 'set_object_cache'"""
+
+        def notify(llvm_module: llvm.ModuleRef, buffer: bytes):
+            self.__write(key + ".o", buffer)
+
+        def getbuffer(llvm_module: llvm.ModuleRef) -> Optional[bytes]:
+            return self.__read(key + ".o")
+
+        return notify, getbuffer
+
+    def __read(self, name: str) -> Optional[bytes]:
+        try:
+            with open(os.path.join(self.path, name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def __write(self, name: str, data: bytes):
+        path = os.path.join(self.path, name)
+
+        # Written aside and renamed, so concurrent readers never see a
+        # partially written entry
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp, "wb") as f:
+            f.write(data)
+
+        os.replace(tmp, path)
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import re
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple
+
+from .structs.Class import Class
+from .structs.Function import Function
+from .type_system import (BoolType, ByteType, DoubleType, FloatType, IntType,
+                          LongType, ShortType, UnitType)
+
+if TYPE_CHECKING:
+    from .structs.Scope import Scope
+    from .structs.Type import WappaType
+
+C_TYPES = {
+    BoolType: "bool",
+    ByteType: "int8_t",
+    ShortType: "int16_t",
+    IntType: "int32_t",
+    LongType: "int64_t",
+    FloatType: "float",
+    DoubleType: "double",
+    UnitType: "void"
+}
+
+BUILTIN_TYPES = {wtype.ID: wtype for wtype in C_TYPES}
+
+# A public function as other files declare it: its name, modifiers, and
+# the names of its parameters and their types, and of its return type,
+# all of which can be pickled for another process
+Signature = Tuple[str, Tuple[bool, bool, Optional[str], Optional[str]],
+                  Tuple[Tuple[str, str], ...], str]
+
+
+def c_type(wtype: WappaType) -> str:
+    if isinstance(wtype, Class):
+        return "struct {} *".format(wtype.ID)
+
+    try:
+        return C_TYPES[wtype]
+    except KeyError:
+        raise TypeError(
+            "'{}' has no C equivalent".format(wtype.ID)) from None
+
+
+def c_declaration(function: Function) -> str:
+    parameters = ", ".join(
+        "{} {}".format(c_type(wtype), ID) for ID, wtype in function.parameters)
+
+    return "{} {}({});".format(
+        c_type(function.ret_type or UnitType), function.ID,
+        parameters or "void")
+
+
+def c_declarations(scope: Scope) -> str:
+    """Returns the C declarations of every public function in a global
+    scope"""
+
+    lines: List[str] = []
+
+    for symbol in scope.symbols(values=True):
+        if isinstance(symbol, Class):
+            lines.append("struct {};".format(symbol.ID))
+
+            lines.extend(c_declaration(m) for m in symbol.scope.symbols(
+                values=True) if isinstance(m, Function) and m.public)
+
+        elif isinstance(symbol, Function) and symbol.public:
+            lines.append(c_declaration(symbol))
+
+    return "\n".join(lines)
+
+
+def c_header(name: str, declarations: Iterable[str]) -> str:
+    guard = re.sub(r"\W", "_", name).upper() + "_H"
+
+    return "\n".join([
+        "#ifndef {}".format(guard),
+        "#define {}".format(guard),
+        "",
+        "#include <stdbool.h>",
+        "#include <stdint.h>",
+        "",
+        "#ifdef __cplusplus",
+        'extern "C" {',
+        "#endif",
+        "",
+        *filter(None, declarations),
+        "",
+        "#ifdef __cplusplus",
+        "}",
+        "#endif",
+        "",
+        "#endif",
+        ""
+    ])
+
+
+def signatures(scope: Scope) -> List[Signature]:
+    """Returns the signatures of the public functions in a global scope
+    that only take and return builtin types, which other files can declare
+    and call once their modules are linked"""
+
+    ret: List[Signature] = []
+
+    for symbol in scope.symbols(values=True):
+        if not (isinstance(symbol, Function) and symbol.public):
+            continue
+
+        wtypes = [wtype for _, wtype in symbol.parameters]
+        ret_type = symbol.ret_type or UnitType
+
+        if all(wtype in C_TYPES for wtype in [*wtypes, ret_type]):
+            ret.append((symbol.ID, symbol.modifiers, tuple(
+                (ID, wtype.ID) for ID, wtype in symbol.parameters),
+                ret_type.ID))
+
+    return ret
+
+
+def external_functions(signatures: Iterable[Signature]) -> List[Function]:
+    """Returns the functions the signatures declare, without bodies"""
+
+    return [Function(ID, modifiers, [(p, BUILTIN_TYPES[wtype])
+                                     for p, wtype in parameters],
+                     BUILTIN_TYPES[ret_type], None)
+            for ID, modifiers, parameters, ret_type in signatures]
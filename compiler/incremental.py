@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import hashlib
+from typing import TYPE_CHECKING, Dict, List, Set
+
+import llvmlite.binding as llvm
+import llvmlite.ir as ir
+
+from .attributes import infer_attributes
+from .optimizer import (Pipeline, function_modifiers, optimize,
+                        to_llvm)
+from .options import CompileOptions
+from .structs.Class import Class
+from .structs.Symbols import SymbolTable
+from .structs.Type import TypeIndex
+from .type_system import BUILTIN_INDEX
+from .util import print_exceptions
+from .visitor import WappaVisitor
+
+if TYPE_CHECKING:
+    from gen.Wappa import Wappa
+
+    from .structs.Scope import Symbol
+
+
+class Unit:
+    """A top-level declaration and its separately optimized IR fragment"""
+
+    def __init__(self, ID: str, fingerprint: str, symbol: Symbol,
+                 references: Set[str], bitcode: bytes, slots: List[int]):
+        self.ID = ID
+        self.fingerprint = fingerprint
+        self.symbol = symbol
+        self.references = references
+        self.bitcode = bitcode
+
+        # The 'TypeIndex' bits of the types created compiling it
+        self.slots = slots
+
+
+class IncrementalCompiler:
+    """Recompiles only the declarations that changed, or whose
+    dependencies did, since the previous call to 'compile'"""
+
+    def __init__(self, pipeline: Pipeline = None,
+                 options: CompileOptions = None):
+        self.pipeline = pipeline or Pipeline()
+        self.options = options or CompileOptions(internalize=False)
+        self.units: Dict[str, Unit] = {}
+
+        # Classes are reused across updates, so every update numbers its
+        # types in the same index, in the bits of the declarations it
+        # rebuilds or drops, or after those it may reuse
+        self.tindex = TypeIndex(BUILTIN_INDEX)
+
+        # IDs re-emitted by the last call to 'update'
+        self.rebuilt: List[str] = []
+
+    def compile(self, tree: Wappa.CompilationUnitContext) -> llvm.ModuleRef:
+        self.update(tree)
+
+        llvm_module = llvm.parse_assembly("")
+        for fragment in self.fragments():
+            llvm_module.link_in(fragment)
+
+        return llvm_module
+
+    def fragments(self) -> List[llvm.ModuleRef]:
+        """Returns a module per declaration, each optimized on its own"""
+
+        return [llvm.parse_bitcode(unit.bitcode)
+                for unit in self.units.values()]
+
+    def update(self, tree: Wappa.CompilationUnitContext):
+        visitor = WappaVisitor(self.options, self.tindex)
+        symbols = SymbolTable(options=self.options)
+
+        units: Dict[str, Unit] = {}
+        self.rebuilt = []
+
+        for ctx in tree.translationUnit().getChildren():
+            ID = str(ctx.IDENTIFIER())
+            fingerprint = self.__fingerprint(ctx)
+
+            unit = self.units.get(ID)
+            if (unit is not None and unit.fingerprint == fingerprint and
+                    all(r in units and r not in self.rebuilt
+                        for r in unit.references)):
+                self.__reuse(unit, visitor, symbols)
+
+            else:
+                # Nothing reused references it, nor its types
+                if unit is not None:
+                    self.tindex.release(unit.slots)
+
+                symbol = visitor.visitDeclaration(ctx)
+
+                fragment = ir.Module(name=ID, context=visitor.module.context)
+                symbol.compile(fragment, visitor.builder, symbols)
+                infer_attributes(fragment.functions)
+
+                llvm_module = to_llvm(fragment)
+                optimize(llvm_module, self.pipeline,
+                         function_modifiers([symbol]))
+
+                # Declarations can only reference those before them
+                references = {r for r in symbol.scope.references
+                              if r in units}
+
+                unit = Unit(ID, fingerprint, symbol, references,
+                            llvm_module.as_bitcode(), self.tindex.claimed())
+                self.rebuilt.append(ID)
+
+            units[ID] = unit
+
+        # Nor those of the declarations that were removed
+        for ID, unit in self.units.items():
+            if ID not in units:
+                self.tindex.release(unit.slots)
+
+        self.units = units
+
+        print_exceptions()
+
+    def __reuse(self, unit: Unit, visitor: WappaVisitor,
+                symbols: SymbolTable):
+        symbol = unit.symbol
+
+        if isinstance(symbol, Class):
+            # Rebuild the struct in this compilation's context, for the
+            # fragments that are re-emitted against it
+            symbol.scope.module = visitor.module
+            symbol.ir_type = None
+
+            symbols.add_symbol(symbol.ID, symbol.ir_type, symbol.field_names)
+
+        visitor.global_scope.add_symbol(None, unit.ID, symbol)
+
+    def __fingerprint(self, ctx) -> str:
+        text = ctx.start.getInputStream().getText(
+            ctx.start.start, ctx.stop.stop)
+
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
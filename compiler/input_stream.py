@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import mmap
+import os
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Iterator, List
+
+from antlr4 import InputStream, Token
+
+# Bytes per chunk, before extending it to the end of its line
+CHUNK_SIZE = 1 << 20
+
+
+class MmapInputStream(InputStream):
+    """An input stream over a memory-mapped UTF-8 file, decoded a chunk at a
+    time instead of as a whole
+
+    ANTLR's streams hold the file's text and a list of its code points,
+    together many times the file's size. Here only an index of where each
+    chunk starts is kept, and the few chunks around the lexer's position
+    are decoded. Chunks always end after a newline, so they also never
+    split a token other than whitespace or a comment, see 'chunks'.
+    """
+
+    def __init__(self, path: str, chunk_size: int = CHUNK_SIZE):
+        self.name = path
+        self.chunk_size = chunk_size
+
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size:
+                self.buffer = mmap.mmap(
+                    f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                # Empty files cannot be mapped
+                self.buffer = b""
+
+        # Byte offset and code point index where each chunk starts, with
+        # those of the end of the file last
+        self.offsets: List[int] = [0]
+        self.starts: List[int] = [0]
+        self.__index()
+
+        self._index = 0
+        self._size = self.starts[-1]
+
+        self.decode = lru_cache(maxsize=4)(self.__decode)
+
+        # The chunk LA reads from, and the code points it spans
+        self.__text = ""
+        self.__start = self.__stop = 0
+
+    def __enter__(self) -> MmapInputStream:
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+    def chunks(self) -> Iterator[str]:
+        """Yields the decoded text of every chunk, in order"""
+
+        for i in range(len(self.offsets) - 1):
+            yield self.__decode(i)
+
+    def LA(self, offset: int) -> int:
+        if offset == 0:
+            return 0  # undefined
+
+        if offset < 0:
+            offset += 1
+
+        pos = self._index + offset - 1
+        if pos < 0 or pos >= self._size:
+            return Token.EOF
+
+        if not self.__start <= pos < self.__stop:
+            i = bisect_right(self.starts, pos) - 1
+
+            self.__text = self.decode(i)
+            self.__start = self.starts[i]
+            self.__stop = self.starts[i + 1]
+
+        return ord(self.__text[pos - self.__start])
+
+    def getText(self, start: int, stop: int) -> str:
+        stop = min(stop, self._size - 1)
+
+        pieces = []
+        while start <= stop:
+            i = bisect_right(self.starts, start) - 1
+            base = self.starts[i]
+
+            pieces.append(self.decode(i)[start - base:stop + 1 - base])
+            start = self.starts[i + 1]
+
+        return "".join(pieces)
+
+    def __str__(self) -> str:
+        return self.getText(0, self._size - 1)
+
+    def __index(self):
+        buffer = self.buffer
+        size = len(buffer)
+
+        pos = 0
+        while pos < size:
+            end = min(pos + self.chunk_size, size)
+
+            newline = buffer.find(b"\n", end - 1)
+            end = size if newline < 0 else newline + 1
+
+            self.offsets.append(end)
+            self.starts.append(
+                self.starts[-1] + len(buffer[pos:end].decode("utf-8")))
+
+            pos = end
+
+    def __decode(self, i: int) -> str:
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].decode(
+            "utf-8")
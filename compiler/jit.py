@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from typing import Iterable
+
+import llvmlite.binding as llvm
+
+
+def create_lazy_jit(tm: llvm.TargetMachine,
+                    fragments: Iterable[llvm.ModuleRef]
+                    ) -> llvm.ExecutionEngine:
+    """Returns an engine that generates machine code for a fragment only
+    when one of its functions is first looked up
+
+    Each fragment is added as a module of its own and the engine is never
+    finalized as a whole: MCJIT compiles a module on the first
+    'get_function_address' that needs it, and the modules defining its
+    callees as their symbols are resolved.
+    """
+
+    ee = llvm.create_mcjit_compiler(llvm.parse_assembly(""), tm)
+
+    for fragment in fragments:
+        ee.add_module(fragment)
+
+    return ee
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import re
+from sys import intern
+from typing import TYPE_CHECKING, Iterator, List, Union
+
+from .util import WappaException
+
+if TYPE_CHECKING:
+    from .input_stream import MmapInputStream
+
+# Token types are the symbolic names of gen/WappaLexer.g4's rules
+KEYWORDS = {
+    'abstract': 'ABSTRACT', 'alignof': 'ALIGNOF', 'as': 'AS',
+    'boolean': 'BOOLEAN', 'by': 'BY', 'class': 'CLASS', 'const': 'CONST',
+    'copy': 'COPY', 'do': 'DO', 'else': 'ELSE', 'elsif': 'ELSIF',
+    'end': 'END', 'enum': 'ENUM', 'extends': 'EXTENDS', 'final': 'FINAL',
+    'fits': 'FITS', 'for': 'FOR', 'fun': 'FUN', 'if': 'IF', 'is': 'IS',
+    'implements': 'IMPLEMENTS', 'import': 'IMPORT',
+    'interface': 'INTERFACE', 'internal': 'INTERNAL', 'let': 'LET',
+    'object': 'OBJECT', 'open': 'OPEN', 'override': 'OVERRIDE',
+    'package': 'PACKAGE', 'partial': 'PARTIAL', 'private': 'PRIVATE',
+    'protected': 'PROTECTED', 'prototype': 'PROTOTYPE', 'public': 'PUBLIC',
+    'return': 'RETURN', 'self': 'SELF', 'singleton': 'SINGLETON',
+    'sizeof': 'SIZEOF', 'super': 'SUPER', 'trait': 'TRAIT',
+    'typeof': 'TYPEOF', 'unless': 'UNLESS', 'until': 'UNTIL', 'val': 'VAL',
+    'var': 'VAR', 'virtual': 'VIRTUAL', 'where': 'WHERE', 'while': 'WHILE',
+    'True': 'BOOL_LITERAL', 'False': 'BOOL_LITERAL', 'Nil': 'NIL',
+    'Unit': 'UNIT'
+}
+
+OPERATORS = {
+    '(': 'LPAREN', ')': 'RPAREN', '{': 'LBRACE', '}': 'RBRACE',
+    '[': 'LBRACK', ']': 'RBRACK', ';': 'SEMI', ',': 'COMMA', '.': 'DOT',
+    '->': 'DASH_ARROW', '=>': 'EQ_ARROW', '<|': 'LPIPE', '|>': 'RPIPE',
+    '=': 'ASSIGN', '>': 'GT', '<': 'LT', '<<': 'LSHIFT', '>>': 'RSHIFT',
+    '>>>': 'URSHIFT', '!': 'BANG', '~': 'TILDE', '?': 'QUESTION',
+    '::': 'SCOPE', ':': 'COLON', ':>': 'GT_COLON', '<:': 'LT_COLON',
+    '==': 'EQUAL', '===': 'PHYS_EQ', '~=': 'APPROX_EQ', '<=': 'LE',
+    '>=': 'GE', '!=': 'NOTEQUAL', '!==': 'PHYS_NEQ', '&&': 'AND',
+    '||': 'OR', '++': 'INC', '--': 'DEC', '**': 'POW', '+': 'ADD',
+    '-': 'SUB', '*': 'MUL', '/': 'DIV', '//': 'INT_DIV', '&': 'BITAND',
+    '|': 'BITOR', '^': 'CARET', '%': 'REM', '%%': 'MOD',
+    '+=': 'ADD_ASSIGN', '-=': 'SUB_ASSIGN', '**=': 'POW_ASSIGN',
+    '*=': 'MUL_ASSIGN', '/=': 'DIV_ASSIGN', '//=': 'INT_DIV_ASSIGN',
+    '&=': 'AND_ASSIGN', '|=': 'OR_ASSIGN', '^=': 'XOR_ASSIGN',
+    '%=': 'MOD_ASSIGN', '<<=': 'LSHIFT_ASSIGN', '>>=': 'RSHIFT_ASSIGN',
+    '>>>=': 'URSHIFT_ASSIGN'
+}
+
+_DIGITS = r'[0-9](?:[0-9_]*[0-9])?'
+_HEX_DIGITS = r'[0-9a-fA-F](?:[0-9a-fA-F_]*[0-9a-fA-F])?'
+_EXPONENT = r'[eE][+-]?' + _DIGITS
+
+# In rule order, which breaks ties between matches of the same length
+_NUMBERS = [(name, re.compile(pattern)) for name, pattern in [
+    ('DECIMAL_LITERAL', r'(?:0|[1-9](?:_+' + _DIGITS + '|(?:' + _DIGITS +
+     r')?))[lL]?'),
+    ('HEX_LITERAL', r'0[xX][0-9a-fA-F](?:[0-9a-fA-F_]*[0-9a-fA-F])?[lL]?'),
+    ('OCT_LITERAL', r'0_*[0-7](?:[0-7_]*[0-7])?[lL]?'),
+    ('BINARY_LITERAL', r'0[bB][01](?:[01_]*[01])?[lL]?'),
+    ('FLOAT_LITERAL', r'(?:' + _DIGITS + r'\.(?:' + _DIGITS + r')?|\.' +
+     _DIGITS + r')(?:' + _EXPONENT + r')?[fFdD]?|' + _DIGITS + r'(?:' +
+     _EXPONENT + r'[fFdD]?|[fFdD])'),
+    ('HEX_FLOAT_LITERAL', r'0[xX](?:' + _HEX_DIGITS + r'\.?|(?:' +
+     _HEX_DIGITS + r')?\.' + _HEX_DIGITS + r')[pP][+-]?' + _DIGITS +
+     r'[fFdD]?')
+]]
+
+_STRING_INNER = (r'''(?:[^"\\\r\n]|\\(?:[btnfr"'\\]|[0-3]?[0-7]?[0-7]|'''
+                 r'''u+[0-9a-fA-F]{4}))*''')
+
+_TOKEN = re.compile('|'.join([
+    r'(?P<WS>[ \r\n\t\f]+)',
+    r'(?P<COMMENT>/\*[\s\S]*?\*/)',
+    # Not closed before the end of the text lexed so far
+    r'(?P<OPEN_COMMENT>/\*)',
+    r'(?P<NUMBER>\.?[0-9])',
+    r'(?P<IDENTIFIER>[a-zA-Z_$][a-zA-Z_$0-9]*)',
+    r"(?P<STRING_LITERAL>'" + _STRING_INNER + "')",
+    r'(?P<INTERP_STRING_LITERAL>"' + _STRING_INNER + '")',
+    # Longest first, so every operator matches as much as it can
+    '(?P<OPERATOR>' + '|'.join(
+        re.escape(op) for op in sorted(OPERATORS, key=len, reverse=True)) +
+    ')'
+]))
+
+
+class Token:
+    """A token, with the fields of ANTLR's tokens the compiler reads"""
+
+    __slots__ = ('type', 'text', 'line', 'column', 'start', 'stop')
+
+    def __init__(self, type: str, text: str, line: int, column: int,
+                 start: int):
+        self.type = type
+        self.text = text
+        self.line = line
+        self.column = column
+        self.start = start
+        self.stop = start + len(text) - 1
+
+    def __repr__(self):
+        return "Token({}, {!r}, {}:{})".format(
+            self.type, self.text, self.line, self.column)
+
+
+def tokenize(source: Union[str, MmapInputStream]) -> List[Token]:
+    """Splits a source into the same tokens as WappaLexer, ending with an
+    'EOF' token"""
+
+    return list(iter_tokens(source))
+
+
+def iter_tokens(source: Union[str, MmapInputStream]) -> Iterator[Token]:
+    """Lexes the tokens of 'tokenize' one at a time, as they are needed
+
+    A stream is lexed a chunk at a time. Since its chunks end at line
+    boundaries, only comments need more than the current one.
+    """
+
+    chunks = iter([source] if isinstance(source, str) else source.chunks())
+
+    match = _TOKEN.match
+    line = 1
+    line_start = 0
+
+    # 'text' holds the source from offset 'base' on, up to the end of the
+    # last chunk read
+    text = ""
+    base = 0
+    pos = 0
+
+    while True:
+        m = match(text, pos)
+
+        if pos == len(text) or m is not None and (
+                m.lastgroup == 'OPEN_COMMENT'):
+            chunk = next(chunks, None)
+
+            if chunk is not None:
+                base += pos
+                text = text[pos:] + chunk
+                pos = 0
+                continue
+
+            if m is None:
+                break
+
+        if m is None:
+            # Skipped, like ANTLR's token recognition errors
+            WappaException("ERROR", "Unexpected character {!r}".format(
+                text[pos]), Token('ERROR', text[pos], line,
+                                  base + pos - line_start, base + pos))
+            pos += 1
+            continue
+
+        kind = m.lastgroup
+        value = m.group()
+
+        if kind == 'NUMBER':
+            # Longest of the literal rules, the first of them on a tie
+            value = ''
+            for name, pattern in _NUMBERS:
+                n = pattern.match(text, pos)
+                if n is not None and n.end() - pos > len(value):
+                    kind, value = name, n.group()
+
+        elif kind == 'IDENTIFIER':
+            kind = KEYWORDS.get(value, kind)
+            # Shared by every occurrence, in the AST and symbol tables
+            value = intern(value)
+
+        elif kind == 'OPEN_COMMENT':
+            # Never closed, so lexed as '/' and '*' like WappaLexer does
+            kind, value = 'DIV', '/'
+
+        elif kind == 'OPERATOR':
+            kind = OPERATORS[value]
+
+        if kind not in ('WS', 'COMMENT'):
+            yield Token(kind, value, line, base + pos - line_start,
+                        base + pos)
+
+        newlines = value.count('\n')
+        if newlines:
+            line += newlines
+            line_start = base + pos + value.rindex('\n') + 1
+
+        pos += len(value)
+
+    yield Token('EOF', '<EOF>', line, base + pos - line_start, base + pos)
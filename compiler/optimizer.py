@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import sys
+from typing import (TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional,
+                    Tuple)
+
+import llvmlite.binding as llvm
+import llvmlite.ir as ir
+
+from .structs.Class import Class
+from .structs.Function import Function
+
+if TYPE_CHECKING:
+    from .structs.Scope import Symbol
+
+
+class Preset(NamedTuple):
+    opt_level: int
+    size_level: int
+
+    # None leaves out the inliner
+    inlining_threshold: Optional[int]
+
+    # The passes of 'PASSES' it runs
+    passes: Tuple[str, ...]
+
+
+# Thresholds are clang's for the same levels
+PRESETS = {
+    "O0": Preset(0, 0, None, ()),
+    "O1": Preset(1, 0, None, ("unroll",)),
+    "O2": Preset(2, 0, 225, ("inline", "unroll", "loop-vectorize",
+                             "slp-vectorize")),
+    "O3": Preset(3, 0, 275, ("inline", "unroll", "loop-vectorize",
+                             "slp-vectorize")),
+    "Os": Preset(2, 1, 75, ("inline", "unroll", "loop-vectorize",
+                            "slp-vectorize")),
+    "Oz": Preset(2, 2, 25, ("inline", "loop-vectorize")),
+}
+
+PASSES = ["inline", "unroll", "loop-vectorize", "slp-vectorize"]
+
+# Attributes making the module's passes skip or shrink a function, which
+# 'CompileOptions.attributes' gives the IR of the overridden ones
+PRESET_ATTRIBUTES = {
+    "O0": ("noinline", "optnone"),
+    "Os": ("optsize",),
+    "Oz": ("minsize", "optsize"),
+}
+
+# Name suffixes of the IR a tiered function is split into
+TIER_SUFFIXES = ('.body', '.tier2')
+
+
+class Pipeline:
+    """The passes 'optimize' runs: a preset, with passes switched on or off
+    and other presets for functions with some modifiers"""
+
+    def __init__(self, preset: str = "O3", enabled: Iterable[str] = (),
+                 disabled: Iterable[str] = (),
+                 inlining_threshold: Optional[int] = None,
+                 overrides: Optional[Dict[str, str]] = None,
+                 time_passes: bool = False, cpu: str = "",
+                 features: str = ""):
+        self.preset = preset
+        self.enabled = tuple(enabled)
+        self.disabled = tuple(disabled)
+        self.inlining_threshold = inlining_threshold
+
+        # Modifier, e.g. 'private' or 'const', to the preset of the functions
+        # declared with it, the first one matching winning
+        self.overrides = dict(overrides or {})
+
+        # A function pass manager only runs a preset's early passes, and the
+        # module's passes, e.g. the inliner and the vectorizers, run the
+        # pipeline's own preset over every function. Only the attributes of
+        # an O0, Os or Oz override make them skip or shrink a function, and
+        # only when there are module passes to shrink
+        for modifier, override in self.overrides.items():
+            if override == preset or override == "O0":
+                continue
+
+            if (override not in PRESET_ATTRIBUTES or
+                    PRESETS[preset].opt_level == 0):
+                raise ValueError(
+                    "'{}' functions can't be optimized at {} under {}, only "
+                    "at O0, or at Os or Oz under an optimizing preset".format(
+                        modifier, override, preset))
+
+        # Print LLVM's pass timings to stderr after every run
+        self.time_passes = time_passes
+
+        # The CPU tuned for and its features, e.g. '+avx2', as from
+        # 'host_cpu', the generic baseline when empty
+        self.cpu = cpu
+        self.features = features
+
+    def preset_for(self, modifiers: Iterable[str]) -> str:
+        """Returns the preset of a function with some modifiers"""
+
+        for modifier in modifiers:
+            if modifier in self.overrides:
+                return self.overrides[modifier]
+
+        return self.preset
+
+    def attributes(self) -> Dict[str, Tuple[str, ...]]:
+        """Returns the function attributes of each overridden modifier"""
+
+        return {modifier: PRESET_ATTRIBUTES.get(preset, ())
+                for modifier, preset in self.overrides.items()}
+
+    def target_machine(self, **kwargs) -> llvm.TargetMachine:
+        """Returns a machine for the default triple and the pipeline's CPU,
+        with 'create_target_machine's other arguments"""
+
+        return llvm.Target.from_default_triple().create_target_machine(
+            self.cpu, self.features, **kwargs)
+
+    def passes(self, preset: str) -> Tuple[str, ...]:
+        return tuple(p for p in PASSES if p not in self.disabled and (
+            p in PRESETS[preset].passes or p in self.enabled))
+
+    def builder(self, preset: str) -> llvm.PassManagerBuilder:
+        config = PRESETS[preset]
+        passes = self.passes(preset)
+
+        builder = llvm.create_pass_manager_builder()
+        builder.opt_level = config.opt_level
+        builder.size_level = config.size_level
+
+        builder.disable_unroll_loops = "unroll" not in passes
+        builder.loop_vectorize = "loop-vectorize" in passes
+        builder.slp_vectorize = "slp-vectorize" in passes
+
+        if "inline" in passes:
+            threshold = self.inlining_threshold
+            if threshold is None:
+                threshold = config.inlining_threshold or PRESETS[
+                    "O2"].inlining_threshold
+
+            builder.inlining_threshold = threshold
+
+        return builder
+
+    def __repr__(self):
+        return "Pipeline({})".format(", ".join(
+            "{}={!r}".format(k, v) for k, v in sorted(vars(self).items())
+            if k != "time_passes"))
+
+
+def host_cpu() -> Tuple[str, str]:
+    """Returns the name and features of the CPU running the compiler"""
+
+    return llvm.get_host_cpu_name(), llvm.get_host_cpu_features().flatten()
+
+
+def function_modifiers(symbols: Iterable[Symbol]
+                       ) -> Dict[str, Tuple[str, ...]]:
+    """Returns the modifiers of the functions, and methods, among symbols,
+    by their name in the IR"""
+
+    ret: Dict[str, Tuple[str, ...]] = {}
+
+    for symbol in symbols:
+        if isinstance(symbol, Class):
+            ret.update(function_modifiers(symbol.scope.symbols(values=True)))
+
+        elif isinstance(symbol, Function):
+            ret[symbol.ID] = symbol.modifier_names()
+
+    return ret
+
+
+def to_llvm(module: ir.Module) -> llvm.ModuleRef:
+    """Hands a module built with llvmlite.ir over to LLVM
+
+    llvmlite.ir has no other way into LLVM than its IR's text, so this is
+    the only place it is serialized, in memory, and parsed once.
+    """
+
+    return llvm.parse_assembly(str(module))
+
+
+def optimize(llvm_module: llvm.ModuleRef, pipeline: Pipeline,
+             modifiers: Optional[Dict[str, Tuple[str, ...]]] = None):
+    """Runs each function's preset on it, then the pipeline's own on the
+    whole module
+
+    The module's passes see every function again, but skip or shrink those
+    given the attributes of an O0, Os or Oz override when compiled, the only
+    overrides 'Pipeline' accepts.
+    """
+
+    modifiers = modifiers or {}
+
+    # Lets the passes, e.g. the vectorizers, query the CPU's costs
+    tm = pipeline.target_machine()
+    llvm_module.triple = tm.triple
+    llvm_module.data_layout = str(tm.target_data)
+
+    if pipeline.time_passes:
+        llvm.set_time_passes(True)
+
+    functions: Dict[str, List[llvm.ValueRef]] = {}
+
+    for f in llvm_module.functions:
+        if f.is_declaration:
+            continue
+
+        name = f.name
+        for suffix in TIER_SUFFIXES:
+            if name.endswith(suffix):
+                name = name[:-len(suffix)]
+
+        preset = pipeline.preset_for(modifiers.get(name, ()))
+        functions.setdefault(preset, []).append(f)
+
+    for preset, group in functions.items():
+        fpm = llvm.create_function_pass_manager(llvm_module)
+        tm.add_analysis_passes(fpm)
+
+        # Locals are emitted as allocas, promoted to registers even at -O0
+        fpm.add_sroa_pass()
+
+        if PRESETS[preset].opt_level > 0:
+            pipeline.builder(preset).populate(fpm)
+
+        fpm.initialize()
+        for f in group:
+            fpm.run(f)
+        fpm.finalize()
+
+    if PRESETS[pipeline.preset].opt_level > 0:
+        mpm = llvm.create_module_pass_manager()
+        tm.add_analysis_passes(mpm)
+        pipeline.builder(pipeline.preset).populate(mpm)
+
+        mpm.run(llvm_module)
+
+    if pipeline.time_passes:
+        print(llvm.report_and_reset_timings(), file=sys.stderr)
+        llvm.set_time_passes(False)
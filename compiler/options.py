@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, Tuple
+
+FAST_MATH_FLAGS = ['fast', 'nnan', 'ninf', 'nsz', 'arcp', 'contract', 'afn',
+                   'reassoc']
+
+
+class CompileOptions:
+    """Code generation settings, reachable from every 'compile' through
+    'SymbolTable.options'"""
+
+    def __init__(self, tiered: bool = False, vectorize_loops: bool = False,
+                 unroll_loops: bool = False, fold_constants: bool = True,
+                 attributes: Dict[str, Tuple[str, ...]] = None,
+                 fast_math: Tuple[str, ...] = (),
+                 fast_math_functions: Dict[str, Tuple[str, ...]] = None,
+                 internalize: bool = True):
+        # Route calls through a per-function table and count them, so hot
+        # functions can be swapped for recompiled versions at runtime
+        self.tiered = tiered
+
+        # 'llvm.loop' hints attached to every loop's backedge, which force
+        # their pass on it over LLVM's cost model, and even when the
+        # pipeline leaves the pass out
+        self.vectorize_loops = vectorize_loops
+        self.unroll_loops = unroll_loops
+
+        # Evaluate constant expressions and drop dead 'if' branches on the
+        # AST, before any IR is emitted
+        self.fold_constants = fold_constants
+
+        # Function attributes by modifier, e.g. 'optnone' for 'private' ones
+        # optimized at -O0, which LLVM's module-wide passes respect
+        self.attributes = dict(attributes or {})
+
+        # Flags of the floating-point operations of every function, and of
+        # some by their name in the IR instead, e.g. ('fast',) to let them
+        # be reassociated into vectorized reductions
+        self.fast_math = tuple(fast_math)
+        self.fast_math_functions = dict(fast_math_functions or {})
+
+        # Give functions that aren't public internal linkage, which only
+        # works when the whole file is compiled into one module, unlike
+        # incremental fragments and tiered functions
+        self.internalize = internalize
+
+    def attributes_for(self, modifiers: Iterable[str]) -> Tuple[str, ...]:
+        """Returns the attributes of a function, those of the first of its
+        modifiers that has some"""
+
+        for modifier in modifiers:
+            if modifier in self.attributes:
+                return self.attributes[modifier]
+
+        return ()
+
+    def fast_math_for(self, ID: str) -> Tuple[str, ...]:
+        return self.fast_math_functions.get(ID, self.fast_math)
+
+    def __repr__(self):
+        return "CompileOptions({})".format(", ".join(
+            "{}={!r}".format(k, v) for k, v in sorted(vars(self).items())))
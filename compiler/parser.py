@@ -0,0 +1,735 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Iterator, List, Optional, Tuple, Union
+
+from .lexer import Token, iter_tokens
+from .structs.Block import Block
+from .structs.Expression import Expression, Literal
+from .structs.Field import Field
+from .structs.Statement import (DoUntilStatement, DoWhileStatement,
+                                ExprStatement, ForStatement, IfStatement,
+                                ReturnStatement, Statement, UntilStatement,
+                                VariableDeclarationsStatement,
+                                VariableDeclarationStatement, WhileStatement)
+from .type_system import (BoolType, DoubleType, IntType, NilType, ObjectType,
+                          StringType, UnitType)
+from .util import WappaException
+
+if TYPE_CHECKING:
+    from .input_stream import MmapInputStream
+    from .structs.Scope import Symbol
+    from .structs.Type import WappaType
+    from .visitor import WappaVisitor
+
+# Binding power of the binary operators, following the order of the
+# 'expression' alternatives in gen/Wappa.g4, tightest first
+BINARY_OPS = {
+    '**': 16,
+    '*': 15, '/': 15, '//': 15, '%': 15, '%%': 15,
+    '+': 14, '-': 14,
+    '<<': 13, '>>': 13, '>>>': 13,
+    '<=': 11, '>=': 11, '>': 11, '<': 11,
+    '==': 9, '===': 9, '!=': 9, '!==': 9,
+    '&': 8,
+    '^': 7,
+    '|': 6,
+    '&&': 5,
+    '||': 4,
+    '|>': 2,
+    # Right associative
+    '=': 1, '+=': 1, '-=': 1, '**=': 1, '*=': 1, '//=': 1, '/=': 1, '&=': 1,
+    '|=': 1, '^=': 1, '<<=': 1, '>>=': 1, '>>>=': 1, '%=': 1
+}
+
+PREFIX_OPS = {
+    '+': 19, '-': 19, '++': 19, '--': 19,
+    '~': 18, '!': 18,
+    'alignof': 17, 'sizeof': 17, 'typeof': 17
+}
+
+AS = 21
+POSTFIX = 20
+CHAINED = 12
+IS = 10
+TERNARY = 3
+
+LITERAL_TYPES = {
+    'DECIMAL_LITERAL': IntType,
+    'HEX_LITERAL': IntType,
+    'OCT_LITERAL': IntType,
+    'BINARY_LITERAL': IntType,
+    'FLOAT_LITERAL': DoubleType,
+    'HEX_FLOAT_LITERAL': DoubleType,
+    'STRING_LITERAL': StringType,
+    'INTERP_STRING_LITERAL': StringType,
+    'BOOL_LITERAL': BoolType,
+    'NIL': NilType
+}
+
+VISIBILITY_MODIFIERS = ['private', 'protected', 'internal', 'public']
+INHERITANCE_MODIFIERS = ['abstract', 'final', 'open']
+
+
+class ParseError(Exception):
+    pass
+
+
+class TokenWindow:
+    """The tokens of a source, indexed by position but lexed only once the
+    parser reaches them, without keeping those 'release'd"""
+
+    def __init__(self, tokens: Iterator[Token]):
+        self.tokens = tokens
+        self.buffer: List[Token] = []
+        self.offset = 0
+
+    def __getitem__(self, pos: int) -> Token:
+        buffer = self.buffer
+        i = pos - self.offset
+
+        while i >= len(buffer):
+            # Past the end, every position holds the 'EOF' token
+            buffer.append(next(self.tokens, buffer[-1] if buffer else None))
+
+        return buffer[i]
+
+    def release(self, pos: int):
+        """Drops the tokens before 'pos', which is never read again"""
+
+        del self.buffer[:pos - self.offset]
+        self.offset = pos
+
+
+class Parser:
+    """Hand-written front end, building the same AST as running WappaVisitor
+    over ANTLR's parse tree, without building the tree
+
+    Declarations and statements are parsed by recursive descent, expressions
+    by precedence climbing. Symbols are declared and resolved through the
+    visitor, so both front ends share the semantic checks. The first syntax
+    error is reported and ends the parse.
+    """
+
+    def __init__(self, source: Union[str, MmapInputStream],
+                 visitor: WappaVisitor):
+        self.tokens = TokenWindow(iter_tokens(source))
+        self.pos = 0
+        self.visitor = visitor
+
+        # Whether function bodies are parsed, or only their signatures
+        self.bodies = True
+
+    def parse(self):
+        for _ in self.declarations():
+            pass
+
+    def declarations(self) -> Iterator[Symbol]:
+        """Parses and yields one top-level declaration at a time"""
+
+        try:
+            while self.__peek().type != 'EOF':
+                # Declarations never look back into the previous one
+                self.tokens.release(self.pos)
+
+                yield self.declaration()
+
+        except ParseError:
+            pass
+
+    def signatures(self):
+        """Declares every top-level class, with its fields and methods, and
+        every function, skipping over function bodies
+
+        Parsing the declarations afterwards defines the functions in place,
+        so any of them can refer to those further on.
+        """
+
+        self.bodies = False
+        self.parse()
+        self.bodies = True
+
+    def declaration(self) -> Symbol:
+        visitor = self.visitor
+
+        # Inherited by every scope opened while parsing the declaration
+        visitor.global_scope.references = set()
+
+        if self.__after_modifiers().text == 'class':
+            ID = self.class_declaration()
+        else:
+            ID = self.function_declaration()
+
+        visitor.global_scope.references = None
+
+        return visitor.global_scope.symbol_table[ID]
+
+    def class_declaration(self) -> str:
+        tok = self.__peek()
+        modifiers = (self.__modifier(VISIBILITY_MODIFIERS) or "",
+                     self.__modifier(INHERITANCE_MODIFIERS) or "")
+
+        self.__expect('class')
+        ID = self.__expect_type('IDENTIFIER').text
+
+        parent = ObjectType
+        if self.__accept('extends'):
+            parent = self.type_name()
+
+        # Interfaces ('fits') are not supported yet
+        if self.__accept('fits'):
+            while self.__peek().text not in ['where', ';', '<EOF>']:
+                self.pos += 1
+
+        self.visitor.open_class(tok, ID, parent, [], modifiers)
+
+        if not self.__accept(';'):
+            self.__expect('where')
+
+            while not self.__accept('end'):
+                if self.__after_modifiers().text in ['var', 'val']:
+                    self.field_declaration()
+                else:
+                    self.function_declaration(method=True)
+
+        self.visitor.close_class()
+
+        return ID
+
+    def field_declaration(self):
+        tok = self.__peek()
+        visibility = self.__modifier(VISIBILITY_MODIFIERS) or ""
+        access_type = self.__next().text
+        ID = self.__expect_type('IDENTIFIER').text
+
+        type_name = None
+        value = None
+
+        if self.__accept(':'):
+            type_name = self.type_name()
+
+            if self.__accept('='):
+                value = self.__field_value()
+
+        else:
+            self.__expect('=')
+            value = self.__field_value()
+
+        # Accessor blocks are not supported yet
+        if self.__accept('{'):
+            while not self.__accept('}'):
+                if self.__next().type == 'EOF':
+                    self.__error("'}'")
+
+        self.__expect(';')
+
+        self.visitor.scope[-1].add_symbol(tok, ID, Field(
+            tok, ID, type_name, access_type, (visibility,), value))
+
+    def function_declaration(self, method: bool = False) -> str:
+        visitor = self.visitor
+
+        tok = self.__peek()
+        override = self.__accept('override') is not None
+        immutable = self.__accept('const') is not None
+        modifiers = (immutable, override,
+                     self.__modifier(VISIBILITY_MODIFIERS) or "",
+                     self.__modifier(INHERITANCE_MODIFIERS) or "")
+
+        self.__expect('fun')
+        ID = self.__expect_type('IDENTIFIER').text
+        self.__expect('(')
+
+        parameters: List[Tuple[str, WappaType]] = []
+
+        if method:
+            self.__expect('self')
+            parameters.append(('self', visitor.scope[-1].owner))
+
+            if self.__accept(','):
+                parameters.extend(self.parameter_list())
+
+        elif self.__peek().text != ')':
+            parameters = self.parameter_list()
+
+        self.__expect(')')
+
+        ret_type = UnitType
+        if self.__accept('=>'):
+            if not self.__accept('Unit'):
+                ret_type = self.type_expression()
+
+        if not self.bodies:
+            self.__skip_body()
+            visitor.declare_function(tok, ID, modifiers, parameters, ret_type)
+
+            return ID
+
+        visitor.open_function(tok, parameters)
+
+        if self.__accept('='):
+            expr_tok = self.__peek()
+            block = visitor.expression_body(
+                expr_tok, self.expression(), ret_type)
+
+            self.__expect(';')
+
+        else:
+            block = self.block()
+
+        visitor.close_function(tok, ID, modifiers, parameters, ret_type,
+                               block)
+
+        return ID
+
+    def parameter_list(self) -> List[Tuple[str, WappaType]]:
+        parameters = []
+
+        while True:
+            ID = self.__expect_type('IDENTIFIER').text
+            self.__expect(':')
+            parameters.append((ID, self.type_expression()))
+
+            if not self.__accept(','):
+                return parameters
+
+    def type_expression(self) -> Optional[WappaType]:
+        ret = self.type_name()
+
+        # Intersection, union and product types are not supported yet
+        while self.__accept('&', '|', '*'):
+            self.type_name()
+            ret = None
+
+        return ret
+
+    def type_name(self) -> Optional[WappaType]:
+        tok = self.__expect_type('IDENTIFIER')
+        text = tok.text
+
+        if self.__peek().text == '<':
+            depth = 0
+
+            while True:
+                t = self.__next()
+                text += t.text
+
+                depth += {'<': 1, '>': -1}.get(t.text, 0)
+                if depth == 0 or t.type == 'EOF':
+                    break
+
+        if self.__accept('['):
+            self.__expect(']')
+            text += '[]'
+
+        return self.visitor.get_symbol(tok, text)
+
+    def block(self) -> Block:
+        self.__expect('where')
+
+        scope = self.visitor.scope[-1]
+        statements = []
+
+        while not self.__accept('end'):
+            statements.append(self.statement())
+
+        return Block(scope, statements)
+
+    def statement(self) -> Statement:
+        tok = self.__peek()
+        text = tok.text
+
+        if text == 'where':
+            return self.__scoped_block()
+
+        if text == 'if':
+            return self.if_statement()
+
+        if text == 'for':
+            return self.for_statement()
+
+        if text in ['while', 'until']:
+            self.__next()
+
+            self.__expect('(')
+            expr = self.expression()
+            self.__expect(')')
+
+            block = self.__scoped_block()
+
+            if text == 'while':
+                return WhileStatement(tok, expr, block)
+
+            return UntilStatement(tok, expr, block)
+
+        if text == 'do':
+            self.__next()
+
+            block = self.__scoped_block()
+            do_type = self.__expect('while', 'until').text
+
+            self.__expect('(')
+            expr = self.expression()
+            self.__expect(')')
+            self.__expect(';')
+
+            if do_type == 'while':
+                return DoWhileStatement(tok, block, expr)
+
+            return DoUntilStatement(tok, block, expr)
+
+        if text == 'return':
+            self.__next()
+
+            expr = None
+            if self.__peek().text != ';':
+                expr = self.expression()
+
+            self.__expect(';')
+
+            return ReturnStatement(tok, expr)
+
+        if text in ['var', 'val']:
+            ret = self.variable_declarations()
+            self.__expect(';')
+
+            return ret
+
+        if self.__accept(';'):
+            return Statement(tok)
+
+        expr = self.expression()
+        self.__expect(';')
+
+        return ExprStatement(tok, expr)
+
+    def if_statement(self) -> IfStatement:
+        tok = self.__expect('if')
+
+        if_expr = self.expression()
+        if_block = self.__scoped_block()
+
+        elsif_exprs: List[Expression] = []
+        elsif_blocks: List[Block] = []
+
+        while self.__accept('elsif'):
+            self.__expect('(')
+            elsif_exprs.append(self.expression())
+            self.__expect(')')
+
+            elsif_blocks.append(self.__scoped_block())
+
+        else_block = None
+        if self.__accept('else'):
+            else_block = self.__scoped_block()
+
+        return IfStatement(tok, if_expr, if_block, elsif_exprs, elsif_blocks,
+                           else_block)
+
+    def for_statement(self) -> ForStatement:
+        visitor = self.visitor
+
+        tok = self.__expect('for')
+        self.__expect('(')
+
+        visitor.open_scope()
+
+        init = []
+        while self.__peek().text in ['var', 'val']:
+            init.append(self.variable_declarations())
+
+        self.__expect(';')
+
+        cond = None
+        if self.__peek().text != ';':
+            cond = self.expression()
+
+        self.__expect(';')
+
+        update = []
+        if self.__peek().text != ')':
+            update = self.expression_list()
+
+        self.__expect(')')
+
+        block = self.block()
+
+        visitor.close_scope()
+
+        return ForStatement(tok, init, cond, update, block)
+
+    def variable_declarations(self) -> VariableDeclarationsStatement:
+        tok = self.__peek()
+        declarations = [self.variable_declaration()]
+
+        while self.__accept(','):
+            declarations.append(self.variable_declaration())
+
+        return VariableDeclarationsStatement(tok, declarations)
+
+    def variable_declaration(
+            self) -> Optional[VariableDeclarationStatement]:
+        tok = self.__peek()
+        var_type = self.__expect('var', 'val').text
+        ID = self.__expect_type('IDENTIFIER').text
+
+        type_name = None
+        initializer = None
+
+        if self.__accept(':'):
+            type_name = self.type_name()
+
+            if self.__accept('='):
+                initializer = self.expression()
+
+        else:
+            self.__expect('=')
+            initializer = self.expression()
+
+        return self.visitor.variable_declaration(
+            tok, var_type, ID, type_name, initializer)
+
+    def expression_list(self) -> List[Expression]:
+        exprs = [self.expression()]
+
+        while self.__accept(','):
+            exprs.append(self.expression())
+
+        return exprs
+
+    def expression(self, min_power: int = 0) -> Expression:
+        visitor = self.visitor
+
+        start = self.__peek()
+        text = start.text
+
+        if text in PREFIX_OPS:
+            self.__next()
+
+            left = visitor.prefix_expression(
+                start, text, self.expression(PREFIX_OPS[text]))
+
+        else:
+            left = self.primary()
+
+        while True:
+            tok = self.__peek()
+            text = tok.text
+
+            if text in ['++', '--'] and min_power <= POSTFIX:
+                self.__next()
+                left = visitor.postfix_expression(start, left, text)
+
+            elif text == 'as' and min_power <= AS:
+                self.__next()
+                self.type_name()
+
+                left = visitor.unhandled_expression(start, 'as')
+
+            elif text == 'is' and min_power <= IS:
+                self.__next()
+                self.type_name()
+
+                left = visitor.unhandled_expression(start, 'is')
+
+            elif text == '?' and min_power <= TERNARY:
+                self.__next()
+
+                exprC = self.expression()
+                self.__expect(':')
+                exprR = self.expression(TERNARY + 1)
+
+                left = visitor.ternary_expression(
+                    start, left, '?', exprC, exprR)
+
+            elif text in ['<', '>'] and min_power <= CHAINED:
+                pos = self.pos
+                self.__next()
+
+                exprC = self.expression(CHAINED + 1)
+
+                # 'a < b < c', or else a plain comparison
+                if self.__accept(text):
+                    exprR = self.expression(CHAINED + 1)
+
+                    left = visitor.ternary_expression(
+                        start, left, text, exprC, exprR)
+
+                elif min_power <= BINARY_OPS[text]:
+                    left = visitor.binary_expression(start, left, text, exprC)
+
+                else:
+                    self.pos = pos
+                    return left
+
+            elif text in BINARY_OPS and min_power <= BINARY_OPS[text]:
+                self.__next()
+
+                power = BINARY_OPS[text]
+                if power > 1:
+                    power += 1
+
+                left = visitor.binary_expression(
+                    start, left, text, self.expression(power))
+
+            else:
+                return left
+
+    def primary(self) -> Expression:
+        tok = self.__peek()
+
+        if self.__accept('('):
+            ret = self.expression()
+            self.__expect(')')
+
+            return ret
+
+        if tok.type in LITERAL_TYPES:
+            self.__next()
+
+            return Literal(tok, tok.text, LITERAL_TYPES[tok.type])
+
+        return self.reference_expression()
+
+    def reference_expression(self) -> Expression:
+        visitor = self.visitor
+
+        start = self.__expect_type('IDENTIFIER', 'SELF', 'SUPER')
+
+        if start.type == 'IDENTIFIER' and self.__peek().text == '(':
+            ret = self.__function_call(start)
+        else:
+            ret = visitor.reference(start, start.text)
+
+        while self.__accept('.'):
+            tok = self.__expect_type('IDENTIFIER')
+
+            if self.__peek().text == '(':
+                ret = self.__function_call(tok, ret.ref)
+            else:
+                ret = visitor.reference(start, tok.text, ret)
+
+        return ret
+
+    def __function_call(self, tok: Token,
+                        parent: Symbol = None) -> Expression:
+        self.__expect('(')
+
+        args: List[Expression] = []
+        kwargs: List[Tuple[str, Expression]] = []
+
+        if self.__peek().text != ')' and not self.__at_kwargument():
+            args = self.expression_list()
+
+        if self.__at_kwargument():
+            while True:
+                ID = self.__next().text
+                self.__next()
+                kwargs.append((ID, self.expression()))
+
+                if not self.__accept(','):
+                    break
+
+        self.__expect(')')
+
+        return self.visitor.function_call(tok, tok.text, args, kwargs, parent)
+
+    def __field_value(self) -> Expression:
+        tok = self.__peek()
+
+        if tok.type in LITERAL_TYPES:
+            self.__next()
+            return Literal(tok, tok.text, LITERAL_TYPES[tok.type])
+
+        return self.__function_call(self.__expect_type('IDENTIFIER'))
+
+    def __scoped_block(self) -> Block:
+        visitor = self.visitor
+
+        visitor.open_scope()
+        ret = self.block()
+        visitor.close_scope()
+
+        return ret
+
+    def __skip_body(self):
+        if self.__accept('='):
+            while not self.__accept(';'):
+                if self.__next().type == 'EOF':
+                    self.__error("';'")
+
+            return
+
+        self.__expect('where')
+
+        depth = 1
+        while depth:
+            tok = self.__next()
+            depth += {'where': 1, 'end': -1}.get(tok.text, 0)
+
+            if tok.type == 'EOF':
+                self.__error("'end'")
+
+    def __modifier(self, modifiers: List[str]) -> Optional[str]:
+        if self.__peek().text in modifiers:
+            return self.__next().text
+
+        return None
+
+    def __after_modifiers(self) -> Token:
+        """Returns the first token after a declaration's modifiers"""
+
+        pos = self.pos
+        while self.tokens[pos].text in ['override', 'const', *(
+                VISIBILITY_MODIFIERS + INHERITANCE_MODIFIERS)]:
+            pos += 1
+
+        return self.tokens[pos]
+
+    def __at_kwargument(self) -> bool:
+        return (self.__peek().type == 'IDENTIFIER' and
+                self.tokens[self.pos + 1].text == ':')
+
+    def __peek(self) -> Token:
+        return self.tokens[self.pos]
+
+    def __next(self) -> Token:
+        tok = self.tokens[self.pos]
+
+        if tok.type != 'EOF':
+            self.pos += 1
+
+        return tok
+
+    def __accept(self, *texts: str) -> Optional[Token]:
+        tok = self.tokens[self.pos]
+
+        if tok.text in texts:
+            self.pos += 1
+            return tok
+
+        return None
+
+    def __expect(self, *texts: str) -> Token:
+        tok = self.__accept(*texts)
+
+        if tok is None:
+            self.__error(" or ".join("'{}'".format(t) for t in texts))
+
+        return tok
+
+    def __expect_type(self, *types: str) -> Token:
+        tok = self.tokens[self.pos]
+
+        if tok.type not in types:
+            self.__error(" or ".join(types))
+
+        self.pos += 1
+        return tok
+
+    def __error(self, expected: str):
+        tok = self.__peek()
+
+        WappaException("ERROR", "Expected {} but found '{}'".format(
+            expected, tok.text), tok)
+
+        raise ParseError()
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+from typing import Callable, Iterator, Union
+
+from antlr4 import CommonTokenStream, InputStream, ParserRuleContext, Token
+from antlr4.atn.PredictionMode import PredictionMode
+from antlr4.error.ErrorListener import ConsoleErrorListener
+from antlr4.error.ErrorStrategy import BailErrorStrategy, DefaultErrorStrategy
+from antlr4.error.Errors import ParseCancellationException
+
+from gen.Wappa import Wappa
+from gen.WappaLexer import WappaLexer
+
+PREDICTION_MODES = ["sll", "ll"]
+
+
+def parse(source: Union[str, InputStream], prediction: str = "sll"
+          ) -> Wappa.CompilationUnitContext:
+    """Parses a source file, given as text or a stream, e.g. an
+    MmapInputStream
+
+    With 'sll', the file is first parsed with the cheaper SLL prediction,
+    giving up at the first syntax error, and only parsed again with full LL
+    prediction if that fails. Both produce the same tree for any input SLL
+    accepts, and LL still reports the actual syntax errors.
+    """
+
+    parser = Wappa(CommonTokenStream(WappaLexer(input_stream(source))))
+    parser.buildParseTrees = True
+
+    return parse_rule(parser, parser.compilationUnit, prediction)
+
+
+def declarations(source: Union[str, InputStream], prediction: str = "sll"
+                 ) -> Iterator[ParserRuleContext]:
+    """Parses a source file one top-level declaration at a time, so each
+    subtree can be dropped as soon as it has been visited
+
+    Stops after the first declaration with a syntax error.
+    """
+
+    tokens = CommonTokenStream(WappaLexer(input_stream(source)))
+    parser = Wappa(tokens)
+    parser.buildParseTrees = True
+
+    while tokens.LA(1) != Token.EOF:
+        # Both kinds of declaration start with their modifiers
+        i = 1
+        while tokens.LA(i) not in [Wappa.CLASS, Wappa.FUN, Token.EOF]:
+            i += 1
+
+        if tokens.LA(i) == Wappa.CLASS:
+            rule = parser.classDeclaration
+        else:
+            rule = parser.functionDeclaration
+
+        ctx = parse_rule(parser, rule, prediction)
+
+        if parser.getNumberOfSyntaxErrors():
+            return
+
+        yield ctx
+
+
+def input_stream(source: Union[str, InputStream]) -> InputStream:
+    """Returns a stream over a source's text, or rewinds a stream, which
+    may have already been lexed"""
+
+    if isinstance(source, str):
+        return InputStream(source)
+
+    source.reset()
+
+    return source
+
+
+def parse_rule(parser: Wappa, rule: Callable[[], ParserRuleContext],
+               prediction: str) -> ParserRuleContext:
+    """Parses a rule from the parser's current token, see 'parse'"""
+
+    if prediction == "ll":
+        return rule()
+
+    start = parser.getInputStream().index
+    errors = parser._syntaxErrors
+
+    parser._interp.predictionMode = PredictionMode.SLL
+    parser._errHandler = BailErrorStrategy()
+    parser.removeErrorListeners()
+
+    try:
+        return rule()
+
+    except ParseCancellationException:
+        # Either a syntax error, or a decision SLL resolved wrongly, which
+        # LL counts again if it is an actual one
+        parser._syntaxErrors = errors
+        parser._interp.predictionMode = PredictionMode.LL
+        parser._errHandler = DefaultErrorStrategy()
+        parser.addErrorListener(ConsoleErrorListener.INSTANCE)
+
+        parser.getInputStream().seek(start)
+        parser._errHandler.reset(parser)
+        parser._ctx = None
+
+        return rule()
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import shutil
+import tempfile
+from typing import TYPE_CHECKING, Iterable, TextIO, Union
+
+import llvmlite.ir as ir
+
+from .attributes import infer_attributes
+from .options import CompileOptions
+from .parser import Parser
+from .parsing import declarations
+from .structs.Class import Class
+from .structs.Function import Function
+from .structs.Symbols import SymbolTable
+from .util import EXCEPTION_LIST, print_exceptions
+from .visitor import WappaVisitor
+
+if TYPE_CHECKING:
+    from .input_stream import MmapInputStream
+    from .structs.Scope import Scope, Symbol
+
+
+class StreamingCompiler:
+    """Compiles a source one top-level declaration at a time
+
+    Each declaration is parsed, compiled and written out before the next
+    one is parsed, after which only its signature is kept: its parse
+    subtree, AST and function bodies are dropped. Memory then grows with
+    the number of declarations, not with the size of their bodies.
+
+    A pre-pass over the signatures declares every class and function
+    first, so declarations can refer to those further down the file.
+    """
+
+    def __init__(self, options: CompileOptions = None,
+                 front_end: str = "antlr", prediction: str = "sll",
+                 externals: Iterable[Function] = ()):
+        self.options = options or CompileOptions()
+        self.front_end = front_end
+        self.prediction = prediction
+
+        # See 'WappaVisitor'
+        self.externals = list(externals)
+
+    def compile(self, source: Union[str, MmapInputStream], out: TextIO
+                ) -> WappaVisitor:
+        """Writes the IR of a source to 'out', and returns the visitor
+        holding its declarations' signatures"""
+
+        visitor = WappaVisitor(self.options, externals=self.externals)
+        self.__declare(source, visitor)
+
+        module = visitor.module
+        symbols = SymbolTable(options=self.options)
+
+        if self.front_end == "pratt":
+            parsed = Parser(source, visitor).declarations()
+        else:
+            parsed = (visitor.visitDeclaration(ctx) for ctx in
+                      declarations(source, self.prediction))
+
+        # Function definitions are spilled as they are emitted, since the
+        # struct types they use must come first and are only known at the end
+        with tempfile.TemporaryFile("w+", encoding="utf-8") as spill:
+            for symbol in parsed:
+                if hasattr(symbol, 'compile'):
+                    symbol.compile(module, visitor.builder, symbols)
+
+                self.__release(symbol)
+                self.__flush(module, spill)
+
+            # Types, globals, metadata and the declarations never defined
+            out.write(str(module))
+            out.write("\n")
+
+            spill.seek(0)
+            shutil.copyfileobj(spill, out)
+
+        print_exceptions()
+
+        return visitor
+
+    def __declare(self, source: Union[str, MmapInputStream],
+                  visitor: WappaVisitor):
+        """Declares the signatures of every class and function"""
+
+        errors = len(EXCEPTION_LIST)
+
+        # A signature naming a class declared after it only resolves once
+        # that class is declared, on a second pass
+        for _ in range(2):
+            Parser(source, visitor).signatures()
+            self.__forward(visitor.global_scope)
+
+            if len(EXCEPTION_LIST) == errors:
+                break
+
+            # Reported again, with anything else, when defined
+            del EXCEPTION_LIST[errors:]
+
+    def __forward(self, scope: Scope):
+        scope.forward = set(scope.symbol_table)
+
+        for symbol in scope.symbols(values=True):
+            if isinstance(symbol, Class):
+                self.__forward(symbol.scope)
+
+    def __release(self, symbol: Symbol):
+        """Drops the AST of a compiled declaration, keeping its signature"""
+
+        functions = [symbol]
+        if isinstance(symbol, Class):
+            functions = symbol.scope.symbols(values=True)
+
+        for function in functions:
+            if isinstance(function, Function):
+                function.block = None
+                function.scope = None
+
+    def __flush(self, module: ir.Module, out: TextIO):
+        """Writes out the functions defined so far, and removes them from
+        the module, with the attributes inferred from them and those
+        already written out"""
+
+        infer_attributes(module.functions)
+
+        for ID, value in list(module.globals.items()):
+            if isinstance(value, ir.Function) and value.blocks:
+                out.write(str(value))
+                out.write("\n")
+
+                # Later calls only need the function's name and type, not
+                # its body nor the names of its locals
+                value.blocks = []
+                value.scope = type(value.scope)()
+                del module.globals[ID]
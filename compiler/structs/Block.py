@@ -4,18 +4,35 @@ from typing import TYPE_CHECKING, Iterable
 
 import llvmlite.ir as ir
 
+from .Symbols import SymbolTable
+
 if TYPE_CHECKING:
     from .Scope import Scope
-    from .Statement import Statement
-    from .Symbols import SymbolTable
 
 
 class Block:
+    __slots__ = ('scope', 'statements')
+
     def __init__(self, scope: Scope, statements: Iterable[Statement]):
         self.scope = scope
         self.statements = statements
 
+    def fold(self) -> Block:
+        """Folds the block's statements, dropping those left empty"""
+
+        self.statements = [
+            s for s in (s.fold() for s in self.statements)
+            if type(s) is not Statement]
+
+        return self
+
     def compile(self, module: ir.Module, builder: ir.IRBuilder,
                 symbols: SymbolTable) -> ir.Value:
+        symbols = SymbolTable(parent=symbols)
+
         for s in self.statements:
             s.compile(module, builder, symbols)
+
+
+if True:
+    from .Statement import Statement
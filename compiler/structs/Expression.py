@@ -1,14 +1,17 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, List, Optional, Tuple
+import math
+import struct
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple
 
 import llvmlite.ir as ir
 
 from gen.Wappa import Token
 
-from ..type_system import (BoolType, DoubleType, IntType,
-                           PrimitiveTypes, TypeType, UnitType, make_constant, IntTypes, FloatTypes)
-from ..util import WappaException
+from ..type_system import (BoolType, DoubleType, FloatType, FloatTypes,
+                           IntType, IntTypes, PrimitiveTypes, TypeType,
+                           UnitType, convert, make_constant)
+from ..util import Position, WappaException, trampoline
 from .Field import Field
 from .Type import WappaType
 from .Variable import Variable
@@ -18,12 +21,75 @@ if TYPE_CHECKING:
     from .Scope import Symbol
     from .Symbols import SymbolTable
 
+ASSIGNMENT_OPS = ['=', '+=', '-=', '*=', '**=', '/=', '//=', '&=', '|=', '^=',
+                  '<<=', '>>=', '>>>=', '%=']
+
+
+def step(builder: ir.IRBuilder, uop: str, value: ir.Value,
+         wtype: WappaType, fast_math: Tuple[str, ...] = ()) -> ir.Value:
+    """Returns the value incremented or decremented by one"""
+
+    one = ir.Constant(value.type, 1)
+
+    if wtype in FloatTypes:
+        return (builder.fadd if uop == '++' else builder.fsub)(
+            value, one, flags=fast_math)
+
+    return (builder.add if uop == '++' else builder.sub)(value, one)
+
+
+def common_type(bop: str, exprL_type: WappaType,
+                exprR_type: WappaType) -> WappaType:
+    """Returns the type both operands of an arithmetic or comparison
+    operator are converted to"""
+
+    for wtype in (exprL_type, exprR_type):
+        if wtype in FloatTypes:
+            return wtype
+
+    if bop == '/':
+        return DoubleType
+
+    irL = getattr(exprL_type, 'ir_type', None)
+    irR = getattr(exprR_type, 'ir_type', None)
+
+    if (isinstance(irL, ir.IntType) and isinstance(irR, ir.IntType) and
+            irR.width > irL.width):
+        return exprR_type
+
+    return exprL_type
+
+
+def literal(tok: Token, value: Any, wtype: WappaType) -> Literal:
+    """Returns the literal for a value computed at compile time, wrapped or
+    rounded the way the operation would be at runtime"""
+
+    if wtype == BoolType:
+        return Literal(tok, 'True' if value else 'False', wtype)
+
+    if wtype in IntTypes:
+        half = 1 << (wtype.ir_type.width - 1)
+        return Literal(tok, str((int(value) + half) % (half << 1) - half),
+                       wtype)
+
+    value = float(value)
+    if wtype == FloatType:
+        value = struct.unpack('f', struct.pack('f', value))[0]
+
+    return Literal(tok, repr(value), wtype)
+
 
 class Expression:
+    __slots__ = ('line', 'column', 'text')
+
     def __init__(self, tok: Token, text: str):
-        self.tok = tok
+        self.line, self.column = tok.line, tok.column
         self.text = text
 
+    @property
+    def pos(self) -> Position:
+        return Position(self.line, self.column)
+
     def type_of(self) -> Optional[WappaType]:
         raise NotImplementedError(
             "'type_of' not implemented for {}".format(type(self)))
@@ -37,6 +103,11 @@ class Expression:
         raise NotImplementedError(
             "'type_check' not implemented for {}".format(type(self)))
 
+    def fold(self) -> Expression:
+        """Returns the expression with its constant parts evaluated"""
+
+        return self
+
     def compile(self, module: ir.Module, builder: ir.IRBuilder,
                 symbols: SymbolTable) -> ir.Value:
         raise NotImplementedError(
@@ -44,9 +115,77 @@ class Expression:
                 type(self), self.text))
 
 
+class CompoundExpression(Expression):
+    """An expression made of other expressions
+
+    Its folding and IR are computed by generators, 'fold_node' and
+    'compile_node', yielding the operands they need the result of. These
+    run on an explicit stack, so long generated chains like
+    'a + b + c + ...' never hit the recursion limit.
+
+    Its type is resolved once, by 'annotate', and stored on the node.
+    """
+
+    # 'wtype' is unset until the expression is annotated
+    __slots__ = ('wtype',)
+
+    @property
+    def operands(self) -> List[Expression]:
+        return []
+
+    def type_of(self) -> Optional[WappaType]:
+        try:
+            return self.wtype
+        except AttributeError:
+            self.annotate()
+
+        return self.wtype
+
+    def annotate(self):
+        """Resolves and stores the types of the expression and of its
+        operands not annotated yet, bottom up
+
+        'type_node' then only has to look at its operands' stored types.
+        """
+
+        trampoline(self, lambda e: e.__annotate() if isinstance(
+            e, CompoundExpression) and not hasattr(e, 'wtype') else None)
+
+    def __annotate(self) -> Any:
+        for e in self.operands:
+            yield e
+
+        self.wtype = self.type_node()
+
+    def fold(self) -> Expression:
+        return trampoline(self, lambda e: e.fold_node() if isinstance(
+            e, CompoundExpression) else e.fold())
+
+    def compile(self, module: ir.Module, builder: ir.IRBuilder,
+                symbols: SymbolTable) -> ir.Value:
+        return trampoline(self, lambda e: e.compile_node(
+            module, builder, symbols) if isinstance(
+                e, CompoundExpression) else e.compile(
+                    module, builder, symbols))
+
+    def type_node(self) -> Optional[WappaType]:
+        raise NotImplementedError(
+            "'type_of' not implemented for {}".format(type(self)))
+
+    def fold_node(self) -> Any:
+        return self
+
+    def compile_node(self, module: ir.Module, builder: ir.IRBuilder,
+                     symbols: SymbolTable) -> Any:
+        raise NotImplementedError(
+            "'compile' not implemented for {}".format(type(self)))
+
+
 class Literal(Expression):
+    __slots__ = ('lit_type',)
+
     def __init__(self, tok: Token, text: str, lit_type: WappaType):
-        self.tok = tok
+        self.line, self.column = tok.line, tok.column
         self.text = text
         self.lit_type = lit_type
 
@@ -57,6 +196,32 @@ class Literal(Expression):
     def ir_type(self) -> ir.Value:
         return self.lit_type.ir_type
 
+    @property
+    def value(self) -> Any:
+        lit_type = self.lit_type
+
+        if lit_type == BoolType:
+            return self.text == 'True'
+
+        if lit_type in IntTypes:
+            text = self.text.replace('_', '').rstrip('lL')
+
+            # Octal literals are written '017', not '0o17'
+            if len(text) > 1 and text[0] == '0' and text[1] in '01234567':
+                return int(text, 8)
+
+            return int(text, 0)
+
+        if lit_type in FloatTypes:
+            text = self.text.replace('_', '')
+
+            if text[:2] in ['0x', '0X']:
+                return float.fromhex(text.rstrip('fFdD'))
+
+            return float(text.rstrip('fFdD'))
+
+        return None
+
     def type_check(self):
         pass
 
@@ -65,19 +230,18 @@ class Literal(Expression):
         lit_type = self.lit_type
 
         if lit_type == BoolType:
-            return ir.Constant(lit_type.ir_type, int(self.text == 'True'))
+            return ir.Constant(lit_type.ir_type, int(self.value))
 
-        if lit_type in IntTypes:
-            return ir.Constant(lit_type.ir_type, int(self.text))
-
-        if lit_type in FloatTypes:
-            return ir.Constant(lit_type.ir_type, float(self.text))
+        if lit_type in IntTypes or lit_type in FloatTypes:
+            return ir.Constant(lit_type.ir_type, self.value)
 
 
 class Reference(Expression):
+    __slots__ = ('ref', 'ID', 'parent')
+
     def __init__(self, tok: Token, ref: Symbol, ID: str,
                  parent: Optional[Reference] = None):
-        self.tok = tok
+        self.line, self.column = tok.line, tok.column
         self.ref = ref
         self.ID = ID
         self.parent = parent
@@ -103,8 +267,10 @@ class Reference(Expression):
     def type_check(self):
         pass
 
-    def compile(self, module: ir.Module, builder: ir.IRBuilder,
+    def address(self, module: ir.Module, builder: ir.IRBuilder,
                 symbols: SymbolTable) -> ir.Value:
+        """Returns a pointer to the referenced variable or field"""
+
         if self.parent is None:
             return symbols.get_symbol(self.ID)
 
@@ -120,24 +286,37 @@ class Reference(Expression):
                 ret = builder.gep(
                     ret, [make_constant(IntType, i) for i in (0, index)])
 
-            rtype = ret.type
+            return ret
+
+    def compile(self, module: ir.Module, builder: ir.IRBuilder,
+                symbols: SymbolTable) -> ir.Value:
+        ret = self.address(module, builder, symbols)
+        rtype = ret.type
 
-            if isinstance(rtype, ir.PointerType) and (
-                    rtype.pointee in [i.ir_type for i in PrimitiveTypes]):
-                ret = builder.load(ret)
+        # Locals, including arguments, live in allocas until mem2reg/SROA
+        if isinstance(ret, ir.AllocaInstr) or (
+                isinstance(rtype, ir.PointerType) and
+                rtype.pointee in [i.ir_type for i in PrimitiveTypes]):
+            ret = builder.load(ret)
 
-            return ret
+        return ret
 
 
-class FunctionCallExpression(Expression):
+class FunctionCallExpression(CompoundExpression):
+    __slots__ = ('ref', 'args', 'kwargs')
+
     def __init__(self, tok: Token, ref: Function, args: List[Expression],
                  kwargs: List[Tuple[str, Expression]]):
-        self.tok = tok
+        self.line, self.column = tok.line, tok.column
         self.ref = ref
         self.args = args
         self.kwargs = kwargs
 
-    def type_of(self) -> Optional[WappaType]:
+    @property
+    def operands(self) -> List[Expression]:
+        return self.args
+
+    def type_node(self) -> Optional[WappaType]:
         return self.ref.ret_type
 
     @property
@@ -150,20 +329,39 @@ class FunctionCallExpression(Expression):
     def type_check(self):
         pass
 
-    def compile(self, module: ir.Module, builder: ir.IRBuilder,
-                symbols: SymbolTable) -> ir.Value:
-        return builder.call(
-            self.ref.compile(module, builder, symbols),
-            [a.compile(module, builder, symbols) for a in self.args])
+    def fold_node(self) -> Any:
+        args = []
+        for a in self.args:
+            args.append((yield a))
+
+        self.args = args
+
+        return self
 
+    def compile_node(self, module: ir.Module, builder: ir.IRBuilder,
+                     symbols: SymbolTable) -> Any:
+        func = self.ref.compile(module, builder, symbols)
+
+        args = []
+        for a in self.args:
+            args.append((yield a))
+
+        return builder.call(func, args)
+
+
+class PostfixOPExpression(CompoundExpression):
+    __slots__ = ('expr', 'postfix')
 
-class PostfixOPExpression(Expression):
     def __init__(self, tok: Token, expr, postfix):
-        self.tok = tok
+        self.line, self.column = tok.line, tok.column
         self.expr = expr
         self.postfix = postfix
 
-    def type_of(self) -> Optional[WappaType]:
+    @property
+    def operands(self) -> List[Expression]:
+        return [self.expr]
+
+    def type_node(self) -> Optional[WappaType]:
         return self.expr.type_of()
 
     @property
@@ -173,30 +371,37 @@ class PostfixOPExpression(Expression):
         except AttributeError:
             return None
 
-    def compile(self, module: ir.Module, builder: ir.IRBuilder,
-                symbols: SymbolTable) -> ir.Value:
+    def compile_node(self, module: ir.Module, builder: ir.IRBuilder,
+                     symbols: SymbolTable) -> Any:
         uop = self.postfix
 
-        # TODO: Figure out postfix operators
-        if uop in ['++', '--']:
-            if self.expr.type_of() in IntTypes:
-                pass
+        if uop in ['++', '--'] and isinstance(self.expr, Reference):
+            ptr = self.expr.address(module, builder, symbols)
+            ret = builder.load(ptr)
+
+            builder.store(step(builder, uop, ret, self.expr.type_of(),
+                               symbols.fast_math), ptr)
 
-            if self.expr.type_of() int FloatTypes:
-                pass
+            return ret
 
         WappaException(
-            "FATAL", "Unhandled Postfix Operator {}".format(uop), self.tok)
+            "FATAL", "Unhandled Postfix Operator {}".format(uop), self.pos)
         return uop
 
 
-class PrefixOPExpression(Expression):
+class PrefixOPExpression(CompoundExpression):
+    __slots__ = ('prefix', 'expr')
+
     def __init__(self, tok: Token, prefix, expr):
-        self.tok = tok
+        self.line, self.column = tok.line, tok.column
         self.prefix = prefix
         self.expr = expr
 
-    def type_of(self):
+    @property
+    def operands(self) -> List[Expression]:
+        return [self.expr]
+
+    def type_node(self) -> Optional[WappaType]:
         uop = self.prefix
 
         if uop in ['alignof', 'sizeof']:
@@ -214,12 +419,56 @@ class PrefixOPExpression(Expression):
         except AttributeError:
             return None
 
-    def compile(self, module: ir.Module, builder: ir.IRBuilder,
-                symbols: SymbolTable) -> ir.Value:
+    def fold_node(self) -> Any:
+        uop = self.prefix
+
+        if uop in ['++', '--']:
+            return self
+
+        self.expr = expr = yield self.expr
+
+        if uop == '+':
+            return expr
+
+        if not isinstance(expr, Literal):
+            return self
+
+        value = expr.value
+        wtype = expr.type_of()
+
+        if uop == '-' and (wtype in IntTypes or wtype in FloatTypes):
+            return literal(self.pos, -value, wtype)
+
+        if uop == '~' and wtype in IntTypes:
+            return literal(self.pos, ~value, wtype)
+
+        if uop == '!' and wtype == BoolType:
+            return literal(self.pos, not value, wtype)
+
+        return self
+
+    def compile_node(self, module: ir.Module, builder: ir.IRBuilder,
+                     symbols: SymbolTable) -> Any:
         uop = self.prefix
-        expr = self.expr.compile(module, builder, symbols)
+
+        if uop in ['++', '--'] and isinstance(self.expr, Reference):
+            ptr = self.expr.address(module, builder, symbols)
+            ret = step(builder, uop, builder.load(ptr), self.expr.type_of(),
+                       symbols.fast_math)
+
+            builder.store(ret, ptr)
+
+            return ret
+
+        expr = yield self.expr
+
+        if uop == '+':
+            return expr
 
         if uop == '-':
+            if self.expr.type_of() in FloatTypes:
+                return builder.fsub(ir.Constant(expr.type, -0.0), expr)
+
             return builder.neg(expr)
 
         if uop in ['~', '!']:
@@ -232,35 +481,40 @@ class PrefixOPExpression(Expression):
         #     return "({}.getClassName())".format(expr)
 
         WappaException(
-            "FATAL", "Unhandled Prefix Operator {}".format(uop), self.tok)
+            "FATAL", "Unhandled Prefix Operator {}".format(uop), self.pos)
 
         return uop
 
 
-class BinaryOPExpression(Expression):
+class BinaryOPExpression(CompoundExpression):
+    __slots__ = ('exprL', 'bop', 'exprR')
+
     def __init__(self, tok: Token, exprL: Expression, bop, exprR: Expression):
-        self.tok = tok
+        self.line, self.column = tok.line, tok.column
         self.exprL = exprL
         self.bop = bop
         self.exprR = exprR
 
-    def type_of(self):
+    @property
+    def operands(self) -> List[Expression]:
+        return [self.exprL, self.exprR]
+
+    def type_node(self) -> Optional[WappaType]:
         bop = self.bop
 
-        if bop in ['&&', '||', '==', '===', '!=', '!==', 'is']:
+        if bop in ['&&', '||', '==', '===', '!=', '!==', 'is',
+                   '<', '<=', '>=', '>']:
             return BoolType
 
-        if bop in ['=', '+=', '-=', '*=', '**=', '/=', '//=', '&=', '|=', '^=',
-                   '<<=', '>>=', '>>>=', '%=', '|>']:
+        if bop == '|>':
             return self.exprR.type_of()
 
-        if bop == '/':
-            return DoubleType
+        # Assignments have the type of their target
+        if bop in ASSIGNMENT_OPS:
+            return self.exprL.type_of()
 
-        if bop == '//':
-            return IntType
-
-        return self.exprL.type_of()
+        # What '__operate' converts both operands to and computes in
+        return common_type(bop, self.exprL.type_of(), self.exprR.type_of())
 
     @property
     def ir_type(self) -> Optional[ir.Value]:
@@ -269,134 +523,261 @@ class BinaryOPExpression(Expression):
         except AttributeError:
             return None
 
-    def compile(self, module: ir.Module, builder: ir.IRBuilder,
-                symbols: SymbolTable) -> ir.Value:
+    def fold_node(self) -> Any:
         bop = self.bop
 
-        exprL = self.exprL.compile(module, builder, symbols)
-        exprL_type = self.exprL.type_of()
-        exprL_int = exprL_type in IntTypes
+        self.exprR = exprR = yield self.exprR
 
-        exprR = self.exprR.compile(module, builder, symbols)
-        exprR_type = self.exprR.type_of()
-        exprR_int = exprR_type in IntTypes
+        if bop in ASSIGNMENT_OPS:
+            return self
 
-        if bop == '+':
-            if exprL_int and exprR_int:
-                return builder.add(exprL, exprR)
+        self.exprL = exprL = yield self.exprL
 
-            if exprL_int:
-                exprL = builder.sitofp(exprL, exprR_type.ir_type)
+        if isinstance(exprL, Literal) and isinstance(exprR, Literal):
+            ret = self.__evaluate(exprL, exprR)
 
-            if exprR_int:
-                exprR = builder.sitofp(exprR, exprL_type.ir_type)
+            return self if ret is None else ret
 
-            return builder.fadd(exprL, exprR)
+        if isinstance(exprR, Literal):
+            expr, lit = exprL, exprR
+        elif isinstance(exprL, Literal):
+            expr, lit = exprR, exprL
+        else:
+            return self
+
+        value = lit.value
+        expr_type = expr.type_of()
+
+        if bop in ['&&', '||']:
+            # 'True && x' and 'False || x' are just 'x'
+            if (lit.type_of() == BoolType and expr_type == BoolType and
+                    value == (bop == '&&')):
+                return expr
+
+            return self
+
+        if common_type(bop, exprL.type_of(), exprR.type_of()) != expr_type:
+            return self
+
+        # Operators for which 'x op lit' is 'x', and whether 'lit op x' is
+        # too; 'x + 0' is not 'x' for a float x of -0.0
+        if expr_type in IntTypes:
+            identities = {
+                '+': (0, True), '-': (0, False), '*': (1, True),
+                '//': (1, False), '|': (0, True), '^': (0, True),
+                '<<': (0, False), '>>': (0, False), '>>>': (0, False)
+            }
+        elif expr_type in FloatTypes:
+            identities = {'-': (0, False), '*': (1, True), '/': (1, False)}
+        else:
+            return self
 
-        if bop == '-':
-            if exprL_int and exprR_int:
-                return builder.sub(exprL, exprR)
+        if bop in identities:
+            identity, commutative = identities[bop]
 
-            if exprL_int:
-                exprL = builder.sitofp(exprL, exprL_type.ir_type)
+            if value == identity and (lit is exprR or commutative):
+                return expr
 
-            if exprR_int:
-                exprR = builder.sitofp(exprL, exprR_type.ir_type)
+        return self
 
-            return builder.fsub(exprL, exprR)
+    def compile_node(self, module: ir.Module, builder: ir.IRBuilder,
+                     symbols: SymbolTable) -> Any:
+        bop = self.bop
 
-        if bop == '*':
-            if exprL_int and exprR_int:
-                return builder.mul(exprL, exprR)
+        if bop in ASSIGNMENT_OPS:
+            return (yield from self.__assign(module, builder, symbols))
 
-            if exprL_int:
-                exprL = builder.sitofp(exprL, exprL_type.ir_type)
+        exprL = yield self.exprL
+        exprR = yield self.exprR
 
-            if exprR_int:
-                exprR = builder.sitofp(exprL, exprR_type.ir_type)
+        ret = self.__operate(builder, bop, exprL, self.exprL.type_of(),
+                             exprR, self.exprR.type_of(), symbols.fast_math)
 
-            return builder.fmul(exprL, exprR)
+        if ret is None:
+            WappaException(
+                "FATAL", "Unhandled Binary Operator {}".format(bop), self.pos)
+            return bop
 
-        if bop == '/':
-            if exprL_int:
-                exprL = builder.sitofp(exprL, exprL_type.ir_type)
+        return ret[0]
 
-            if exprR_int:
-                exprR = builder.sitofp(exprL, exprR_type.ir_type)
+    def __assign(self, module: ir.Module, builder: ir.IRBuilder,
+                 symbols: SymbolTable) -> Any:
+        bop = self.bop
 
-            return builder.fdiv(exprL, exprR)
+        if not isinstance(self.exprL, Reference):
+            WappaException(
+                "ERROR", "Cannot assign to an expression", self.pos)
+            return bop
 
-        if bop == '//':
-            return builder.sdiv(exprL, exprR)
+        ptr = self.exprL.address(module, builder, symbols)
+        var_type = self.exprL.type_of()
 
-        if bop == '%':
-            if exprL_int and exprR_int:
-                return builder.srem(exprL, exprR)
+        value = yield self.exprR
+        value_type = self.exprR.type_of()
 
-            if exprL_int:
-                exprL = builder.sitofp(exprL, exprL_type.ir_type)
+        if bop != '=':
+            ret = self.__operate(builder, bop[:-1], builder.load(ptr),
+                                 var_type, value, value_type,
+                                 symbols.fast_math)
 
-            if exprR_int:
-                exprR = builder.sitofp(exprL, exprR_type.ir_type)
+            if ret is None:
+                WappaException(
+                    "FATAL", "Unhandled Assignment Operator {}".format(bop),
+                    self.pos)
+                return bop
 
-            return builder.frem(exprL, exprR)
+            value, value_type = ret
 
-        if bop in ['&', '&&']:
-            return builder.and_(exprL, exprR)
+        value = convert(builder, value, value_type, var_type)
+        builder.store(value, ptr)
 
-        if bop in ['|', '||']:
-            return builder.or_(exprL, exprR)
+        return value
 
-        if bop == '^':
-            return builder.xor(exprL, exprR)
+    def __operate(self, builder: ir.IRBuilder, bop: str,
+                  exprL: ir.Value, exprL_type: WappaType,
+                  exprR: ir.Value, exprR_type: WappaType,
+                  fast_math: Tuple[str, ...] = ()
+                  ) -> Optional[Tuple[ir.Value, WappaType]]:
+        """Returns the result of an operator and its type, converting the
+        operands to a common type first, floating-point ones with the
+        'fast_math' flags"""
 
-        if bop in ['<', '<=', '>=', '>']:
-            if exprL_int and exprR_int:
-                return builder.icmp_signed(bop, exprL, exprR)
+        if bop == '&&':
+            return builder.and_(exprL, exprR), BoolType
 
-            if exprL_int:
-                exprL = builder.sitofp(exprL, exprL_type.ir_type)
+        if bop == '||':
+            return builder.or_(exprL, exprR), BoolType
 
-            if exprR_int:
-                exprR = builder.sitofp(exprL, exprR_type.ir_type)
+        wtype = common_type(bop, exprL_type, exprR_type)
+        floating = wtype in FloatTypes
 
-            return builder.fcmp_ordered(bop, exprL, exprR)
+        exprL = convert(builder, exprL, exprL_type, wtype)
+        exprR = convert(builder, exprR, exprR_type, wtype)
 
-        if bop == '==':
-            if exprL_int and exprR_int:
-                return builder.icmp_signed(bop, exprL, exprR)
+        if bop in ['<', '<=', '>=', '>', '==', '!=']:
+            if not floating:
+                return builder.icmp_signed(bop, exprL, exprR), BoolType
 
-            if exprL_int:
-                exprL = builder.sitofp(exprL, exprL_type.ir_type)
+            if bop == '!=':
+                return builder.fcmp_unordered(
+                    bop, exprL, exprR, flags=fast_math), BoolType
 
-            if exprR_int:
-                exprR = builder.sitofp(exprL, exprR_type.ir_type)
+            return builder.fcmp_ordered(
+                bop, exprL, exprR, flags=fast_math), BoolType
 
-            return builder.fcmp_ordered(bop, exprL, exprR)
+        if floating:
+            op = {
+                '+': builder.fadd,
+                '-': builder.fsub,
+                '*': builder.fmul,
+                '/': builder.fdiv,
+                '%': builder.frem
+            }.get(bop)
 
-        if bop == '!=':
-            if exprL_int and exprR_int:
-                return builder.icmp_signed(bop, exprL, exprR)
+        else:
+            op = {
+                '+': builder.add,
+                '-': builder.sub,
+                '*': builder.mul,
+                '//': builder.sdiv,
+                '%': builder.srem,
+                '<<': builder.shl,
+                '>>': builder.ashr,
+                '>>>': builder.lshr,
+                '&': builder.and_,
+                '|': builder.or_,
+                '^': builder.xor
+            }.get(bop)
+
+        if op is None:
+            return None
 
-            if exprL_int:
-                exprL = builder.sitofp(exprL, exprL_type.ir_type)
+        if floating:
+            return op(exprL, exprR, flags=fast_math), wtype
 
-            if exprR_int:
-                exprR = builder.sitofp(exprL, exprR_type.ir_type)
+        return op(exprL, exprR), wtype
 
-            return builder.fcmp_unordered(bop, exprL, exprR)
+    def __evaluate(self, exprL: Literal, exprR: Literal) -> Optional[Literal]:
+        """Returns the literal result of the operator, when it can be
+        computed at compile time"""
 
-        # if bop == '**':
+        bop = self.bop
+        a, b = exprL.value, exprR.value
+        exprL_type, exprR_type = exprL.type_of(), exprR.type_of()
 
-        # if bop in ['**', '*', '%', '-', '<<', '>>', '>>>', '<=', '>=', '<',
-        #            '>', '&', '^', '|', '==', '!=', '&&', '||', '=', '+=',
-        #            '-=', '*=', '&=', '|=', '^=', '<<=', '>>=', '>>>=', '%=']:
-        #     data = (exprL, bop, exprR)
+        if a is None or b is None:
+            return None
+
+        if bop in ['&&', '||']:
+            if exprL_type != BoolType or exprR_type != BoolType:
+                return None
+
+            return literal(self.pos, a and b if bop == '&&' else a or b,
+                           BoolType)
+
+        wtype = common_type(bop, exprL_type, exprR_type)
+
+        if wtype in FloatTypes:
+            a, b = float(a), float(b)
+        elif wtype in IntTypes:
+            a, b = int(a), int(b)
+        elif wtype != BoolType:
+            return None
+
+        if bop in ['<', '<=', '>=', '>', '==', '!=']:
+            return literal(self.pos, {
+                '<': a < b, '<=': a <= b, '>=': a >= b, '>': a > b,
+                '==': a == b, '!=': a != b
+            }[bop], BoolType)
+
+        if wtype == BoolType:
+            if bop not in ['&', '|', '^']:
+                return None
+
+        elif bop in ['+', '-', '*']:
+            return literal(self.pos, {
+                '+': lambda: a + b, '-': lambda: a - b, '*': lambda: a * b
+            }[bop](), wtype)
+
+        elif wtype in FloatTypes:
+            # Left to runtime, for its infinities and NaNs
+            if b == 0 or bop not in ['/', '%']:
+                return None
+
+            return literal(self.pos, a / b if bop == '/' else math.fmod(a, b),
+                           wtype)
+
+        width = wtype.ir_type.width
 
-        #     if minify:
-        #         return "({}{}{})".format(*data)
+        if bop in ['//', '%']:
+            # Division by zero and overflow are undefined at runtime
+            if b == 0 or (a == -(1 << (width - 1)) and b == -1):
+                return None
 
-        #     return "({} {} {})".format(*data)
+            # Both truncate towards zero, like 'sdiv' and 'srem'
+            q = abs(a) // abs(b) * (1 if (a < 0) == (b < 0) else -1)
+            return literal(self.pos, q if bop == '//' else a - q * b, wtype)
+
+        if bop in ['<<', '>>', '>>>']:
+            if not 0 <= b < width:
+                return None
+
+            if bop == '<<':
+                return literal(self.pos, a << b, wtype)
+
+            if bop == '>>':
+                return literal(self.pos, a >> b, wtype)
+
+            return literal(self.pos, (a % (1 << width)) >> b, wtype)
+
+        if bop in ['&', '|', '^']:
+            return literal(self.pos, {
+                '&': a & b, '|': a | b, '^': a ^ b
+            }[bop], wtype)
+
+        return None
+
+        # if bop == '**':
 
         # converter = {
         #     '<=>': '<>=',
@@ -405,13 +786,6 @@ class BinaryOPExpression(Expression):
         #     '~=': '~==',
         #     '//=': '/='
         # }
-        # if bop in converter.keys():
-        #     data = (exprL, converter[bop], exprR)
-
-        #     if minify:
-        #         return "({}{}{})".format(*data)
-
-        #     return "({} {} {})".format(*data)
 
         # if bop == '+':
         #     if self.exprL.type_of() == StringType:
@@ -419,9 +793,6 @@ class BinaryOPExpression(Expression):
 
         #     return "{}+{}".format(exprL, exprR)
 
-        # if bop == '/':
-        #     return "({}/double({}))".format(exprL, exprR)
-
         # if bop == '//':
         #     return "floor({}/{})".format(exprL, exprR)
 
@@ -431,37 +802,23 @@ class BinaryOPExpression(Expression):
         # if bop == '|>':
         #     return "({}({}))".format(exprR, exprL)
 
-        # if bop == '**=':
-        #     data = (exprL, exprR)
 
-        #     if minify:
-        #         return "({0}={0}**{1})".format(*data)
+class TernaryOPExpression(CompoundExpression):
+    __slots__ = ('exprL', 'top', 'exprC', 'exprR')
 
-        #     return "({0} = {0} ** {1})".format(*data)
-
-        # if bop == '/=':
-        #     data = (exprL, exprR)
-
-        #     if minify:
-        #         return "({0}={0}/double({1}))".format(*data)
-
-        #     return "({0} = {0} / double({1}))".format(*data)
-
-        WappaException(
-            "FATAL", "Unhandled Binary Operator {}".format(bop), self.tok)
-        return bop
-
-
-class TernaryOPExpression(Expression):
     def __init__(self, tok: Token, exprL: Expression, exprC: Expression,
                  exprR: Expression):
-        self.tok = tok
+        self.line, self.column = tok.line, tok.column
 
         self.exprL = exprL
         self.exprC = exprC
         self.exprR = exprR
 
-    def type_of(self):
+    @property
+    def operands(self) -> List[Expression]:
+        return [self.exprL, self.exprC, self.exprR]
+
+    def type_node(self) -> Optional[WappaType]:
         return self.exprC.type_of()
 
     @property
@@ -471,10 +828,57 @@ class TernaryOPExpression(Expression):
         except AttributeError:
             return None
 
-    def compile(self, module: ir.Module, builder: ir.IRBuilder,
-                symbols: SymbolTable) -> ir.Value:
-        data = (self.exprL.compile(module, builder, symbols),
-                self.exprC.compile(module, builder, symbols),
-                self.exprR.compile(module, builder, symbols))
+    def fold_node(self) -> Any:
+        self.exprL = exprL = yield self.exprL
+        self.exprC = exprC = yield self.exprC
+        self.exprR = exprR = yield self.exprR
+
+        if isinstance(exprL, Literal) and exprL.type_of() == BoolType:
+            if exprL.value:
+                return exprC
+
+            if exprR.type_of() == exprC.type_of():
+                return exprR
+
+        return self
+
+    def compile_node(self, module: ir.Module, builder: ir.IRBuilder,
+                     symbols: SymbolTable) -> Any:
+        wtype = self.type_of()
+        cond = yield self.exprL
+
+        # Operands that are cheap and cannot have side effects are both
+        # evaluated and selected between, the rest only on their branch
+        if all(isinstance(e, Literal) or
+               (isinstance(e, Reference) and e.parent is None)
+               for e in (self.exprC, self.exprR)):
+            exprC = yield self.exprC
+            exprR = yield self.exprR
+
+            return builder.select(
+                cond, exprC, convert(builder, exprR, self.exprR.type_of(),
+                                     wtype))
+
+        then = builder.append_basic_block('ternary.then')
+        otherwise = builder.append_basic_block('ternary.else')
+        end = builder.append_basic_block('ternary.end')
+
+        builder.cbranch(cond, then, otherwise)
+
+        builder.position_at_end(then)
+        exprC = yield self.exprC
+        then = builder.block
+        builder.branch(end)
+
+        builder.position_at_end(otherwise)
+        exprR = convert(builder, (yield self.exprR), self.exprR.type_of(),
+                        wtype)
+        otherwise = builder.block
+        builder.branch(end)
+
+        builder.position_at_end(end)
+        ret = builder.phi(exprC.type)
+        ret.add_incoming(exprC, then)
+        ret.add_incoming(exprR, otherwise)
 
-        return builder.select(*data)
+        return ret
@@ -11,9 +11,12 @@ if TYPE_CHECKING:
 
 
 class Field:
+    __slots__ = ('line', 'column', 'ID', 'object_type', 'access_type',
+                 'modifiers', 'value')
+
     def __init__(self, tok, ID: str, object_type: WappaType, access_type: str,
                  modifiers: Tuple[str] = None, value: Expression = None):
-        self.tok = tok
+        self.line, self.column = tok.line, tok.column
         self.ID = ID
         self.object_type = object_type
         self.access_type = access_type
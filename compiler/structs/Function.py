@@ -4,10 +4,12 @@ from typing import TYPE_CHECKING, List, Optional, Tuple
 
 import llvmlite.ir as ir
 
-from ..type_system import UnitType
+from ..type_system import BoolType, UnitType
+from ..util import entry_alloca
 from .Symbols import SymbolTable
 
 if TYPE_CHECKING:
+    from ..options import CompileOptions
     from .Block import Block
     from .Type import WappaType
 
@@ -16,9 +18,11 @@ class Function:
     def __init__(self, ID: str,
                  modifiers: Tuple[bool, bool, Optional[str], Optional[str]],
                  parameters: List[Tuple[str, WappaType]],
-                 ret_type: Optional[WappaType], block: Block):
-        self.scope = block.scope
+                 ret_type: Optional[WappaType], block: Optional[Block]):
+        # No block when only declared, by a signature pre-pass
+        self.scope = block.scope if block is not None else None
         self.ID = ID
+        self.modifiers = modifiers
         self.parameters = parameters
         self.ret_type = ret_type
         self.block = block
@@ -28,37 +32,110 @@ class Function:
     def inline(self, args: List[str]) -> str:
         return ""
 
+    def modifier_names(self) -> Tuple[str, ...]:
+        """Returns the modifiers as written, e.g. ('const', 'private')"""
+
+        immutable, override, visibility, inheritance = self.modifiers
+
+        return tuple(filter(None, ('const' if immutable else None,
+                                   'override' if override else None,
+                                   visibility, inheritance)))
+
+    @property
+    def public(self) -> bool:
+        return self.modifiers[2] in [None, '', 'public']
+
+    def internal(self, options: CompileOptions) -> bool:
+        """Whether only its own module can call it, so it can be given
+        internal linkage and the fast calling convention"""
+
+        return options.internalize and not options.tiered and not self.public
+
+    def declare(self, module: ir.Module,
+                options: CompileOptions) -> ir.Function:
+        """Returns a declaration of the function usable from 'module'"""
+
+        try:
+            return module.get_global(self.ID)
+        except KeyError:
+            ret = ir.Function(module, self.__func_type(), name=self.ID)
+
+            # Nothing compiled from Wappa can throw
+            ret.attributes.add('nounwind')
+
+            # Declared 'bool' in the C header, which C passes and returns
+            # extended from the i1
+            if self.public:
+                if self.ret_type == BoolType:
+                    ret.return_value.add_attribute('zeroext')
+
+                for arg, (_, wtype) in zip(ret.args, self.parameters):
+                    if wtype == BoolType:
+                        arg.add_attribute('zeroext')
+
+            # Calls take their convention from the callee when emitted,
+            # which can be before its definition
+            if self.internal(options):
+                ret.calling_convention = 'fastcc'
+
+            return ret
+
     def compile(self, module: ir.Module, builder: ir.IRBuilder,
                 symbols: SymbolTable) -> ir.Value:
+        if self.block is None and not self.compiled:
+            # Called before its definition was parsed
+            return self.declare(module, symbols.options)
+
         if not self.compiled:
             self.compiled = True
 
-            parameters = []
-            for p in self.parameters:
-                ir_type = p[1].ir_type
-                if isinstance(p[1], Class):
-                    ir_type = ir_type.as_pointer()
+            self.func_type = self.__func_type()
+
+            # Reusing a declaration left by a call parsed before it
+            self.func = self.declare(module, symbols.options)
 
-                parameters.append(ir_type)
+            if self.internal(symbols.options):
+                self.func.linkage = 'internal'
 
-            self.func_type = ir.FunctionType(self.ret_type.ir_type, parameters)
+            func = self.func
+            if symbols.options.tiered:
+                func, calls = self.__tier(module)
 
-            self.func = ir.Function(module, self.func_type, name=self.ID)
+            for attribute in symbols.options.attributes_for(
+                    self.modifier_names()):
+                func.attributes.add(attribute)
 
             symbols = SymbolTable(parent=symbols)
+            symbols.fast_math = symbols.options.fast_math_for(self.ID)
+            symbols.ret_type = self.ret_type
+
+            entry = func.append_basic_block('entry')
+            body = func.append_basic_block('body')
+
+            builder = ir.IRBuilder(body)
 
             for i, p in enumerate(self.parameters):
-                self.func.args[i].name = p[0]
+                func.args[i].name = p[0]
+
+                # Spilled like any other local, so they can be assigned to
+                ptr = entry_alloca(builder, func.args[i].type, p[0])
+                builder.store(func.args[i], ptr)
+
+                symbols.add_symbol(p[0], ptr)
 
-                symbols.add_symbol(p[0], self.func.args[i])
+            if self.parameters and self.parameters[0][0] == 'self':
+                self.__mark_self(func.args[0])
 
-            block = self.func.append_basic_block('entry')
+            if symbols.options.tiered:
+                builder.atomic_rmw(
+                    'add', calls, ir.Constant(calls.value_type, 1),
+                    'monotonic')
 
-            builder = ir.IRBuilder(block)
+            if symbols.options.fold_constants:
+                self.block = self.block.fold()
 
             self.block.compile(module, builder, symbols)
 
-            block = builder.block
             if not builder.block.is_terminated:
                 if self.ret_type == UnitType:
                     builder.ret_void()
@@ -66,15 +143,71 @@ class Function:
                 else:
                     builder.unreachable()
 
+            ir.IRBuilder(entry).branch(body)
+
             return self.func
+
+        # Compiled into another module, e.g. a separate incremental fragment
+        elif self.func.module is not module:
+            return self.declare(module, symbols.options)
+
         else:
             return self.func
 
+    def __mark_self(self, arg: ir.Argument):
+        """Marks a method's 'self' non-null and, when nothing else the
+        method is passed or can load could point to the same object,
+        'noalias'"""
+
+        arg.add_attribute('nonnull')
+
+        fields = self.parameters[0][1].ir_type.elements
+        others = self.func_type.args[1:]
+
+        if not any(isinstance(t, ir.PointerType) for t in [*fields, *others]):
+            arg.add_attribute('noalias')
+
+    def __tier(self, module: ir.Module
+               ) -> Tuple[ir.Function, ir.GlobalVariable]:
+        """Makes 'self.func' a stub calling through '<ID>.impl', and returns
+        the function to compile the body into with its call counter"""
+
+        body = ir.Function(module, self.func_type, name=self.ID + '.body')
+
+        impl = ir.GlobalVariable(
+            module, self.func_type.as_pointer(), self.ID + '.impl')
+        impl.initializer = body
+
+        calls = ir.GlobalVariable(module, ir.IntType(64), self.ID + '.calls')
+        calls.initializer = ir.Constant(calls.value_type, 0)
+
+        builder = ir.IRBuilder(self.func.append_basic_block('entry'))
+        ret = builder.call(builder.load(impl), self.func.args, tail=True)
+
+        if self.ret_type == UnitType:
+            builder.ret_void()
+        else:
+            builder.ret(ret)
+
+        return body, calls
+
+    def __func_type(self) -> ir.FunctionType:
+        parameters = []
+        for p in self.parameters:
+            ir_type = p[1].ir_type
+            if isinstance(p[1], Class):
+                ir_type = ir_type.as_pointer()
+
+            parameters.append(ir_type)
+
+        return ir.FunctionType(self.ret_type.ir_type, parameters)
+
 
 class NativeFunction(Function):
     def __init__(self, ID, parameters: List[Tuple[str, WappaType]],
                  ret_type: Optional[WappaType]):
         self.ID = ID
+        self.modifiers = (False, False, None, None)
         self.parameters = parameters
         self.ret_type = ret_type
 
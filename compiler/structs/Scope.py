@@ -1,22 +1,83 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+from collections import Counter
+from typing import (TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple,
+                    Union)
 
 import llvmlite.ir as ir
 
 from gen.Wappa import Token
 
 from ..util import WappaException
+from .Type import WappaType
 
 if TYPE_CHECKING:
     from .Field import Field
     from .Function import Function
-    from .Type import WappaType
     from .Variable import Variable
 
     Symbol = Union[WappaType, Field, Function, Variable]
 
 
+class SymbolIndex:
+    """Resolves identifiers across the scopes sharing it
+
+    The scopes entered while parsing, each nested in the one entered
+    before it, push their declarations onto a stack per identifier, popped
+    when they are exited, so from the innermost one an identifier resolves
+    to the top of its stack. Lookups from any other scope, e.g. one looked
+    into after it was exited, walk up its parents instead, and are memoized
+    by each scope until the identifier is declared again anywhere, as only
+    a new declaration can shadow it.
+    """
+
+    def __init__(self):
+        self.declarations: Dict[str, int] = {}
+
+        # The innermost entered scope, and the symbols each ID is declared
+        # as in the entered scopes, innermost last
+        self.innermost: Optional[Scope] = None
+        self.bindings: Dict[str, List[Tuple[Scope, Symbol]]] = {}
+
+        self.lookups = 0
+        # Lookups resolved by the stacks, and by a memoized resolution
+        self.indexed = 0
+        self.hits = 0
+        # Lookups of IDs declared nowhere up the chain
+        self.unresolved = 0
+        # Lookups by the number of scopes up their symbol was found
+        self.depths: Counter = Counter()
+
+    def declare(self, scope: Scope, ID: str, symbol: Symbol):
+        self.declarations[ID] = self.declarations.get(ID, 0) + 1
+
+        if not scope.entered:
+            return
+
+        stack = self.bindings.setdefault(ID, [])
+
+        # Declared in a scope other than the innermost one, e.g. a function
+        # once its body's scopes were exited, so below those nested in it
+        i = len(stack)
+        while i > 0 and stack[i - 1][0].level > scope.level:
+            i -= 1
+
+        if i > 0 and stack[i - 1][0] is scope:
+            # Redefining a forward declaration, or a conflicting one
+            stack[i - 1] = (scope, symbol)
+        else:
+            stack.insert(i, (scope, symbol))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "lookups": self.lookups,
+            "indexed": self.indexed,
+            "hits": self.hits,
+            "unresolved": self.unresolved,
+            "depths": dict(sorted(self.depths.items())),
+        }
+
+
 class Scope:
     def __init__(self, module: ir.Module, parent: Scope = None):
         self.owner: Optional[Symbol] = None
@@ -24,25 +85,130 @@ class Scope:
         self.parent = parent
         self.symbol_table: Dict[str, Symbol] = {}
 
+        # Shared by the whole chain of scopes, and what each ID resolved to
+        # from this one, with the number of declarations of it at the time
+        self.index = parent.index if parent is not None else SymbolIndex()
+        self.resolved: Dict[str, Tuple[int, Optional[Symbol], int]] = {}
+
+        # The number of scopes it is nested in, and whether its declarations
+        # are on the index's stacks, see 'enter'
+        self.level: int = parent.level + 1 if parent is not None else 0
+        self.entered = False
+
+        # IDs of the functions and classes referenced from this scope,
+        # shared with nested scopes; None when not tracked
+        self.references: Optional[Set[str]] = None
+        if parent is not None:
+            self.references = parent.references
+
+        # IDs declared ahead by a signature pre-pass, whose definitions
+        # replace them instead of conflicting
+        self.forward: Set[str] = set()
+
+    def enter(self):
+        """Makes it the innermost scope, nested in the previous innermost
+        one, e.g. while parsing a block, until 'exit'"""
+
+        index = self.index
+
+        if index.innermost is not self.parent:
+            raise AssertionError("Entered a scope outside the innermost one")
+
+        index.innermost = self
+        self.entered = True
+
+        # Declared before, e.g. a class's members by a signature pre-pass
+        for ID, symbol in self.symbol_table.items():
+            index.bindings.setdefault(ID, []).append((self, symbol))
+
+    def exit(self):
+        index = self.index
+
+        if index.innermost is not self:
+            raise AssertionError("Exited a scope other than the innermost one")
+
+        for ID in self.symbol_table:
+            stack = index.bindings[ID]
+            stack.pop()
+
+            if not stack:
+                del index.bindings[ID]
+
+        index.innermost = self.parent
+        self.entered = False
+
     def add_symbol(self, tok: Token, ID: str, symbol: Symbol):
-        if ID in self.symbol_table.keys():
+        ID = WappaType.idgen.intern(ID)
+
+        if ID in self.forward:
+            self.forward.discard(ID)
+
+        elif ID in self.symbol_table.keys():
             WappaException(
                 'ERROR', "Conflicting declaration of '{}'".format(ID), tok)
 
         self.symbol_table[ID] = symbol
+        self.index.declare(self, ID, symbol)
 
-    def get_symbol(self, tok: Token, ID: str, WappaException: bool = True
+    def get_symbol(self, tok: Token, ID: str, report: bool = True
                    ) -> Optional[Symbol]:
-        try:
-            return self.symbol_table[ID]
-        except KeyError:
-            if self.parent is not None:
-                return self.parent.get_symbol(tok, ID)
+        index = self.index
+        index.lookups += 1
+
+        if self is index.innermost:
+            index.indexed += 1
+            stack = index.bindings.get(ID)
+
+            if stack:
+                scope, symbol = stack[-1]
+                depth = self.level - scope.level
+            else:
+                symbol, depth = None, self.level + 1
+
+        else:
+            declarations = index.declarations.get(ID, 0)
+            resolved = self.resolved.get(ID)
+
+            if resolved is not None and resolved[0] == declarations:
+                index.hits += 1
+                _, symbol, depth = resolved
+
             else:
-                if WappaException:
-                    WappaException(
-                        'ERROR', "Unknown identifier '{}'".format(ID), tok)
-                return None
+                symbol, depth = self.__resolve(ID)
+                self.resolved[ID] = (declarations, symbol, depth)
+
+        if symbol is None:
+            index.unresolved += 1
+
+            if report:
+                WappaException(
+                    'ERROR', "Unknown identifier '{}'".format(ID), tok)
+            return None
+
+        index.depths[depth] += 1
+
+        if (self.references is not None
+                and isinstance(symbol, (Class, Function))):
+            self.references.add(ID)
+
+        return symbol
+
+    def __resolve(self, ID: str) -> Tuple[Optional[Symbol], int]:
+        """Returns the symbol an ID refers to from this scope, and the number
+        of scopes up it is declared"""
+
+        scope = self
+        depth = 0
+
+        while scope is not None:
+            symbol = scope.symbol_table.get(ID)
+            if symbol is not None:
+                return symbol, depth
+
+            scope = scope.parent
+            depth += 1
+
+        return None, depth
 
     def symbols(self, keys: bool = False, values: bool = False
                 ) -> List[Union[str, Symbol, Tuple[str, Symbol]]]:
@@ -62,3 +228,8 @@ class Scope:
             return 1 + self.parent.depth()
 
         return 1
+
+
+if True:
+    from .Class import Class
+    from .Function import Function
@@ -1,99 +1,117 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Any, List, Optional
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union
 
 import llvmlite.ir as ir
 
 from gen.Wappa import Token
 
+from ..type_system import BoolType, IntTypes, convert
+from ..util import Position, entry_alloca
+
+from .Expression import (BinaryOPExpression, Expression, Literal,
+                         PostfixOPExpression, PrefixOPExpression, Reference,
+                         common_type, literal)
+from .Symbols import SymbolTable
+
 if TYPE_CHECKING:
     from .Block import Block
-    from .Expression import Expression
-    from .Symbols import SymbolTable
     from .Type import WappaType
 
 
 class Statement:
+    __slots__ = ('line', 'column', 'text')
+
     def __init__(self, tok: Token, text: str = ""):
-        self.tok = tok
+        self.line, self.column = tok.line, tok.column
         self.text = text
 
+    @property
+    def pos(self) -> Position:
+        return Position(self.line, self.column)
+
+    def fold(self) -> Union[Statement, Block]:
+        """Returns the statement with its constant expressions evaluated and
+        the branches they rule out removed"""
+
+        return self
+
     def compile(self, module: ir.Module, builder: ir.IRBuilder,
                 symbols: SymbolTable) -> ir.Value:
         return self.text
 
 
 class IfStatement(Statement):
+    __slots__ = ('if_expr', 'if_block', 'elsif_exprs', 'elsif_blocks',
+                 'else_block')
+
     def __init__(self, tok: Token, if_expr: Expression, if_block: Block,
                  elsif_exprs: List[Expression] = [],
                  elsif_blocks: List[Block] = [],
                  else_block: Optional[Block] = None):
-        self.tok = tok
+        self.line, self.column = tok.line, tok.column
         self.if_expr = if_expr
         self.if_block = if_block
         self.elsif_exprs = elsif_exprs
         self.elsif_blocks = elsif_blocks
         self.else_block = else_block
 
+    def fold(self) -> Union[Statement, Block]:
+        exprs: List[Expression] = []
+        blocks: List[Block] = []
+        else_block = self.else_block.fold() if self.else_block else None
+
+        for expr, block in zip([self.if_expr, *self.elsif_exprs],
+                               [self.if_block, *self.elsif_blocks]):
+            expr = expr.fold()
+
+            if not (isinstance(expr, Literal) and expr.type_of() == BoolType):
+                exprs.append(expr)
+                blocks.append(block.fold())
+
+            # Always taken, so it is the else of the branches before it
+            elif expr.value:
+                else_block = block.fold()
+                break
+
+        if not exprs:
+            return else_block or Statement(self.pos)
+
+        self.if_expr, *self.elsif_exprs = exprs
+        self.if_block, *self.elsif_blocks = blocks
+        self.else_block = else_block
+
+        return self
+
     def compile(self, module: ir.Module, builder: ir.IRBuilder,
                 symbols: SymbolTable) -> ir.Value:
-        if len(self.elsif_exprs) == 0:
-            if self.else_block:
-                with builder.if_else(self.if_expr.compile(
-                        module, builder, symbols)) as (then, otherwise):
-                    with then:
-                        self.if_block.compile(module, builder, symbols)
-
-                    with otherwise:
-                        self.else_block.compile(module, builder, symbols)
-
-                    return
-            else:
-                with builder.if_then(
-                        self.if_expr.compile(module, builder, symbols)):
-                    self.if_block.compile(module, builder, symbols)
-
-                return
-
-        def build_elsif(elsifs):
-            expr, block = elsifs
-            with builder.if_else(expr.compile(
-                    module, builder, symbols)) as (then, otherwise):
-                with then:
-                    block.compile(module, builder, symbols)
-
-                with otherwise:
-                    left = len(elsifs)
-                    if left > 2:
-                        build_elsif(elsifs[1:])
-
-                    if left == 2:
-                        expr, block = elsifs[1]
-
-                        if self.else_block:
-                            with builder.if_else(expr.compile(
-                                    module, builder, symbols)) as (then,
-                                                                   otherwise):
-                                with then:
-                                    block.compile(module, builder, symbols)
-
-                                with otherwise:
-                                    self.else_block.compile(
-                                        module, builder, symbols)
-
-                        else:
-                            with builder.if_then(expr.compile(
-                                    module, builder, symbols)):
-                                block.compile(module, builder, symbols)
-
-        with builder.if_else(self.if_expr.compile(
-                module, builder, symbols)) as (then, otherwise):
+        self.__compile_branches(module, builder, symbols, list(zip(
+            [self.if_expr, *self.elsif_exprs],
+            [self.if_block, *self.elsif_blocks])))
+
+    def __compile_branches(self, module: ir.Module, builder: ir.IRBuilder,
+                           symbols: SymbolTable,
+                           branches: List[Tuple[Expression, Block]]):
+        """Compiles the first branch, with the rest nested in its else"""
+
+        (expr, block), rest = branches[0], branches[1:]
+        cond = expr.compile(module, builder, symbols)
+
+        if not rest and not self.else_block:
+            with builder.if_then(cond):
+                block.compile(module, builder, symbols)
+
+            return
+
+        with builder.if_else(cond) as (then, otherwise):
             with then:
-                self.if_block.compile(module, builder, symbols)
+                block.compile(module, builder, symbols)
 
             with otherwise:
-                build_elsif([(self.elsif_exprs[i], self.elsif_blocks[i])
-                             for i in range(len(self.elsif_exprs))])
+                if rest:
+                    self.__compile_branches(module, builder, symbols, rest)
+                else:
+                    self.else_block.compile(module, builder, symbols)
 
         # data: Any = (self.if_expr.compile(minify),
         #              self.if_block.compile(minify))
@@ -126,107 +144,428 @@ class IfStatement(Statement):
         # return ret
 
 
-class WhileStatement(Statement):
+def loop_metadata(module: ir.Module, symbols: SymbolTable
+                  ) -> Optional[ir.MDValue]:
+    """Returns a new 'llvm.loop' node carrying the enabled loop hints"""
+
+    hints = []
+
+    if symbols.options.vectorize_loops:
+        hints.append(module.add_metadata([
+            ir.MetaDataString(module, "llvm.loop.vectorize.enable"),
+            ir.Constant(ir.IntType(1), 1)]))
+
+    if symbols.options.unroll_loops:
+        hints.append(module.add_metadata([
+            ir.MetaDataString(module, "llvm.loop.unroll.enable")]))
+
+    if not hints:
+        return None
+
+    # Loop IDs are distinct self-referencing nodes, which 'add_metadata'
+    # would deduplicate and cannot express
+    loop = ir.MDValue(module, [], name=str(len(module.metadata)))
+    loop.operands = (loop, *hints)
+
+    return loop
+
+
+class LoopStatement(Statement):
+    """Base of the loops, lowered to test, body and exit blocks"""
+
+    __slots__ = ('expr', 'block')
+
+    # Whether the test runs before the first iteration, and whether the loop
+    # exits once it holds rather than once it fails
+    test_first = True
+    until = False
+
+    def fold(self) -> Union[Statement, Block]:
+        self.expr = self.expr.fold()
+        self.block = self.block.fold()
+
+        return self
+
+    def compile(self, module: ir.Module, builder: ir.IRBuilder,
+                symbols: SymbolTable) -> ir.Value:
+        test = builder.append_basic_block('loop.test')
+        body = builder.append_basic_block('loop.body')
+        end = builder.append_basic_block('loop.end')
+
+        builder.branch(test if self.test_first else body)
+
+        builder.position_at_end(test)
+        cond = self.expr.compile(module, builder, symbols)
+
+        if self.until:
+            branch = builder.cbranch(cond, end, body)
+        else:
+            branch = builder.cbranch(cond, body, end)
+
+        # The branch back to the loop's first block carries its metadata
+        latch = None if self.test_first else branch
+
+        builder.position_at_end(body)
+        self.block.compile(module, builder, symbols)
+
+        if not builder.block.is_terminated:
+            branch = builder.branch(test)
+
+            if self.test_first:
+                latch = branch
+
+        loop = loop_metadata(module, symbols)
+        if latch is not None and loop is not None:
+            latch.set_metadata('llvm.loop', loop)
+
+        builder.position_at_end(end)
+
+
+class WhileStatement(LoopStatement):
+    __slots__ = ()
+
     def __init__(self, tok: Token, expr, block):
-        self.tok = tok
+        self.line, self.column = tok.line, tok.column
         self.expr = expr
         self.block = block
 
-    def compile(self, module: ir.Module, builder: ir.IRBuilder,
-                symbols: SymbolTable) -> ir.Value:
-        return "while ({}) {}".format(
-            self.expr.compile(minify), self.block.compile(minify))
 
+class UntilStatement(LoopStatement):
+    __slots__ = ()
+
+    until = True
 
-class UntilStatement(Statement):
     def __init__(self, tok: Token, expr, block):
-        self.tok = tok
+        self.line, self.column = tok.line, tok.column
         self.expr = expr
         self.block = block
 
-    def compile(self, module: ir.Module, builder: ir.IRBuilder,
-                symbols: SymbolTable) -> ir.Value:
-        return "until ({}) {}".format(
-            self.expr.compile(minify), self.block.compile(minify))
 
+class DoWhileStatement(LoopStatement):
+    __slots__ = ()
+
+    test_first = False
 
-class DoWhileStatement(Statement):
     def __init__(self, tok: Token, block, expr):
-        self.tok = tok
+        self.line, self.column = tok.line, tok.column
         self.block = block
         self.expr = expr
 
-    def compile(self, module: ir.Module, builder: ir.IRBuilder,
-                symbols: SymbolTable) -> ir.Value:
-        return "do {} while ({});".format(
-            self.block.compile(minify), self.expr.compile(minify))
 
+class DoUntilStatement(LoopStatement):
+    __slots__ = ()
+
+    test_first = False
+    until = True
 
-class DoUntilStatement(Statement):
     def __init__(self, tok: Token, block, expr):
-        self.tok = tok
+        self.line, self.column = tok.line, tok.column
         self.block = block
         self.expr = expr
 
+
+class ForStatement(Statement):
+    __slots__ = ('init', 'cond', 'update', 'block')
+
+    def __init__(self, tok: Token, init: List[Statement],
+                 cond: Optional[Expression], update: List[Expression],
+                 block: Block):
+        self.line, self.column = tok.line, tok.column
+        self.init = init
+        self.cond = cond
+        self.update = update
+        self.block = block
+
+    def fold(self) -> Union[Statement, Block]:
+        self.init = [s.fold() for s in self.init]
+        self.cond = self.cond.fold() if self.cond else None
+        self.update = [e.fold() for e in self.update]
+        self.block = self.block.fold()
+
+        return self
+
+    def induction(self) -> Optional[Tuple[
+            VariableDeclarationStatement, Expression, str, int]]:
+        """Returns the induction variable, bound, comparison and step of a
+        counted loop, e.g. 'for (var i = 0; i < n; i++)'
+
+        The bound must not change inside the loop, and neither the body nor
+        the bound may assign to the induction variable.
+        """
+
+        if len(self.init) != 1 or len(self.update) != 1:
+            return None
+
+        decls = self.init[0]
+        if not (isinstance(decls, VariableDeclarationsStatement)
+                and len(decls.var_statements) == 1):
+            return None
+
+        decl = decls.var_statements[0]
+        if decl.var_type not in IntTypes or decl.initializer is None:
+            return None
+
+        def is_var(expr: Expression) -> bool:
+            return (isinstance(expr, Reference) and expr.parent is None
+                    and expr.ID == decl.ID)
+
+        cond = self.cond
+        if not (isinstance(cond, BinaryOPExpression)
+                and cond.bop in ['<', '<=', '>', '>=', '!=']):
+            return None
+
+        if is_var(cond.exprL):
+            bound, pred = cond.exprR, cond.bop
+        elif is_var(cond.exprR):
+            bound, pred = cond.exprL, {
+                '<': '>', '<=': '>=', '>': '<', '>=': '<=', '!=': '!='
+            }[cond.bop]
+        else:
+            return None
+
+        if bound.type_of() not in IntTypes:
+            return None
+
+        if isinstance(bound, Reference):
+            if bound.parent is not None or bound.ID in assigned(self.block):
+                return None
+        elif not isinstance(bound, Literal):
+            return None
+
+        update = self.update[0]
+        if (isinstance(update, (PostfixOPExpression, PrefixOPExpression))
+                and is_var(update.expr)):
+            uop = getattr(update, 'postfix', getattr(update, 'prefix', None))
+            step = {'++': 1, '--': -1}.get(uop)
+
+        elif (isinstance(update, BinaryOPExpression)
+                and update.bop in ['+=', '-='] and is_var(update.exprL)
+                and isinstance(update.exprR, Literal)
+                and update.exprR.type_of() in IntTypes):
+            step = update.exprR.value
+            if update.bop == '-=':
+                step = -step
+
+            # Added in the variable's type, wrapping as '+=' would
+            step = literal(self.pos, step, decl.var_type).value
+
+        else:
+            return None
+
+        if step is None or decl.ID in assigned(self.block):
+            return None
+
+        return decl, bound, pred, step
+
     def compile(self, module: ir.Module, builder: ir.IRBuilder,
                 symbols: SymbolTable) -> ir.Value:
-        return "do {} until ({});".format(
-            self.block.compile(minify), self.expr.compile(minify))
+        symbols = SymbolTable(parent=symbols)
+
+        induction = self.induction()
+        if induction is None:
+            return self.__compile_generic(module, builder, symbols)
+
+        decl, bound, pred, step = induction
+        var_type = decl.var_type
+        ir_type = var_type.ir_type
+
+        # Compared in the type the condition would be, e.g. an Int variable
+        # against a Long bound in Long
+        cmp_type = common_type(pred, var_type, bound.type_of())
+
+        start = convert(
+            builder, decl.initializer.compile(module, builder, symbols),
+            decl.initializer.type_of(), var_type)
+        limit = convert(builder, bound.compile(module, builder, symbols),
+                        bound.type_of(), cmp_type)
+
+        preheader = builder.block
+        header = builder.append_basic_block('for.header')
+        body = builder.append_basic_block('for.body')
+        latch = builder.append_basic_block('for.latch')
+        end = builder.append_basic_block('for.end')
+
+        builder.branch(header)
+
+        builder.position_at_end(header)
+        var = builder.phi(ir_type, name=decl.ID)
+        var.add_incoming(start, preheader)
+
+        builder.cbranch(builder.icmp_signed(
+            pred, convert(builder, var, var_type, cmp_type), limit),
+            body, end)
+
+        builder.position_at_end(body)
+
+        # Never assigned in the body, so the phi stands in for the variable
+        body_symbols = SymbolTable(parent=symbols)
+        body_symbols.add_symbol(decl.ID, var)
+
+        self.block.compile(module, builder, body_symbols)
+
+        if not builder.block.is_terminated:
+            builder.branch(latch)
+
+        builder.position_at_end(latch)
+        # Without 'nsw', so it wraps like the generic update, e.g. for
+        # 'i <= n' with 'n' the type's maximum
+        var_next = builder.add(var, ir.Constant(ir_type, step),
+                               name=decl.ID + '.next')
+        var.add_incoming(var_next, latch)
+
+        branch = builder.branch(header)
+
+        loop = loop_metadata(module, symbols)
+        if loop is not None:
+            branch.set_metadata('llvm.loop', loop)
+
+        builder.position_at_end(end)
+
+    def __compile_generic(self, module: ir.Module, builder: ir.IRBuilder,
+                          symbols: SymbolTable):
+        for s in self.init:
+            s.compile(module, builder, symbols)
+
+        test = builder.append_basic_block('for.test')
+        body = builder.append_basic_block('for.body')
+        latch = builder.append_basic_block('for.latch')
+        end = builder.append_basic_block('for.end')
+
+        builder.branch(test)
+
+        builder.position_at_end(test)
+        if self.cond is None:
+            builder.branch(body)
+        else:
+            builder.cbranch(
+                self.cond.compile(module, builder, symbols), body, end)
+
+        builder.position_at_end(body)
+        self.block.compile(module, builder, symbols)
+
+        if not builder.block.is_terminated:
+            builder.branch(latch)
+
+        builder.position_at_end(latch)
+        for expr in self.update:
+            expr.compile(module, builder, symbols)
+
+        branch = builder.branch(test)
+
+        loop = loop_metadata(module, symbols)
+        if loop is not None:
+            branch.set_metadata('llvm.loop', loop)
+
+        builder.position_at_end(end)
 
 
 class ReturnStatement(Statement):
+    __slots__ = ('expr',)
+
     def __init__(self, tok: Token, expr: Expression = None):
-        self.tok = tok
+        self.line, self.column = tok.line, tok.column
         self.expr = expr
 
+    def fold(self) -> Union[Statement, Block]:
+        if self.expr is not None:
+            self.expr = self.expr.fold()
+
+        return self
+
     def compile(self, module: ir.Module, builder: ir.IRBuilder,
                 symbols: SymbolTable) -> ir.Value:
         expr = self.expr
         if expr is None:
             builder.ret_void()
         else:
-            builder.ret(self.expr.compile(module, builder, symbols))
+            builder.ret(convert(
+                builder, expr.compile(module, builder, symbols),
+                expr.type_of(), symbols.ret_type))
 
 
 class VariableDeclarationStatement(Statement):
+    __slots__ = ('typed_var', 'var_type', 'ID', 'initializer')
+
     def __init__(self, tok: Token, typed_var: str,
                  var_type: Optional[WappaType], ID: str,
                  initializer: Optional[Expression]):
-        self.tok = tok
+        self.line, self.column = tok.line, tok.column
         self.typed_var = typed_var
         self.var_type = var_type
         self.ID = ID
         self.initializer = initializer
 
+    def fold(self) -> Union[Statement, Block]:
+        if self.initializer:
+            self.initializer = self.initializer.fold()
+
+        return self
+
     def compile(self, module: ir.Module, builder: ir.IRBuilder,
                 symbols: SymbolTable) -> ir.Value:
-        var_type = 'let'
-        if self.var_type:
-            var_type = self.var_type.ID
+        ir_type = self.var_type.ir_type
+
+        # Class instances are held by pointer, as they are passed
+        if isinstance(ir_type, ir.IdentifiedStructType):
+            ir_type = ir_type.as_pointer()
 
-        initializer: Any = self.initializer
+        # Compiled before the variable is in scope, so it still sees any
+        # outer one it shadows, as 'var x = x + 1' does
+        initializer = self.initializer
         if initializer:
-            initializer = "= {};".format(initializer.compile(minify))
+            value = convert(
+                builder, initializer.compile(module, builder, symbols),
+                initializer.type_of(), self.var_type)
 
-        return "{} {} {}".format(var_type, self.ID, initializer or ";")
+        ptr = entry_alloca(builder, ir_type, self.ID)
+        symbols.add_symbol(self.ID, ptr)
+
+        if initializer:
+            builder.store(value, ptr)
+
+        return ptr
 
 
 class VariableDeclarationsStatement(Statement):
+    __slots__ = ('var_statements',)
+
     def __init__(self, tok: Token,
                  var_statements: List[VariableDeclarationStatement]):
-        self.tok = tok
+        self.line, self.column = tok.line, tok.column
         self.var_statements = var_statements
 
+    def fold(self) -> Union[Statement, Block]:
+        for x in self.var_statements:
+            x.fold()
+
+        return self
+
     def compile(self, module: ir.Module, builder: ir.IRBuilder,
                 symbols: SymbolTable) -> ir.Value:
-        return "".join([x.compile(minify) for x in self.var_statements])
+        for x in self.var_statements:
+            x.compile(module, builder, symbols)
 
 
 class ExprStatement(Statement):
+    __slots__ = ('expr',)
+
     def __init__(self, tok: Token, expr: Expression):
-        self.tok = tok
+        self.line, self.column = tok.line, tok.column
         self.expr = expr
 
+    def fold(self) -> Union[Statement, Block]:
+        self.expr = self.expr.fold()
+
+        # Nothing left to evaluate
+        if isinstance(self.expr, Literal):
+            return Statement(self.pos)
+
+        return self
+
     def compile(self, module: ir.Module, builder: ir.IRBuilder,
                 symbols: SymbolTable) -> ir.Value:
         self.expr.compile(module, builder, symbols)
+
+
+if True:
+    from ..traversal import assigned
@@ -1,13 +1,34 @@
 from __future__ import annotations
 
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
 import llvmlite.ir as ir
 
+from ..options import CompileOptions
+
+if TYPE_CHECKING:
+    from .Type import WappaType
+
 
 class SymbolTable:
-    def __init__(self, parent: SymbolTable = None):
+    def __init__(self, parent: SymbolTable = None,
+                 options: CompileOptions = None):
         self.parent = parent
+
+        if parent is not None:
+            self.options = parent.options
+        else:
+            self.options = options or CompileOptions()
+
+        # Fast-math flags of the enclosing function's floating-point math
+        self.fast_math: Tuple[str, ...] = (
+            parent.fast_math if parent is not None else self.options.fast_math)
+
+        # Declared return type of the enclosing function, returned values
+        # are converted to
+        self.ret_type: Optional[WappaType] = (
+            parent.ret_type if parent is not None else None)
+
         self.symbol_table: Dict[str, ir.Value] = {}
         self.element_table: Dict[str, List[str]] = {}
         self.function_table: Dict[str, Dict[str, ir.Function]]
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, List
+from collections import Counter
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple
 
 import llvmlite.ir as ir
 
@@ -13,8 +14,97 @@ if TYPE_CHECKING:
     from .Scope import Symbol
 
 
+class TypeIndex:
+    """Numbers the types of a compilation, giving each the bitset of its
+    ancestors, so subtype tests are a single AND however large the hierarchy
+
+    A type's supertypes are fixed when it is created, so adding a type never
+    changes the bitsets, nor the linearizations, of those before it.
+    """
+
+    def __init__(self, base: Optional[TypeIndex] = None):
+        # Carries on from the index the builtin types were numbered in
+        self.size = base.size if base is not None else 0
+
+        # Bits given back by 'release', handed out again before new ones,
+        # and those handed out since the last call to 'claimed'
+        self.free: List[int] = []
+        self.added: List[int] = []
+
+    def add(self, wtype: WappaType):
+        if self.free:
+            slot = self.free.pop()
+        else:
+            slot = self.size
+            self.size += 1
+
+        wtype.bit = 1 << slot
+        self.added.append(slot)
+
+        ancestors = wtype.bit
+        for stype in wtype.supertypes:
+            ancestors |= stype.ancestors
+
+        wtype.ancestors = ancestors
+
+    def claimed(self) -> List[int]:
+        """Returns the bits handed out since the last call, e.g. to the
+        types of a declaration"""
+
+        ret, self.added = self.added, []
+
+        return ret
+
+    def release(self, slots: List[int]):
+        """Gives back bits, once no type left has them among its ancestors,
+        e.g. those of a declaration and of the ones referencing it"""
+
+        self.free.extend(slots)
+
+    def linearize(self, wtype: WappaType) -> Tuple[WappaType, ...]:
+        """Returns the type and its supertypes in C3 order, computed once"""
+
+        if wtype.linearization is None:
+            wtype.linearization = (wtype,) + merge(
+                [self.linearize(s) for s in wtype.supertypes] +
+                [wtype.supertypes])
+
+        return wtype.linearization
+
+
+def merge(sequences: List[Sequence[WappaType]]) -> Tuple[WappaType, ...]:
+    """Merges linearizations, keeping the order of each"""
+
+    ret = []
+    merged = set()
+    heads = [0] * len(sequences)
+
+    # How many times each type is in a sequence, behind its head
+    behind = Counter(id(t) for s in sequences for t in s[1:])
+
+    while True:
+        candidates = [s[h] for s, h in zip(sequences, heads) if h < len(s)]
+        if not candidates:
+            return tuple(ret)
+
+        # Without a consistent order, the first head is taken anyway
+        head = next((c for c in candidates if not behind[id(c)]),
+                    candidates[0])
+
+        ret.append(head)
+        merged.add(id(head))
+
+        for i, s in enumerate(sequences):
+            while heads[i] < len(s) and id(s[heads[i]]) in merged:
+                heads[i] += 1
+
+                if heads[i] < len(s):
+                    behind[id(s[heads[i]])] -= 1
+
+
 class WappaType:
     tsolver: TypeSolver = None
+    tindex: TypeIndex = TypeIndex()
     idgen: IDGenerator = IDGenerator()
 
     def __init__(self, ID: str, ir_type: ir.Value = None,
@@ -25,16 +115,12 @@ class WappaType:
         self.ID = ID
         self.ir_type = ir_type
         self.supertypes = supertypes
+        self.linearization: Optional[Tuple[WappaType, ...]] = None
 
-    def is_a(self, other: WappaType) -> bool:
-        if self is other:
-            return True
-
-        for stype in self.supertypes:
-            if stype.is_a(other):
-                return True
+        WappaType.tindex.add(self)
 
-        return False
+    def is_a(self, other: WappaType) -> bool:
+        return (self.ancestors & other.bit) != 0
 
     def get_symbol(self, tok: Token, ID: str) -> Symbol:
         raise NotImplementedError(
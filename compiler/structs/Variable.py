@@ -13,6 +13,8 @@ if TYPE_CHECKING:
 
 
 class Variable:
+    __slots__ = ('ID', 'var_type')
+
     def __init__(self, ID: str, var_type: WappaType):
         self.ID = ID
         self.var_type = var_type
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import threading
+from ctypes import c_int64, c_void_p
+from typing import List, Set
+
+import llvmlite.binding as llvm
+
+from .optimizer import Pipeline, optimize
+
+
+class TieredJIT:
+    """Runs a cheaply optimized module and, on a background thread,
+    recompiles the functions called more than 'threshold' times
+
+    The module must have been compiled with 'CompileOptions(tiered=True)',
+    so every function '<ID>' is a stub calling through '<ID>.impl' and its
+    body counts calls in '<ID>.calls'. A hot body is re-optimized by
+    'pipeline' as '<ID>.tier2' in a module of its own, and swapped in by
+    overwriting its '<ID>.impl' entry.
+    """
+
+    def __init__(self, tm: llvm.TargetMachine, llvm_module: llvm.ModuleRef,
+                 threshold: int = 1000, pipeline: Pipeline = None,
+                 interval: float = 0.05):
+        self.threshold = threshold
+        self.pipeline = pipeline or Pipeline()
+        self.interval = interval
+
+        self.bitcode = llvm_module.as_bitcode()
+        self.functions: List[str] = [
+            f.name[:-len('.body')] for f in llvm_module.functions
+            if f.name.endswith('.body')]
+        self.promoted: Set[str] = set()
+
+        self.ee = llvm.create_mcjit_compiler(llvm_module, tm)
+        self.ee.finalize_object()
+
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def get_function_address(self, name: str) -> int:
+        with self.lock:
+            return self.ee.get_function_address(name)
+
+    def calls(self, ID: str) -> int:
+        with self.lock:
+            address = self.ee.get_global_value_address(ID + '.calls')
+
+        return c_int64.from_address(address).value
+
+    def promote(self, ID: str):
+        llvm_module = llvm.parse_bitcode(self.bitcode)
+
+        # Everything but the hot body is already in the engine; keeping the
+        # rest as 'available_externally' still lets it be inlined
+        for f in llvm_module.functions:
+            if f.name == ID + '.body':
+                f.name = ID + '.tier2'
+
+            elif not f.is_declaration:
+                f.linkage = 'available_externally'
+
+        for g in llvm_module.global_variables:
+            if not g.is_declaration:
+                g.linkage = 'available_externally'
+
+        optimize(llvm_module, self.pipeline)
+
+        with self.lock:
+            self.ee.add_module(llvm_module)
+
+            address = self.ee.get_function_address(ID + '.tier2')
+            impl = self.ee.get_global_value_address(ID + '.impl')
+
+            c_void_p.from_address(impl).value = address
+
+        self.promoted.add(ID)
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+
+        self.ee.close()
+
+    def __run(self):
+        while not self.stopped.wait(self.interval):
+            for ID in self.functions:
+                if ID not in self.promoted and (
+                        self.calls(ID) >= self.threshold):
+                    self.promote(ID)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
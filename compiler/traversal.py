@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Any, Iterator, Set, Tuple, Union
+
+from .structs.Block import Block
+from .structs.Expression import (ASSIGNMENT_OPS, BinaryOPExpression,
+                                 Expression, PostfixOPExpression,
+                                 PrefixOPExpression, Reference)
+from .structs.Statement import Statement
+
+Node = Union[Block, Expression, Statement]
+
+
+@lru_cache(maxsize=None)
+def slots(cls: type) -> Tuple[str, ...]:
+    """Returns the names of the attributes of a class' nodes"""
+
+    return tuple(name for c in cls.__mro__
+                 for name in c.__dict__.get('__slots__', ()))
+
+
+def children(node: Node) -> Iterator[Node]:
+    """Yields the blocks, statements and expressions directly in a node"""
+
+    stack: list = [getattr(node, name, None) for name in slots(type(node))]
+
+    while stack:
+        value: Any = stack.pop()
+
+        if isinstance(value, (Block, Expression, Statement)):
+            yield value
+
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+
+
+def walk(node: Node) -> Iterator[Node]:
+    """Yields a node and everything nested in it"""
+
+    stack = [node]
+
+    while stack:
+        node = stack.pop()
+        yield node
+
+        stack.extend(children(node))
+
+
+def assigned(node: Node) -> Set[str]:
+    """Returns the IDs of the variables assigned to anywhere in a node"""
+
+    ret = set()
+
+    for n in walk(node):
+        if isinstance(n, BinaryOPExpression) and n.bop in ASSIGNMENT_OPS:
+            target = n.exprL
+
+        elif isinstance(n, PostfixOPExpression) and n.postfix in ['++', '--']:
+            target = n.expr
+
+        elif isinstance(n, PrefixOPExpression) and n.prefix in ['++', '--']:
+            target = n.expr
+
+        else:
+            continue
+
+        if isinstance(target, Reference) and target.parent is None:
+            ret.add(target.ID)
+
+    return ret
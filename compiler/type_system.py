@@ -1,58 +1,106 @@
 from __future__ import annotations
 
-from functools import lru_cache
-from typing import Iterable, List, Optional, Tuple, Any
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Tuple
 
 import llvmlite.ir as ir
 
 from .structs.Type import WappaType
 from .util import methoddispatch
 
+CACHE_SIZE = 4096
+EVICTION_POLICIES = ["lru", "fifo"]
 
-class TypeSolver:
-    @lru_cache()
-    def linearize_hierarchy(self, wtype: WappaType) -> Iterable[WappaType]:
-        """Returns the supertypes, linearized, increasing in distance"""
 
-        supertypes = []
+class SolverCache:
+    """A bounded cache of a TypeSolver's results, evicting the least recently
+    used entry first, or with 'fifo', the oldest"""
+
+    def __init__(self, size: int = CACHE_SIZE, eviction: str = "lru"):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(
+                'eviction must be in: {}'.format(EVICTION_POLICIES))
+
+        self.size = size
+        self.eviction = eviction
+        self.entries: OrderedDict = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        try:
+            ret = self.entries[key]
 
-        supertypes.append(wtype)
+        except KeyError:
+            self.misses += 1
+
+            ret = self.entries[key] = compute()
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+            return ret
+
+        self.hits += 1
+
+        if self.eviction == "lru":
+            self.entries.move_to_end(key)
+
+        return ret
 
-        for stype in wtype.supertypes:
-            if stype in supertypes:
-                continue
+    def clear(self):
+        self.entries.clear()
 
-            for sstype in self.linearize_hierarchy(stype):
-                if sstype not in supertypes:
-                    for index, ssstype in enumerate(supertypes):
-                        if sstype.is_a(ssstype):
-                            supertypes.insert(index, stype)
-                            break
-                    else:
-                        supertypes.append(sstype)
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def cached(method: Callable) -> Callable:
+    """Caches a TypeSolver method's results, which must be immutable, in
+    the solver's own cache"""
+
+    @wraps(method)
+    def wrapper(self, *args):
+        return self.cache.get(
+            (method,) + args, lambda: method(self, *args))
+
+    return wrapper
+
+
+class TypeSolver:
+    """Answers questions about the type hierarchy, caching the answers
+
+    Each compilation has its own, so its cache never outlives the types.
+    """
+
+    def __init__(self, cache_size: int = CACHE_SIZE, eviction: str = "lru"):
+        self.cache = SolverCache(cache_size, eviction)
+
+    def linearize_hierarchy(self, wtype: WappaType
+                            ) -> Tuple[WappaType, ...]:
+        """Returns the supertypes, linearized, increasing in distance"""
 
-        return supertypes
+        return WappaType.tindex.linearize(wtype)
 
-    @lru_cache()
+    @cached
     def shared_hierarchy(
-            self, wtypes: Iterable[WappaType]) -> List[WappaType]:
+            self, wtypes: Tuple[WappaType, ...]) -> Tuple[WappaType, ...]:
         """Returns the intersection of their linearized hierarchies"""
 
         if len(wtypes) < 2:
             raise ValueError("'nce' Must have at least 2 types given")
 
-        ret = self.linearize_hierarchy(wtypes[0])
-
-        for wtype in wtypes[1:]:
-            for r in ret:
-                if not wtype.is_a(r):
-                    ret.remove(r)
-
-        return ret
+        return tuple(r for r in self.linearize_hierarchy(wtypes[0])
+                     if all(wtype.is_a(r) for wtype in wtypes[1:]))
 
     @methoddispatch
-    def ncas(self, wtypes) -> Optional[WappaType]:
-        """Returns the nearest common ancestor"""
+    def ncas(self, wtypes) -> Tuple[WappaType, ...]:
+        """Returns the nearest common ancestors"""
 
         raise TypeError(
             "'wtypes' must be an [list, set, tuple], is {}".format(
@@ -60,16 +108,16 @@ class TypeSolver:
 
     @ncas.register(list)
     @ncas.register(set)
-    def _(self, wtypes: Iterable[WappaType]) -> Optional[WappaType]:
+    def _(self, wtypes: Iterable[WappaType]) -> Tuple[WappaType, ...]:
         return self.ncas(tuple(wtypes))
 
     @ncas.register(tuple)
-    @lru_cache()
-    def _(self, wtypes: Tuple[WappaType]) -> Optional[WappaType]:
+    @cached
+    def _(self, wtypes: Tuple[WappaType, ...]) -> Tuple[WappaType, ...]:
         if len(wtypes) < 2:
             raise ValueError("'nca' Must have at least 2 types given")
 
-        ret = [wtypes[0]]
+        ret = (wtypes[0],)
         for wtype in wtypes[1:]:
             tmp = []
 
@@ -78,15 +126,15 @@ class TypeSolver:
 
             ret = self.__simplify_hierarchy(tmp)
 
-            if ret == [] or ret[0] == AnyType:
+            if ret == () or ret[0] == AnyType:
                 return ret
 
         return ret
 
-    @lru_cache()
+    @cached
     def _ncas(self, wtype_1: WappaType, wtype_2: WappaType
-              ) -> List[WappaType]:
-        """Returns the nearest common ancestor"""
+              ) -> Tuple[WappaType, ...]:
+        """Returns the nearest common ancestors"""
 
         ret = []
 
@@ -97,13 +145,12 @@ class TypeSolver:
             ret.append(wtype_1)
 
         else:
-            genealogy = self.linearize_hierarchy(wtype_1)
             for stype in self.linearize_hierarchy(wtype_2):
-                if (stype in genealogy and
+                if (wtype_1.is_a(stype) and
                         (len(ret) == 0 or not ret[-1].is_a(stype))):
                     ret.append(stype)
 
-        return ret
+        return tuple(ret)
 
     # TODO: After protocols/interfades/multiple inheritance
     # def intersect(self, wtypes: List[WappaType]) -> Optional[WappaType]:
@@ -120,7 +167,7 @@ class TypeSolver:
     #         prev = wtype
 
     @methoddispatch
-    def __simplify_hierarchy(self, wtypes) -> List[WappaType]:
+    def __simplify_hierarchy(self, wtypes) -> Tuple[WappaType, ...]:
         """Returns a simplified hierarchy"""
 
         raise TypeError(
@@ -129,12 +176,12 @@ class TypeSolver:
 
     @__simplify_hierarchy.register(list)
     @__simplify_hierarchy.register(set)
-    def _(self, wtypes: Iterable[WappaType]) -> List[WappaType]:
+    def _(self, wtypes: Iterable[WappaType]) -> Tuple[WappaType, ...]:
         return self.__simplify_hierarchy(tuple(wtypes))
 
     @__simplify_hierarchy.register(tuple)
-    @lru_cache()
-    def _(self, wtypes: Tuple[WappaType]) -> List[WappaType]:
+    @cached
+    def _(self, wtypes: Tuple[WappaType, ...]) -> Tuple[WappaType, ...]:
         ret = [wtypes[0]]
 
         for item in wtypes[1:]:
@@ -149,7 +196,7 @@ class TypeSolver:
                 else:
                     ret.append(item)
 
-        return ret
+        return tuple(ret)
 
     def __intersect_lists(self, list_1: list, list_2: list) -> list:
         """Returns the items in both lists"""
@@ -193,6 +240,9 @@ UnitType = WappaType("Unit", ir.VoidType(), supertypes=[AnyType])
 
 NothingType = WappaType("Nothing")
 
+# Each compilation numbers its own types after these, see 'TypeIndex'
+BUILTIN_INDEX = WappaType.tindex
+
 IntTypes = [LongType, IntType, ShortType, ByteType]
 FloatTypes = [DoubleType, FloatType]
 
@@ -258,3 +308,45 @@ class UnionType(WappaType):
 
 def make_constant(typ: WappaType, constant: Any) -> ir.Constant:
     return ir.Constant(typ.ir_type, constant)
+
+
+def convert(builder: ir.IRBuilder, value: ir.Value, from_type: WappaType,
+            to_type: WappaType) -> ir.Value:
+    """Converts a numeric value between types, other values are returned
+    unchanged"""
+
+    if from_type is None or to_type is None or from_type == to_type:
+        return value
+
+    src, dst = from_type.ir_type, to_type.ir_type
+
+    if src is None or dst is None or src == dst:
+        return value
+
+    if isinstance(src, ir.IntType):
+        if isinstance(dst, ir.IntType):
+            if src.width > dst.width:
+                return builder.trunc(value, dst)
+
+            if from_type == BoolType:
+                return builder.zext(value, dst)
+
+            return builder.sext(value, dst)
+
+        if to_type in FloatTypes:
+            if from_type == BoolType:
+                return builder.uitofp(value, dst)
+
+            return builder.sitofp(value, dst)
+
+    if from_type in FloatTypes:
+        if isinstance(dst, ir.IntType):
+            return builder.fptosi(value, dst)
+
+        if to_type == DoubleType:
+            return builder.fpext(value, dst)
+
+        if to_type == FloatType:
+            return builder.fptrunc(value, dst)
+
+    return value
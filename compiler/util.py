@@ -1,7 +1,10 @@
 from __future__ import annotations
 
 from functools import singledispatch, update_wrapper
-from typing import List, Tuple
+from types import GeneratorType
+from typing import Any, Callable, Generator, List, NamedTuple, Tuple
+
+import llvmlite.ir as ir
 
 from gen.Wappa import Token
 
@@ -12,6 +15,14 @@ severity_levels = {
     "INFO"
 }
 
+
+class Position(NamedTuple):
+    """Where a node starts, standing in for its Token once parsed"""
+
+    line: int
+    column: int
+
+
 EXCEPTION_LIST: List[Tuple[str, str, str, Token]] = []
 
 
@@ -35,6 +46,55 @@ def WappaException(severity: str, arg: str, tok: Token):
     #     exit(1)
 
 
+def print_exceptions():
+    for exception in sorted(set(EXCEPTION_LIST), key=lambda x: x[2]):
+        print("[{}] - {} at line {}".format(*exception))
+
+
+def entry_alloca(builder: ir.IRBuilder, ir_type: ir.Type, name: str = ''
+                 ) -> ir.AllocaInstr:
+    """Allocates a local in the function's entry block, where mem2reg/SROA
+    can promote it to a register
+
+    Code is never generated into the entry block itself, it only holds the
+    allocas and branches to the function's body.
+    """
+
+    entry = builder.function.entry_basic_block
+
+    return ir.IRBuilder(entry).alloca(ir_type, name=name)
+
+
+def trampoline(node: Any, step: Callable[[Any], Any]) -> Any:
+    """Returns 'step(node)', without recursing into the nodes it needs
+
+    'step' returns either a node's result, or a generator that yields the
+    nodes whose results it needs, is sent each result back, and returns its
+    own. Those generators are kept on an explicit stack instead of Python's,
+    so the depth of the nodes is only limited by memory.
+    """
+
+    stack: List[Generator] = []
+    value = step(node)
+
+    while True:
+        if isinstance(value, GeneratorType):
+            stack.append(value)
+            value = None
+
+        elif not stack:
+            return value
+
+        try:
+            node = stack[-1].send(value)
+        except StopIteration as e:
+            stack.pop()
+            value = e.value
+            continue
+
+        value = step(node)
+
+
 def methoddispatch(func):
     dispatcher = singledispatch(func)
 
@@ -1,11 +1,14 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Any, List, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Iterable, List, Optional, Tuple
 
 import llvmlite.ir as ir
 
 from gen.WappaVisitor import WappaVisitor as BaseVisitor
 
+from .attributes import infer_attributes
+from .IDGenerator import IDGenerator
+from .options import CompileOptions
 from .structs.Block import Block
 from .structs.Class import Class
 from .structs.Expression import (BinaryOPExpression, Expression,
@@ -16,16 +19,17 @@ from .structs.Field import Field
 from .structs.Function import Function
 from .structs.Scope import Scope
 from .structs.Statement import (DoUntilStatement, DoWhileStatement,
-                                ExprStatement, IfStatement, ReturnStatement,
-                                Statement, UntilStatement,
+                                ExprStatement, ForStatement, IfStatement,
+                                ReturnStatement, Statement, UntilStatement,
                                 VariableDeclarationsStatement,
                                 VariableDeclarationStatement, WhileStatement)
 from .structs.Symbols import SymbolTable
-from .structs.Type import WappaType
+from .structs.Type import TypeIndex, WappaType
 from .structs.Variable import Variable
-from .type_system import (BoolType, DoubleType, IntType, NilType, ObjectType,
-                          PrimitiveTypes, StringType, UnitType)
-from .util import EXCEPTION_LIST, WappaException
+from .type_system import (BUILTIN_INDEX, BoolType, DoubleType, IntType,
+                          NilType, ObjectType, PrimitiveTypes, StringType,
+                          TypeSolver, UnitType)
+from .util import WappaException, print_exceptions, trampoline
 
 if TYPE_CHECKING:
     from gen.Wappa import Token, Wappa
@@ -34,13 +38,30 @@ if TYPE_CHECKING:
 
 
 class WappaVisitor(BaseVisitor):
-    def __init__(self):
-        self.module = ir.Module()
+    def __init__(self, options: CompileOptions = None,
+                 tindex: TypeIndex = None, externals: Iterable[Function] = ()):
+        self.options = options or CompileOptions()
+
+        # A context per visitor, so identified class types never clash with
+        # those of an earlier compilation in the same process
+        self.module = ir.Module(context=ir.Context())
+
+        # Likewise, a numbering of its types after the builtin ones, unless
+        # given one whose types it can still meet, and a solver whose cache
+        # is dropped along with them
+        WappaType.tindex = tindex or TypeIndex(BUILTIN_INDEX)
+        WappaType.tsolver = TypeSolver()
+
+        # Names everything in the module, see 'IDGenerator'
+        self.idgen = WappaType.idgen = IDGenerator()
 
         self.ref_scope = Scope(self.module)
         self.global_scope = Scope(self.module, parent=self.ref_scope)
         self.scope = [self.global_scope]
 
+        self.ref_scope.enter()
+        self.global_scope.enter()
+
         self.ref_scope.add_symbol(None, "Bool", BoolType)
         self.ref_scope.add_symbol(None, "Int", IntType)
         self.ref_scope.add_symbol(None, "Double", DoubleType)
@@ -48,24 +69,51 @@ class WappaVisitor(BaseVisitor):
         self.ref_scope.add_symbol(None, "Nil", NilType)
         self.ref_scope.add_symbol(None, "Unit", UnitType)
 
+        # Functions defined in other modules, e.g. the public ones of the
+        # other files the driver links with this one, which the file's own
+        # declarations shadow
+        for function in externals:
+            self.ref_scope.add_symbol(None, function.ID, function)
+
         BaseVisitor.__init__(self)
 
         self.builder = ir.IRBuilder()
 
-        self.idgen = WappaType.idgen
-
-    def visit(self, tree) -> str:
+    def visit(self, tree) -> ir.Module:
         BaseVisitor.visit(self, tree)
 
-        symbols = SymbolTable()
+        return self.compile()
+
+    def compile(self) -> ir.Module:
+        """Compiles every global declaration into the module, and returns
+        it, see 'to_llvm'"""
+
+        symbols = SymbolTable(options=self.options)
         for obj in self.global_scope.symbols(values=True):
             if hasattr(obj, 'compile'):
                 obj.compile(self.module, self.builder, symbols)
 
-        for exception in sorted(set(EXCEPTION_LIST), key=lambda x: x[3]):
-            print("[{}] - {} at line {}".format(*exception))
+        infer_attributes(self.module.functions)
+
+        print_exceptions()
 
-        return str(self.module)
+        return self.module
+
+    def visitTranslationUnit(self, ctx: Wappa.TranslationUnitContext):
+        for declaration in ctx.getChildren():
+            self.visitDeclaration(declaration)
+
+    def visitDeclaration(self, ctx: Any) -> Symbol:
+        """Visits a top-level declaration, recording what it references"""
+
+        # Inherited by every scope opened while visiting the declaration
+        self.global_scope.references = set()
+
+        ctx.accept(self)
+
+        self.global_scope.references = None
+
+        return self.global_scope.symbol_table[str(ctx.IDENTIFIER())]
 
     def visitClassDeclaration(
             self, ctx: Wappa.ClassDeclarationContext) -> None:
@@ -78,22 +126,58 @@ class WappaVisitor(BaseVisitor):
         else:
             parent, interfaces = ObjectType, []
 
+        self.open_class(ctx.start, ID, parent, interfaces,
+                        self.visitClassModifiers(ctx.classModifiers()))
+
+        self.visitClassBlock(ctx.classBlock())
+
+        self.close_class()
+
+    def open_class(self, tok: Token, ID: str, parent: WappaType,
+                   interfaces: List[WappaType],
+                   modifiers: Tuple[str, str]) -> Class:
+        """Declares a class and enters its scope, for its members"""
+
         self.idgen.append(ID)
-        scope = Scope(self.module, parent=self.scope[-1])
 
-        self.scope[-1].add_symbol(ctx.start, ID, Class(
-            scope, ID, parent, interfaces,
-            self.visitClassModifiers(ctx.classModifiers())))
+        ret = self.scope[-1].symbol_table.get(ID)
+        if isinstance(ret, Class) and ID in self.scope[-1].forward:
+            # Declared by a signature pre-pass, its members are redefined
+            # in place
+            self.scope[-1].forward.discard(ID)
+            scope = ret.scope
+
+        else:
+            scope = Scope(self.module, parent=self.scope[-1])
+
+            ret = Class(scope, ID, parent, interfaces, modifiers)
+            self.scope[-1].add_symbol(tok, ID, ret)
+
+        self.open_scope(scope)
+
+        return ret
+
+    def open_scope(self, scope: Optional[Scope] = None) -> Scope:
+        """Enters a scope, by default a new one nested in the current one,
+        whose declarations shadow those of the scopes around it"""
+
+        if scope is None:
+            scope = Scope(self.module, parent=self.scope[-1])
 
+        scope.enter()
         self.scope.append(scope)
 
-        self.visitClassBlock(ctx.classBlock())
+        return scope
+
+    def close_scope(self):
+        self.scope.pop().exit()
 
-        self.scope.pop()
+    def close_class(self):
+        self.close_scope()
         self.idgen.pop()
 
     def visitClassModifiers(
-            self, ctx: Wappa.ClassModifiersContext) -> Tuple[str, str, str]:
+            self, ctx: Wappa.ClassModifiersContext) -> Tuple[str, str]:
         return (
             self.__safe_text(ctx.visibilityModifier()),
             self.__safe_text(ctx.inheritanceModifier())
@@ -101,17 +185,13 @@ class WappaVisitor(BaseVisitor):
 
     def visitClassParentDeclaration(
             self, ctx: Wappa.ClassParentDeclarationContext
-    ) -> List[WappaType]:
+    ) -> Tuple[WappaType, List[WappaType]]:
         parent = ObjectType
         if ctx.typeName():
             parent = self.visitTypeName(ctx.typeName())
 
-        interfaces = []
-        if ctx.interfaceSpecifierList():
-            interfaces = self.visitInterfaceSpecifierList(
-                ctx.interfaceSpecifierList())
-
-        return parent, interfaces
+        # Interfaces ('fits') are not supported yet
+        return parent, []
 
     def visitClassBlock(self, ctx: Wappa.ClassBlockContext):
         for member in ctx.memberDeclaration():
@@ -134,8 +214,8 @@ class WappaVisitor(BaseVisitor):
                 value = self.visitInnerConstructorCall(value)
 
         self.scope[-1].add_symbol(ctx.start, ID, Field(
-            ctx.start, ID, type_name, ctx.staticTypedVar(),
-            (ctx.visibilityModifier(),), value))
+            ctx.start, ID, type_name, ctx.staticTypedVar().getText(),
+            (self.__safe_text(ctx.visibilityModifier()),), value))
 
     def visitFunctionModifiers(self, ctx: Wappa.FunctionModifiersContext
                                ) -> Tuple[
@@ -146,46 +226,27 @@ class WappaVisitor(BaseVisitor):
                 )
 
     def visitFunctionDeclaration(self, ctx: Wappa.FunctionDeclarationContext):
-        ID = str(ctx.IDENTIFIER())
         modifiers = self.visitFunctionModifiers(ctx.functionModifiers())
 
         parameters: List[Tuple[str, WappaType]] = []
         if ctx.parameterList():
             parameters = self.visitParameterList(ctx.parameterList())
 
-        ret_type = None
+        ret_type = UnitType
         if ctx.returnType():
             ret_type = self.visitReturnType(ctx.returnType())
 
-        scope = Scope(self.module, parent=self.scope[-1])
-        self.scope.append(scope)
-
-        tok = ctx.start
-
-        for p in parameters:
-            ID = p[0]
-            scope.add_symbol(tok, ID, Variable(ID, p[1]))
+        self.open_function(ctx.start, parameters)
 
-        if ctx.expression():
-            expr = ctx.expression()
-
-            if ret_type and ret_type != UnitType:
-                stmt = ReturnStatement(
-                    expr.start, self.visitExpression(expr))
-            else:
-                stmt = ExprStatement(
-                    expr.start, self.visitExpression(expr))
-
-            block = Block(
-                self.scope[-1], [stmt])
+        expr = ctx.expression()
+        if expr:
+            block = self.expression_body(
+                expr.start, self.visitExpression(expr), ret_type)
         else:
             block = self.visitBlock(ctx.block())
 
-        self.scope.pop()
-
-        ID = str(ctx.IDENTIFIER())
-        self.scope[-1].add_symbol(ctx.start, ID, Function(
-            ID, modifiers, parameters, ret_type, block))
+        self.close_function(ctx.start, str(ctx.IDENTIFIER()), modifiers,
+                            parameters, ret_type, block)
 
     def visitMethodDeclaration(self, ctx: Wappa.MethodDeclarationContext):
         modifiers = self.visitFunctionModifiers(ctx.functionModifiers())
@@ -194,39 +255,73 @@ class WappaVisitor(BaseVisitor):
         if ctx.parameterList():
             parameters = self.visitParameterList(ctx.parameterList())
 
-        ret_type = None
+        ret_type = UnitType
         if ctx.returnType():
             ret_type = self.visitReturnType(ctx.returnType())
 
-        scope = Scope(self.module, parent=self.scope[-1])
-        self.scope.append(scope)
+        parameters.insert(0, ('self', self.scope[-1].owner))
 
-        tok = ctx.start
-
-        parameters.insert(0, ('self', scope.parent.owner))
-
-        for p in parameters:
-            ID = p[0]
-            scope.add_symbol(tok, ID, Variable(ID, p[1]))
+        self.open_function(ctx.start, parameters)
 
         expr = ctx.expression()
         if expr:
-            expr_res = self.visitExpression(expr)
+            block = self.expression_body(
+                expr.start, self.visitExpression(expr), ret_type)
+        else:
+            block = self.visitBlock(ctx.block())
 
-            if ret_type and ret_type != UnitType:
-                stmt = ReturnStatement(expr.start, expr_res)
-            else:
-                stmt = ExprStatement(expr.start, expr_res)
+        self.close_function(ctx.start, str(ctx.IDENTIFIER()), modifiers,
+                            parameters, ret_type, block)
+
+    def open_function(self, tok: Token,
+                      parameters: List[Tuple[str, WappaType]]) -> Scope:
+        """Enters a function's scope, holding its parameters"""
+
+        scope = self.open_scope()
+
+        for ID, object_type in parameters:
+            scope.add_symbol(tok, ID, Variable(ID, object_type))
 
-            block = Block(self.scope[-1], [stmt])
+        return scope
+
+    def expression_body(self, tok: Token, expr: Expression,
+                        ret_type: WappaType) -> Block:
+        """Returns the block of a function declared as 'fun f() = expr;'"""
+
+        if ret_type != UnitType:
+            stmt: Statement = ReturnStatement(tok, expr)
         else:
-            block = self.visitBlock(ctx.block())
+            stmt = ExprStatement(tok, expr)
 
-        self.scope.pop()
+        return Block(self.scope[-1], [stmt])
 
-        ID = str(ctx.IDENTIFIER())
-        self.scope[-1].add_symbol(tok, ID, Function(
-            ID, modifiers, parameters, ret_type, block))
+    def close_function(self, tok: Token, ID: str,
+                       modifiers: Tuple[bool, bool, str, str],
+                       parameters: List[Tuple[str, WappaType]],
+                       ret_type: WappaType, block: Block) -> Function:
+        self.close_scope()
+
+        ret = Function(ID, modifiers, parameters, ret_type, block)
+        self.scope[-1].add_symbol(tok, ID, ret)
+
+        return ret
+
+    def declare_function(self, tok: Token, ID: str,
+                         modifiers: Tuple[bool, bool, str, str],
+                         parameters: List[Tuple[str, WappaType]],
+                         ret_type: WappaType) -> Function:
+        """Declares a function by its signature, to be defined later"""
+
+        ret = Function(ID, modifiers, parameters, ret_type, None)
+        self.scope[-1].add_symbol(tok, ID, ret)
+
+        return ret
+
+    def visitReturnType(self, ctx: Wappa.ReturnTypeContext) -> WappaType:
+        if ctx.typeExpression():
+            return self.visitTypeExpression(ctx.typeExpression())
+
+        return UnitType
 
     def visitParameterList(self, ctx: Wappa.ParameterListContext
                            ) -> List[Tuple[str, WappaType]]:
@@ -250,10 +345,15 @@ class WappaVisitor(BaseVisitor):
         if ctx.functionKwarguments():
             kwargs = self.visitFunctionKwarguments(ctx.functionKwarguments())
 
+        return self.function_call(tok, ID, args, kwargs, parent)
+
+    def function_call(self, tok: Token, ID: str, args: List[Expression],
+                      kwargs: List[Tuple[str, Expression]],
+                      parent: Symbol = None) -> Expression:
         if parent:
             ref = parent.get_symbol(tok, ID)
         else:
-            ref = self.__get_symbol(tok, ID)
+            ref = self.get_symbol(tok, ID)
 
         return FunctionCallExpression(tok, ref, args, kwargs)
 
@@ -274,16 +374,31 @@ class WappaVisitor(BaseVisitor):
 
     def visitVariableDeclaration(self, ctx: Wappa.VariableDeclarationContext):
         var_type = ctx.staticTypedVar().getText()
+        name = self.visitVariableDeclaratorId(ctx.variableDeclaratorId())
+
+        initializer = ctx.variableInitializer()
+        if initializer:
+            initializer = self.visitVariableInitializer(initializer)
+
+        type_name = ctx.typeName()
+        if type_name:
+            type_name = self.visitTypeName(type_name)
 
+        return self.variable_declaration(
+            ctx.start, var_type, name, type_name, initializer)
+
+    def variable_declaration(self, tok: Token, var_type: str, name: str,
+                             type_name: Optional[WappaType],
+                             initializer: Optional[Expression]
+                             ) -> Optional[VariableDeclarationStatement]:
         if var_type == 'var':
-            name = self.visitVariableDeclaratorId(ctx.variableDeclaratorId())
+            init_type = None
 
-            initializer = self.visitVariableInitializer(
-                ctx.variableInitializer())
+            if initializer:
+                init_type = initializer.type_of()
 
-            init_type = initializer.type_of()
-            if ctx.typeName():
-                var_act_type = self.visitTypeName(ctx.typeName())
+            if type_name:
+                var_act_type = type_name
             else:
                 var_act_type = init_type
 
@@ -292,13 +407,12 @@ class WappaVisitor(BaseVisitor):
                     WappaException(
                         "ERROR",
                         "Expression of type {}, does not match type {}".format(
-                            init_type.ID, var_act_type.ID), ctx.start)
+                            init_type.ID, var_act_type.ID), tok)
 
-            self.scope[-1].add_symbol(ctx.start, name,
-                                      Variable(name, var_act_type))
+            self.scope[-1].add_symbol(tok, name, Variable(name, var_act_type))
 
             return VariableDeclarationStatement(
-                ctx.start, var_type, var_act_type, name, initializer)
+                tok, var_type, var_act_type, name, initializer)
 
         # TODO: if var_type == 'val':
 
@@ -326,12 +440,11 @@ class WappaVisitor(BaseVisitor):
                 exprs = ctx.expression()
                 blocks = ctx.block()
 
-                scope = Scope(self.module, parent=self.scope[-1])
-                self.scope.append(scope)
+                self.open_scope()
 
                 block = self.visitBlock(blocks[0])
 
-                self.scope.pop()
+                self.close_scope()
 
                 else_block: Any = len(exprs) < len(blocks)
 
@@ -340,28 +453,25 @@ class WappaVisitor(BaseVisitor):
                     elsif_exprs = list(map(self.visitExpression, exprs[1:]))
                     if else_block:
                         for b in blocks[1:-1]:
-                            scope = Scope(self.module, parent=self.scope[-1])
-                            self.scope.append(scope)
+                            self.open_scope()
 
                             elsif_blocks.append(self.visitBlock(b))
 
-                            self.scope.pop()
+                            self.close_scope()
                     else:
                         for b in blocks[1:]:
-                            scope = Scope(self.module, parent=self.scope[-1])
-                            self.scope.append(scope)
+                            self.open_scope()
 
                             elsif_blocks.append(self.visitBlock(b))
 
-                            self.scope.pop()
+                            self.close_scope()
 
                 if else_block:
-                    scope = Scope(self.module, parent=self.scope[-1])
-                    self.scope.append(scope)
+                    self.open_scope()
 
                     else_block = self.visitBlock(blocks[-1])
 
-                    self.scope.pop()
+                    self.close_scope()
 
                 return IfStatement(
                     ctx.start,
@@ -371,45 +481,76 @@ class WappaVisitor(BaseVisitor):
                     elsif_blocks,
                     else_block)
 
+            elif statement_type == "for":
+                self.open_scope()
+
+                ctrl = ctx.forControl()
+
+                init = [self.visitVariableDeclarations(v)
+                        for v in ctrl.variableDeclarations()]
+
+                cond = None
+                if ctrl.expression():
+                    cond = self.visitExpression(ctrl.expression())
+
+                update = []
+                if ctrl.forUpdate is not None:
+                    update = self.visitExpressionList(ctrl.forUpdate)
+
+                block = self.visitBlock(ctx.block(0))
+
+                self.close_scope()
+
+                return ForStatement(ctx.start, init, cond, update, block)
+
             elif statement_type == "while":
-                scope = Scope(self.module, parent=self.scope[-1])
-                self.scope.append(scope)
+                self.open_scope()
 
                 block = self.visitBlock(ctx.block(0))
 
-                self.scope.pop()
+                self.close_scope()
 
                 return WhileStatement(
                     ctx.start, self.visitExpression(ctx.expression(0)), block)
 
             elif statement_type == "until":
-                scope = Scope(self.module, parent=self.scope[-1])
-                self.scope.append(scope)
+                self.open_scope()
 
                 block = self.visitBlock(ctx.block(0))
 
-                self.scope.pop()
+                self.close_scope()
 
                 return UntilStatement(
                     ctx.start, self.visitExpression(ctx.expression(0)), block)
 
             elif statement_type == "do":
-                scope = Scope(self.module, parent=self.scope[-1])
-                self.scope.append(scope)
+                self.open_scope()
 
                 block = self.visitBlock(ctx.block(0))
 
-                self.scope.pop()
+                self.close_scope()
 
                 expr = self.visitExpression(ctx.expression(0))
-                if ctx.doType == "while":
+                if ctx.doType.text == "while":
                     return DoWhileStatement(ctx.start, block, expr)
                 else:
                     return DoUntilStatement(ctx.start, block, expr)
 
             elif statement_type == "return":
-                return ReturnStatement(
-                    ctx.start, self.visitExpression(ctx.expression(0)))
+                expr = ctx.expression(0)
+                if expr:
+                    expr = self.visitExpression(expr)
+
+                return ReturnStatement(ctx.start, expr)
+
+        if ctx.blockLabel is not None:
+            self.open_scope()
+
+            block = self.visitBlock(ctx.blockLabel)
+
+            self.close_scope()
+
+            return block
 
         if ctx.variableDeclarations():
             return self.visitVariableDeclarations(ctx.variableDeclarations())
@@ -427,226 +568,251 @@ class WappaVisitor(BaseVisitor):
         return [self.visitExpression(e) for e in ctx.expression()]
 
     def visitExpression(self, ctx: Wappa.ExpressionContext) -> Expression:
-        if ctx.primary():
-            return self.visitPrimary(ctx.primary())
+        return trampoline(ctx, self.__expression)
+
+    def __expression(self, ctx: Wappa.ExpressionContext) -> Any:
+        """Visits an expression, yielding the subexpressions whose visit it
+        needs, see 'trampoline'"""
+
+        primary = ctx.primary()
+        if primary:
+            if primary.expression():
+                return (yield primary.expression())
+
+            return self.visitPrimary(primary)
 
         tok = ctx.start
 
         if ctx.postfix is not None:
-            expr = self.visitExpression(ctx.expression(0))
-            expr_type = expr.type_of()
+            return self.postfix_expression(
+                tok, (yield ctx.expression(0)), ctx.postfix.text)
 
-            if (hasattr(expr, "text") and expr.text == "ERROR"):
-                return Expression(tok, "ERROR")
+        if ctx.prefix is not None:
+            return self.prefix_expression(
+                tok, ctx.prefix.text, (yield ctx.expression(0)))
 
-            if isinstance(expr, Reference) and not expr.ref:
-                WappaException(
-                    'ERROR', "Unknown identifier '{}'".format(expr.ID), tok)
-                return Expression(tok, "ERROR")
+        if ctx.bop is not None:
+            exprL = yield ctx.expression(0)
+            exprR = yield ctx.expression(1)
 
-            if expr_type is None:
-                WappaException("ERROR", "Expression has no type", tok)
+            return self.binary_expression(tok, exprL, ctx.bop.text, exprR)
 
-            else:
-                postfix = ctx.postfix.text
+        if ctx.top is not None:
+            exprL = yield ctx.expression(0)
+            exprC = yield ctx.expression(1)
+            exprR = yield ctx.expression(2)
 
-                if expr_type in PrimitiveTypes:
-                    return PostfixOPExpression(tok, expr, postfix)
+            return self.ternary_expression(
+                tok, exprL, ctx.top.text, exprC, exprR)
 
-                func_name = self.__magic_method({
-                    '++': 'postinc',
-                    '--': 'postdec'
-                }[postfix])
+        return self.unhandled_expression(tok, ctx.getText())
 
-                ref = expr_type.get_symbol(tok, func_name)
+    def postfix_expression(self, tok: Token, expr: Expression,
+                           postfix: str) -> Expression:
+        expr_type = expr.type_of()
 
-                if ref is None:
-                    return Expression(tok, "ERROR")
+        if (hasattr(expr, "text") and expr.text == "ERROR"):
+            return Expression(tok, "ERROR")
 
-                if isinstance(ref, Function):
-                    return FunctionCallExpression(tok, ref, [], [])
+        if isinstance(expr, Reference) and not expr.ref:
+            WappaException(
+                'ERROR', "Unknown identifier '{}'".format(expr.ID), tok)
+            return Expression(tok, "ERROR")
 
-                WappaException(
-                    "ERROR", "{} is not a function".format(func_name), tok)
+        if expr_type is None:
+            WappaException("ERROR", "Expression has no type", tok)
 
-                return Expression(tok, "ERROR")
+        else:
+            if expr_type in PrimitiveTypes:
+                return PostfixOPExpression(tok, expr, postfix)
 
-        if ctx.prefix is not None:
-            expr = self.visitExpression(ctx.expression(0))
-            expr_type = expr.type_of()
+            func_name = self.__magic_method({
+                '++': 'postinc',
+                '--': 'postdec'
+            }[postfix])
 
-            if (hasattr(expr, "text") and expr.text == "ERROR"):
-                return Expression(tok, "ERROR")
+            ref = expr_type.get_symbol(tok, func_name)
 
-            if isinstance(expr, Reference) and not expr.ref:
-                WappaException(
-                    'ERROR', "Unknown identifier '{}'".format(expr.ID), tok)
+            if ref is None:
                 return Expression(tok, "ERROR")
 
-            if expr_type is None:
-                WappaException("ERROR", "Expression has no type", tok)
-
-                return Expression(tok, "ERROR")
+            if isinstance(ref, Function):
+                return FunctionCallExpression(tok, ref, [], [])
 
-            else:
-                prefix = ctx.prefix.text
+            WappaException(
+                "ERROR", "{} is not a function".format(func_name), tok)
 
-                if (prefix in ['alignof', 'sizeof', 'typeof']
-                        or expr_type in PrimitiveTypes):
-                    return PrefixOPExpression(ctx.start, prefix, expr)
+            return Expression(tok, "ERROR")
 
-                func_name = self.__magic_method({
-                    '!': 'not',
-                    '~': 'inv',
-                    '+': 'pos',
-                    '++': 'preinc',
-                    '-': 'neg',
-                    '--': 'predec'
-                }[prefix])
+    def prefix_expression(self, tok: Token, prefix: str,
+                          expr: Expression) -> Expression:
+        expr_type = expr.type_of()
 
-                ref = expr_type.get_symbol(tok, func_name)
+        if (hasattr(expr, "text") and expr.text == "ERROR"):
+            return Expression(tok, "ERROR")
 
-                if ref is None:
-                    return Expression(tok, "ERROR")
+        if isinstance(expr, Reference) and not expr.ref:
+            WappaException(
+                'ERROR', "Unknown identifier '{}'".format(expr.ID), tok)
+            return Expression(tok, "ERROR")
 
-                if isinstance(ref, Function):
-                    return FunctionCallExpression(tok, ref, [], [])
+        if expr_type is None:
+            WappaException("ERROR", "Expression has no type", tok)
 
-                WappaException(
-                    "ERROR", "{} is not a function".format(func_name), tok)
+            return Expression(tok, "ERROR")
 
+        else:
+            if (prefix in ['alignof', 'sizeof', 'typeof']
+                    or expr_type in PrimitiveTypes):
+                return PrefixOPExpression(tok, prefix, expr)
+
+            func_name = self.__magic_method({
+                '!': 'not',
+                '~': 'inv',
+                '+': 'pos',
+                '++': 'preinc',
+                '-': 'neg',
+                '--': 'predec'
+            }[prefix])
+
+            ref = expr_type.get_symbol(tok, func_name)
+
+            if ref is None:
                 return Expression(tok, "ERROR")
 
-        if ctx.bop is not None:
-            exprL = self.visitExpression(ctx.expression(0))
-            exprR = self.visitExpression(ctx.expression(1))
-            expr_type = exprL.type_of()
+            if isinstance(ref, Function):
+                return FunctionCallExpression(tok, ref, [], [])
 
-            if (hasattr(exprL, "text") and exprL.text == "ERROR"):
-                return Expression(tok, "ERROR")
+            WappaException(
+                "ERROR", "{} is not a function".format(func_name), tok)
 
-            if isinstance(exprL, Reference) and not exprL.ref:
-                WappaException(
-                    'ERROR', "Unknown identifier '{}'".format(exprL.ID), tok)
-                return Expression(tok, "ERROR")
+            return Expression(tok, "ERROR")
 
-            if expr_type is None:
-                WappaException("ERROR", "Expression has no type", tok)
+    def binary_expression(self, tok: Token, exprL: Expression, bop: str,
+                          exprR: Expression) -> Expression:
+        expr_type = exprL.type_of()
 
-                return Expression(tok, "ERROR")
+        if (hasattr(exprL, "text") and exprL.text == "ERROR"):
+            return Expression(tok, "ERROR")
 
-            else:
-                bop = ctx.bop.text
-
-                if (bop in ['&&', '||', '===', '!==', 'is']
-                        or expr_type in PrimitiveTypes):
-                    return BinaryOPExpression(tok, exprL, bop, exprR)
-
-                func_name = self.__magic_method({
-                    '+': 'add',
-                    '-': 'sub',
-                    '*': 'mul',
-                    '**': 'pow',
-                    '/': 'div',
-                    '//': 'ddiv',
-                    '%': 'rem',
-                    '%%': 'mod',
-                    '<<': 'shl',
-                    '>>': 'shr',
-                    '>>>': 'ushr',
-                    '&': 'and',
-                    '|': 'or',
-                    '^': 'xor',
-                    '<': 'lt',
-                    '<=': 'le',
-                    '>': 'gt',
-                    '>=': 'ge',
-                    '==': 'eq',
-                    '!=': 'ne'
-                }[bop])
-
-                # TODO: Infer comparison operators
-                # TODO: Implement assignment operators
-                # a+=b -> a=a.__add__(b)
-                ref = expr_type.get_symbol(tok, func_name)
-
-                if ref is None:
-                    return Expression(tok, "ERROR")
+        if isinstance(exprL, Reference) and not exprL.ref:
+            WappaException(
+                'ERROR', "Unknown identifier '{}'".format(exprL.ID), tok)
+            return Expression(tok, "ERROR")
 
-                if isinstance(ref, Function):
-                    return FunctionCallExpression(tok, ref, [exprR], [])
+        if expr_type is None:
+            WappaException("ERROR", "Expression has no type", tok)
 
-                WappaException(
-                    "ERROR", "{} is not a function".format(func_name), tok)
+            return Expression(tok, "ERROR")
 
+        else:
+            if (bop in ['&&', '||', '===', '!==', 'is', '=']
+                    or expr_type in PrimitiveTypes):
+                return BinaryOPExpression(tok, exprL, bop, exprR)
+
+            func_name = self.__magic_method({
+                '+': 'add',
+                '-': 'sub',
+                '*': 'mul',
+                '**': 'pow',
+                '/': 'div',
+                '//': 'ddiv',
+                '%': 'rem',
+                '%%': 'mod',
+                '<<': 'shl',
+                '>>': 'shr',
+                '>>>': 'ushr',
+                '&': 'and',
+                '|': 'or',
+                '^': 'xor',
+                '<': 'lt',
+                '<=': 'le',
+                '>': 'gt',
+                '>=': 'ge',
+                '==': 'eq',
+                '!=': 'ne'
+            }[bop])
+
+            # TODO: Infer comparison operators
+            # TODO: Implement assignment operators
+            # a+=b -> a=a.__add__(b)
+            ref = expr_type.get_symbol(tok, func_name)
+
+            if ref is None:
                 return Expression(tok, "ERROR")
 
-        if ctx.top is not None:
-            exprL = self.visitExpression(ctx.expression(0))
-            exprC = self.visitExpression(ctx.expression(1))
-            exprR = self.visitExpression(ctx.expression(2))
-            expr_type = exprC.type_of()
+            if isinstance(ref, Function):
+                return FunctionCallExpression(tok, ref, [exprR], [])
 
-            if (hasattr(exprC, "text") and exprC.text == "ERROR"):
-                return Expression(tok, "ERROR")
+            WappaException(
+                "ERROR", "{} is not a function".format(func_name), tok)
 
-            if isinstance(exprC, Reference) and not exprC.ref:
-                WappaException(
-                    'ERROR', "Unknown identifier '{}'".format(exprC.ID), tok)
-                return Expression(tok, "ERROR")
+            return Expression(tok, "ERROR")
 
-            if expr_type is None:
-                WappaException("ERROR", "Expression has no type", tok)
+    def ternary_expression(self, tok: Token, exprL: Expression, top: str,
+                           exprC: Expression, exprR: Expression
+                           ) -> Expression:
+        expr_type = exprC.type_of()
 
-                return Expression(tok, "ERROR")
+        if (hasattr(exprC, "text") and exprC.text == "ERROR"):
+            return Expression(tok, "ERROR")
 
-            else:
-                top = ctx.top.text
+        if isinstance(exprC, Reference) and not exprC.ref:
+            WappaException(
+                'ERROR', "Unknown identifier '{}'".format(exprC.ID), tok)
+            return Expression(tok, "ERROR")
 
-                if top == '?':
-                    return TernaryOPExpression(tok, exprL, exprC, exprR)
+        if expr_type is None:
+            WappaException("ERROR", "Expression has no type", tok)
 
-                elif expr_type in PrimitiveTypes:
-                    otop = {'>': '<', '<': '>'}[top]
-                    exprL = BinaryOPExpression(tok, exprL, top, exprC)
-                    exprR = BinaryOPExpression(tok, exprC, otop, exprR)
-                    return BinaryOPExpression(tok, exprL, '&&', exprR)
+            return Expression(tok, "ERROR")
+
+        else:
+            if top == '?':
+                return TernaryOPExpression(tok, exprL, exprC, exprR)
+
+            elif expr_type in PrimitiveTypes:
+                exprL = BinaryOPExpression(tok, exprL, top, exprC)
+                exprR = BinaryOPExpression(tok, exprC, top, exprR)
+                return BinaryOPExpression(tok, exprL, '&&', exprR)
+
+            if top in ['<', '>']:
+                top = {
+                    '<': 'lt',
+                    '>': 'gt'
+                }[top]
+                func_nameL = self.__magic_method(
+                    {'lt': 'gt', 'gt': 'lt'}[top])
+                func_nameR = self.__magic_method(top)
 
-                if top in ['<', '>']:
-                    top = {
-                        '<': 'lt',
-                        '>': 'gt'
-                    }[top]
-                    func_nameL = self.__magic_method(
-                        {'lt': 'gt', 'gt': 'lt'}[top])
-                    func_nameR = self.__magic_method(top)
-
-                    refL = expr_type.get_symbol(tok, func_nameL)
-                    refR = expr_type.get_symbol(tok, func_nameR)
-
-                    if refL or refR is None:
-                        return Expression(tok, "ERROR")
-
-                    if (isinstance(refL, Function)
-                            and isinstance(refR, Function)):
-                        exprL = FunctionCallExpression(tok, refL, [exprL], [])
-                        exprR = FunctionCallExpression(tok, refR, [exprR], [])
-                        return BinaryOPExpression(tok, exprL, '&&', exprR)
-
-                    if refL is not None and not isinstance(refL, Function):
-                        WappaException(
-                            "ERROR", "{} is not a function".format(func_nameL),
-                            tok)
-
-                    if refR is not None and not isinstance(refR, Function):
-                        WappaException(
-                            "ERROR", "{} is not a function".format(func_nameR),
-                            tok)
+                refL = expr_type.get_symbol(tok, func_nameL)
+                refR = expr_type.get_symbol(tok, func_nameR)
 
+                if refL or refR is None:
                     return Expression(tok, "ERROR")
 
-        WappaException("FATAL", "Unhandled Expression: {}".format(
-            ctx.getText()), tok)
+                if (isinstance(refL, Function)
+                        and isinstance(refR, Function)):
+                    exprL = FunctionCallExpression(tok, refL, [exprL], [])
+                    exprR = FunctionCallExpression(tok, refR, [exprR], [])
+                    return BinaryOPExpression(tok, exprL, '&&', exprR)
+
+                if refL is not None and not isinstance(refL, Function):
+                    WappaException(
+                        "ERROR", "{} is not a function".format(func_nameL),
+                        tok)
+
+                if refR is not None and not isinstance(refR, Function):
+                    WappaException(
+                        "ERROR", "{} is not a function".format(func_nameR),
+                        tok)
+
+                return Expression(tok, "ERROR")
+
+        return self.unhandled_expression(tok, top)
+
+    def unhandled_expression(self, tok: Token, text: str) -> Expression:
+        WappaException("FATAL", "Unhandled Expression: {}".format(text), tok)
 
         return Expression(tok, "FATAL")
 
@@ -662,27 +828,30 @@ class WappaVisitor(BaseVisitor):
 
         ID = ctx.IDENTIFIER()
         if ID:
-            ID = str(ID)
-            return Reference(
-                tok, parent.ref.get_symbol(tok, ID), ID, parent=parent)
+            return self.reference(tok, str(ID), parent)
 
         it = ctx.functionCall()
         if it:
             return self.visitFunctionCall(it, parent=parent.ref)
 
+    def reference(self, tok: Token, ID: str,
+                  parent: Optional[Reference] = None) -> Reference:
+        if parent is not None:
+            return Reference(
+                tok, parent.ref.get_symbol(tok, ID), ID, parent=parent)
+
+        return Reference(tok, self.get_symbol(tok, ID), ID)
+
     def visitReferencePrimary(
             self, ctx: Wappa.ReferencePrimaryContext) -> Reference:
         tok = ctx.start
 
         ID = ctx.IDENTIFIER() or ctx.SELF() or ctx.SUPER()
         if ID:
-            ID = str(ID)
-            return Reference(tok, self.__get_symbol(tok, ID), ID)
+            return self.reference(tok, str(ID))
 
         else:
-            it = ctx.functionCall()
-            ID = str(it.IDENTIFIER())
-            return self.visitFunctionCall(it)
+            return self.visitFunctionCall(ctx.functionCall())
 
     def visitPrimary(self, ctx: Wappa.PrimaryContext):
         it = ctx.expression()
@@ -735,16 +904,16 @@ class WappaVisitor(BaseVisitor):
             return self.visitTypeName(ctx.typeName())
 
     def visitTypeName(self, ctx: Wappa.TypeNameContext) -> WappaType:
-        return self.__get_symbol(ctx.start, ctx.getText())
+        return self.get_symbol(ctx.start, ctx.getText())
 
-    def __get_symbol(self, tok: Token, ID: str) -> Optional[WappaType]:
+    def get_symbol(self, tok: Token, ID: str) -> Optional[WappaType]:
         return self.scope[-1].get_symbol(tok, ID)
 
     def __safe_text(self, ctx, func: str = "getText", default="") -> str:
         if ctx is None:
             return default
 
-        return getattr(ctx, func, default=default)() or default
+        return getattr(ctx, func)() or default
 
     def __magic_method(self, ID: str):
         return "__{}__".format(ID)
@@ -1,8 +1,31 @@
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from ctypes import CFUNCTYPE, c_bool, c_double, c_int
+from typing import IO, Iterable, List, Optional, Sequence, Tuple
+
 import llvmlite.binding as llvm
-from antlr4 import CommonTokenStream, FileStream
-from ctypes import CFUNCTYPE, c_double, c_int, c_bool
 
-from compiler import Wappa, WappaLexer, WappaVisitor
+from compiler import WappaVisitor
+from compiler.cache import CompilationCache
+from compiler.header import (Signature, c_declarations, c_header,
+                             external_functions, signatures)
+from compiler.IDGenerator import IDGenerator
+from compiler.incremental import IncrementalCompiler
+from compiler.input_stream import MmapInputStream
+from compiler.jit import create_lazy_jit
+from compiler.optimizer import (PASSES, PRESETS, Pipeline, function_modifiers,
+                                host_cpu, optimize, to_llvm)
+from compiler.options import FAST_MATH_FLAGS, CompileOptions
+from compiler.parser import Parser
+from compiler.parsing import PREDICTION_MODES, parse
+from compiler.streaming import StreamingCompiler
+from compiler.structs.Type import WappaType
+from compiler.tiering import TieredJIT
+from compiler.util import EXCEPTION_LIST
 
 
 def get_func(ee, name: str, *types):
@@ -10,52 +33,452 @@ def get_func(ee, name: str, *types):
         ee.get_function_address(name))
 
 
-def main(optimize: bool):
-    text = FileStream("test.txt")
-    lexer = WappaLexer(text)
-    tokens = CommonTokenStream(lexer)
-    parser = Wappa(tokens)
-    parser.buildParseTrees = True
+def init_llvm():
+    llvm.initialize()
+    llvm.initialize_native_target()
+    llvm.initialize_native_asmprinter()
+
+
+def reset_globals():
+    # The visitor reports through module-level state, which must not leak
+    # between the files a worker compiles
+    EXCEPTION_LIST.clear()
+    WappaType.idgen = IDGenerator()
+
+
+def dump_file(dump: Optional[str], name: str) -> IO[str]:
+    """Opens a file in the 'dump' directory to write and read back, or a
+    temporary one when not dumping"""
+
+    if dump is None:
+        return tempfile.TemporaryFile("w+", encoding="utf-8")
+
+    os.makedirs(dump, exist_ok=True)
+
+    return open(os.path.join(dump, name), "w+", encoding="utf-8")
+
+
+def modifier_preset(value: str) -> Tuple[str, str]:
+    """Parses a 'MODIFIER=LEVEL' override, e.g. 'private=s'"""
+
+    modifier, _, level = value.partition("=")
+
+    if not modifier or "O" + level not in PRESETS:
+        raise argparse.ArgumentTypeError(
+            "expected MODIFIER=LEVEL, e.g. 'private=s', got '{}'".format(
+                value))
+
+    return modifier, "O" + level
+
+
+def fast_math_flags(value: str) -> Tuple[str, ...]:
+    """Parses comma-separated fast-math flags, e.g. 'nnan,contract'"""
+
+    flags = tuple(value.split(","))
+
+    for flag in flags:
+        if flag not in FAST_MATH_FLAGS:
+            raise argparse.ArgumentTypeError(
+                "unknown fast-math flag '{}', expected one of {}".format(
+                    flag, ", ".join(FAST_MATH_FLAGS)))
+
+    return flags
+
+
+def function_fast_math(value: str) -> Tuple[str, Tuple[str, ...]]:
+    """Parses a 'NAME[=FLAGS]' function, with 'fast' flags by default"""
+
+    ID, _, flags = value.partition("=")
+
+    return ID, fast_math_flags(flags or "fast")
+
+
+def collect_sources(paths: Iterable[str], ext: str) -> List[str]:
+    sources = []
+
+    for path in paths:
+        if not os.path.isdir(path):
+            sources.append(path)
+            continue
 
-    tree = parser.compilationUnit()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            sources.extend(os.path.join(root, f)
+                           for f in sorted(files) if f.endswith(ext))
+
+    return sources
+
+
+def file_signatures(path: str) -> List[Signature]:
+    """Returns the signatures of a source file's public functions, see
+    'signatures'"""
+
+    reset_globals()
     visitor = WappaVisitor()
-    module = visitor.visit(tree)
 
-    with open("ex/test.ll", "w") as f:
-        f.write(module)
+    # Either front end declares the same, see 'StreamingCompiler'
+    with MmapInputStream(path) as source:
+        Parser(source, visitor).signatures()
 
-    # print('=== LLVM IR')
-    # print(module)
+    return signatures(visitor.global_scope)
 
-    llvm.initialize()
-    llvm.initialize_native_target()
-    llvm.initialize_native_asmprinter()
 
-    llvm_module = llvm.parse_assembly(str(module))
+def compile_file(path: str, pipeline: Pipeline, cache_dir: str,
+                 options: CompileOptions, prediction: str = "sll",
+                 front_end: str = "antlr", stream: bool = False,
+                 dump: Optional[str] = None,
+                 externals: Sequence[Signature] = ()
+                 ) -> Tuple[str, bytes, str]:
+    """Returns the cache key, optimized bitcode and C declarations of a
+    source file, writing its IR to the 'dump' directory if given
 
-    if optimize:
-        builder = llvm.create_pass_manager_builder()
-        builder.inlining_threshold = 2
-        builder.loop_vectorize = True
-        builder.opt_level = 3
-        builder.slp_vectorize = True
+    The file can call the functions 'externals' declares, defined in the
+    files it is linked with.
+    """
 
-        mpm = llvm.create_module_pass_manager()
-        builder.populate(mpm)
-        mpm.run(llvm_module)
+    with MmapInputStream(path) as source:
+        cache = CompilationCache(cache_dir)
+        key = cache.key(source.buffer, pipeline, options, externals)
 
-    tm = llvm.Target.from_default_triple().create_target_machine()
+        llvm_module = cache.load(key)
+        declarations = cache.load_declarations(key)
 
-    with llvm.create_mcjit_compiler(llvm_module, tm) as ee:
-        ee.finalize_object()
+        if llvm_module is None or declarations is None:
+            reset_globals()
+
+            name = os.path.splitext(os.path.basename(path))[0]
+
+            if stream:
+                # The streamed IR only ever exists as text
+                with dump_file(dump, name + ".ll") as f:
+                    visitor = StreamingCompiler(
+                        options, front_end, prediction,
+                        external_functions(externals)).compile(source, f)
+
+                    f.seek(0)
+                    llvm_module = llvm.parse_assembly(f.read())
+
+            else:
+                visitor = WappaVisitor(
+                    options, externals=external_functions(externals))
+
+                if front_end == "pratt":
+                    Parser(source, visitor).parse()
+                    module = visitor.compile()
+                else:
+                    module = visitor.visit(parse(source, prediction))
+
+                llvm_module = to_llvm(module)
+
+                if dump is not None:
+                    with dump_file(dump, name + ".ll") as f:
+                        f.write(str(module))
+
+            optimize(llvm_module, pipeline, function_modifiers(
+                visitor.global_scope.symbols(values=True)))
+
+            declarations = c_declarations(visitor.global_scope)
+
+            cache.store(key, llvm_module)
+            cache.store_declarations(key, declarations)
+
+    return key, llvm_module.as_bitcode(), declarations
+
+
+def compile_linked(mapper, paths: List[str], args: Tuple[list, ...]
+                   ) -> List[Tuple[str, bytes, str]]:
+    """Runs 'compile_file' on every file with 'mapper', e.g. a pool's
+    'map', after a first pass over their signatures"""
+
+    public = [[]] * len(paths)
+    if len(paths) > 1:
+        public = list(mapper(file_signatures, paths))
+
+    externals = [[s for other in public[:i] + public[i + 1:] for s in other]
+                 for i in range(len(paths))]
+
+    return list(mapper(compile_file, paths, *args, externals))
+
+
+def compile_files(paths: List[str], pipeline: Pipeline, cache_dir: str,
+                  options: CompileOptions, jobs: Optional[int] = None,
+                  prediction: str = "sll", front_end: str = "antlr",
+                  stream: bool = False, dump: Optional[str] = None
+                  ) -> Tuple[str, llvm.ModuleRef, List[str]]:
+    """Compiles every file in a process pool and links the results, each
+    file declaring the public functions of the others"""
+
+    args = ([pipeline] * len(paths), [cache_dir] * len(paths),
+            [options] * len(paths), [prediction] * len(paths),
+            [front_end] * len(paths), [stream] * len(paths),
+            [dump] * len(paths))
 
-        asm = tm.emit_assembly(llvm_module)
+    if jobs == 1 or len(paths) == 1:
+        results = compile_linked(map, paths, args)
+    else:
+        with ProcessPoolExecutor(jobs, initializer=init_llvm) as pool:
+            results = compile_linked(pool.map, paths, args)
+
+    keys = [key for key, _, _ in results]
+    declarations = [decls for _, _, decls in results]
+
+    llvm_module = llvm.parse_bitcode(results[0][1])
+    for _, bitcode, _ in results[1:]:
+        llvm_module.link_in(llvm.parse_bitcode(bitcode))
+
+    if len(keys) == 1:
+        return keys[0], llvm_module, declarations
+
+    key = CompilationCache(cache_dir).key(
+        "\n".join(keys).encode("utf-8"), pipeline, options)
+
+    return key, llvm_module, declarations
+
+
+def emit(llvm_module: llvm.ModuleRef, declarations: List[str], output: str,
+         shared: bool, pipeline: Pipeline):
+    """Writes an object file or shared library, along with its C header"""
+
+    tm = pipeline.target_machine(
+        reloc="pic" if shared else "default", codemodel="default")
+
+    llvm_module.triple = tm.triple
+    llvm_module.data_layout = str(tm.target_data)
+
+    obj = tm.emit_object(llvm_module)
+
+    if shared:
+        with tempfile.TemporaryDirectory() as tmp:
+            obj_path = os.path.join(tmp, "module.o")
+            with open(obj_path, "wb") as f:
+                f.write(obj)
+
+            subprocess.run([os.environ.get("CC", "cc"), "-shared", "-o",
+                            output, obj_path], check=True)
+
+    else:
+        with open(output, "wb") as f:
+            f.write(obj)
+
+    name = os.path.splitext(output)[0]
+    with open(name + ".h", "w") as f:
+        f.write(c_header(os.path.basename(name), declarations))
+
+
+def compile_fragments(paths: List[str], pipeline: Pipeline,
+                      options: CompileOptions, prediction: str = "sll"
+                      ) -> List[llvm.ModuleRef]:
+    """Compiles every file into a separate module per declaration"""
+
+    fragments = []
+
+    for path in paths:
+        reset_globals()
+
+        compiler = IncrementalCompiler(pipeline, options)
+        with MmapInputStream(path) as source:
+            compiler.update(parse(source, prediction))
+
+        fragments.extend(compiler.fragments())
+
+    return fragments
+
+
+def watch(path: str, pipeline: Pipeline, options: CompileOptions,
+          prediction: str = "sll", interval: float = 0.5):
+    """Recompiles a file incrementally every time it is saved"""
+
+    compiler = IncrementalCompiler(pipeline, options)
+    mtime = None
+
+    while True:
+        current = os.stat(path).st_mtime
+
+        if current != mtime:
+            mtime = current
+            reset_globals()
+
+            with open(path, encoding="utf-8") as f:
+                compiler.update(parse(f.read(), prediction))
+
+            print("Rebuilt: {}".format(", ".join(compiler.rebuilt) or "-"))
+
+        time.sleep(interval)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Wappa compiler")
+    parser.add_argument("paths", nargs="*",
+                        help="source files, or directories to search")
+    parser.add_argument("-O", dest="opt_level", default="3",
+                        choices=[p[1:] for p in PRESETS],
+                        help="optimization preset, as clang's -O levels")
+    parser.add_argument("--enable-pass", action="append", default=[],
+                        choices=PASSES, help="run a pass the preset leaves "
+                        "out")
+    parser.add_argument("--disable-pass", action="append", default=[],
+                        choices=PASSES, help="leave out a pass of the preset")
+    parser.add_argument("--inline-threshold", type=int,
+                        help="inlining threshold, instead of the preset's")
+    parser.add_argument("--optimize-modifier", action="append", default=[],
+                        type=modifier_preset, metavar="MODIFIER=LEVEL",
+                        help="optimize functions declared with a modifier, "
+                        "e.g. 'private=s', at -O0, or -Os or -Oz under an "
+                        "optimizing -O level")
+    parser.add_argument("--time-passes", action="store_true",
+                        help="print LLVM's pass timings to stderr")
+    parser.add_argument("--cpu",
+                        help="CPU to tune for and use the features of, "
+                        "'host' by default for the JIT and the generic "
+                        "baseline for --emit")
+    parser.add_argument("--features", default="",
+                        help="CPU features added to --cpu's, e.g. '+avx2'")
+    parser.add_argument("--vectorize-loops", action="store_true",
+                        help="hint every loop to be vectorized, over the "
+                        "vectorizer's cost model")
+    parser.add_argument("--unroll-loops", action="store_true",
+                        help="hint every loop to be unrolled")
+    parser.add_argument("--fast-math", nargs="?", const=("fast",),
+                        default=(), type=fast_math_flags, metavar="FLAGS",
+                        help="give floating-point operations fast-math "
+                        "flags, 'fast' or e.g. 'reassoc,contract'")
+    parser.add_argument("--fast-math-function", action="append", default=[],
+                        type=function_fast_math, metavar="NAME[=FLAGS]",
+                        help="fast-math flags of a single function, instead "
+                        "of --fast-math's")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="worker processes (defaults to cpu count)")
+    parser.add_argument("--ext", default=".wappa",
+                        help="source extension searched for in directories")
+    parser.add_argument("--cache-dir", default=".wappa_cache")
+    parser.add_argument("--emit", choices=["jit", "obj", "shared"],
+                        default="jit",
+                        help="run in the JIT, or write an object file or "
+                        "shared library with a C header")
+    parser.add_argument("-o", "--output", help="output path for --emit")
+    parser.add_argument("--lazy", action="store_true",
+                        help="JIT-compile each declaration on first use")
+    parser.add_argument("--tiered", action="store_true",
+                        help="start at -O1 and recompile hot functions at -O")
+    parser.add_argument("--tier-threshold", type=int, default=1000,
+                        help="calls after which a function is recompiled")
+    parser.add_argument("--watch", action="store_true",
+                        help="recompile a single file incrementally on save")
+    parser.add_argument("--prediction", choices=PREDICTION_MODES,
+                        default="sll",
+                        help="parse with SLL first and fall back to LL on "
+                        "failure, or always use full LL")
+    parser.add_argument("--front-end", choices=["antlr", "pratt"],
+                        default="antlr",
+                        help="parse with the ANTLR grammar, or the "
+                        "hand-written parser")
+    parser.add_argument("--stream", action="store_true",
+                        help="compile and write out one declaration at a "
+                        "time, keeping only their signatures in memory")
+    parser.add_argument("--dump", metavar="DIR",
+                        help="write each file's unoptimized IR, and the "
+                        "JIT's assembly, to DIR")
+    args = parser.parse_args(argv)
+
+    init_llvm()
+
+    paths = collect_sources(args.paths or ["test.txt"], args.ext)
+    if not paths:
+        parser.error("no source files found")
+
+    # Incremental compilation fingerprints declarations in the parse tree
+    if args.front_end != "antlr" and (args.lazy or args.watch):
+        parser.error("--lazy and --watch need the ANTLR front end")
+
+    if args.stream and (args.lazy or args.watch):
+        parser.error("--lazy and --watch compile their own fragments, "
+                     "and cannot --stream")
+
+    cpu, features = args.cpu, args.features
+    if cpu is None:
+        cpu = "host" if args.emit == "jit" else ""
+
+    # Resolved here, so the cache keys tell CPUs apart
+    if cpu == "host":
+        cpu, host_features = host_cpu()
+        features = ",".join(filter(None, [host_features, features]))
+
+    try:
+        pipeline = Pipeline("O" + args.opt_level, args.enable_pass,
+                            args.disable_pass, args.inline_threshold,
+                            dict(args.optimize_modifier), args.time_passes,
+                            cpu, features)
+
+    except ValueError as e:
+        parser.error(str(e))
+
+    # The loop hints force their pass, so only those of the passes the
+    # pipeline runs are given
+    passes = pipeline.passes(pipeline.preset)
+
+    options = CompileOptions(
+        tiered=args.tiered,
+        vectorize_loops=args.vectorize_loops and "loop-vectorize" in passes,
+        unroll_loops=args.unroll_loops and "unroll" in passes,
+        attributes=pipeline.attributes(),
+        fast_math=args.fast_math,
+        fast_math_functions=dict(args.fast_math_function),
+        internalize=not (args.lazy or args.watch))
+
+    if args.watch:
+        if len(paths) != 1:
+            parser.error("--watch takes a single file")
+
+        return watch(paths[0], pipeline, options, args.prediction)
+
+    if args.emit != "jit" and (args.lazy or args.tiered):
+        parser.error("--lazy and --tiered only apply to the JIT")
+
+    if args.lazy:
+        tm = pipeline.target_machine()
+        ee = create_lazy_jit(tm, compile_fragments(
+            paths, pipeline, options, args.prediction))
+
+    elif args.tiered:
+        # Every function starts out at -O1 at most
+        first = Pipeline("O0" if pipeline.preset == "O0" else "O1",
+                         time_passes=args.time_passes, cpu=cpu,
+                         features=features)
+
+        _, llvm_module, _ = compile_files(
+            paths, first, args.cache_dir, options, args.jobs,
+            args.prediction, args.front_end, args.stream, args.dump)
+
+        tm = pipeline.target_machine()
+        ee = TieredJIT(tm, llvm_module, args.tier_threshold, pipeline)
+
+    else:
+        key, llvm_module, declarations = compile_files(
+            paths, pipeline, args.cache_dir, options, args.jobs,
+            args.prediction, args.front_end, args.stream, args.dump)
+
+        if args.emit != "jit":
+            output = args.output or os.path.splitext(paths[0])[0] + {
+                "obj": ".o", "shared": ".so"}[args.emit]
+
+            return emit(llvm_module, declarations, output,
+                        args.emit == "shared", pipeline)
+
+        cache = CompilationCache(args.cache_dir)
+
+        tm = pipeline.target_machine()
+
+        ee = llvm.create_mcjit_compiler(llvm_module, tm)
+        ee.set_object_cache(*cache.object_cache(key))
+        ee.finalize_object()
 
-        # print('=== Assembly')
-        # print(asm)
+        if args.dump is not None:
+            with dump_file(args.dump, "test.asm") as f:
+                f.write(tm.emit_assembly(llvm_module))
 
-        with open('ex/test.asm', 'w') as f:
-            f.write(asm)
+    with ee:
+        if args.paths:
+            return
 
         print('The result of "sum" is', get_func(
             ee, 'sum', c_int, c_int, c_int)(17, 42))
@@ -71,4 +494,4 @@ def main(optimize: bool):
 
 
 if __name__ == "__main__":
-    main(True)
+    main()
@@ -0,0 +1,272 @@
+import os
+import shutil
+import subprocess
+import time
+from ctypes import c_int, c_void_p
+from os.path import join
+
+import llvmlite.binding as llvm
+import pytest
+
+import main
+from compiler import WappaVisitor
+from compiler.cache import CompilationCache
+from compiler.jit import create_lazy_jit
+from compiler.optimizer import Pipeline, optimize, to_llvm
+from compiler.options import CompileOptions
+from compiler.parser import Parser
+from compiler.tiering import TieredJIT
+
+
+def run(tmp_path, sources, *argv):
+    """Writes the source files, emits an object file of them, and returns
+    the path it was written to"""
+
+    paths = []
+    for name, source in sources.items():
+        paths.append(str(tmp_path / name))
+
+        with open(paths[-1], "w", encoding="utf-8") as f:
+            f.write(source)
+
+    output = str(tmp_path / "out.o")
+    main.main(["--front-end", "pratt", "--emit", "obj", "-o", output,
+               "--cache-dir", str(tmp_path / "cache"), "--dump",
+               str(tmp_path / "dump"), *argv, *paths])
+
+    return output
+
+
+LOOP = """
+fun f(n: Int) => Int where
+    var s = 0;
+    for (var i = 0; i < n; i++) where
+        s += i ^ (i >> 1);
+    end
+    return s;
+end
+"""
+
+
+@pytest.mark.parametrize("argv, hinted", [
+    ((), False),
+    (("--vectorize-loops",), True),
+    (("--vectorize-loops", "--disable-pass", "loop-vectorize"), False),
+    # O1 doesn't vectorize
+    (("--vectorize-loops", "-O", "1"), False),
+])
+def test_loop_hints(tmp_path, argv, hinted):
+    run(tmp_path, {"loop.wappa": LOOP}, *argv)
+
+    with open(join(tmp_path, "dump", "loop.ll"), encoding="utf-8") as f:
+        assert ("llvm.loop.vectorize.enable" in f.read()) == hinted
+
+
+def test_cache(tmp_path, monkeypatch):
+    main.init_llvm()
+
+    source = tmp_path / "f.wappa"
+    source.write_text("fun f(a: Int) => Int = a * 2 + 1;\n")
+
+    cache_dir = str(tmp_path / "cache")
+    pipeline, options = Pipeline("O2"), CompileOptions()
+
+    key, bitcode, declarations = main.compile_file(
+        str(source), pipeline, cache_dir, options, front_end="pratt")
+
+    # Nothing is compiled again on a hit
+    monkeypatch.setattr(main, "Parser", None)
+
+    assert main.compile_file(str(source), pipeline, cache_dir, options,
+                             front_end="pratt") == (key, bitcode,
+                                                    declarations)
+
+    cache = CompilationCache(cache_dir)
+    assert cache.key(source.read_bytes(), pipeline, options, ()) == key
+    assert cache.key(source.read_bytes(), Pipeline("O1"), options, ()) != key
+
+    # The JIT writes its object code on the first run, and only reads it
+    # back on the next
+    written = []
+
+    for _ in range(2):
+        notify, getbuffer = cache.object_cache(key)
+
+        ee = llvm.create_mcjit_compiler(
+            llvm.parse_bitcode(bitcode), pipeline.target_machine())
+        ee.set_object_cache(
+            lambda m, buffer: written.append(notify(m, buffer)), getbuffer)
+        ee.finalize_object()
+
+        assert main.get_func(ee, "f", c_int, c_int)(20) == 41
+
+    assert len(written) == 1
+    assert os.path.exists(join(cache_dir, key + ".o"))
+
+
+def test_tiered():
+    main.init_llvm()
+    main.reset_globals()
+
+    visitor = WappaVisitor(CompileOptions(tiered=True))
+    Parser("""
+fun g(a: Int) => Int = a * 3;
+fun f(a: Int) => Int = g(a) + 1;
+""", visitor).parse()
+
+    llvm_module = to_llvm(visitor.compile())
+    optimize(llvm_module, Pipeline("O1"))
+
+    pipeline = Pipeline("O3")
+
+    with TieredJIT(pipeline.target_machine(), llvm_module, threshold=10,
+                   pipeline=pipeline, interval=0.01) as jit:
+        f = main.get_func(jit, "f", c_int, c_int)
+        impl = c_void_p.from_address(
+            jit.ee.get_global_value_address("f.impl"))
+        before = impl.value
+
+        assert [f(a) for a in range(20)] == [a * 3 + 1 for a in range(20)]
+
+        deadline = time.monotonic() + 10
+        while "f" not in jit.promoted and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        # Swapped for the re-optimized body, which computes the same
+        assert "f" in jit.promoted
+        assert impl.value != before
+        assert impl.value == jit.get_function_address("f.tier2")
+        assert [f(a) for a in range(20)] == [a * 3 + 1 for a in range(20)]
+
+
+def fragment(name, ir):
+    ret = llvm.parse_assembly(ir)
+    ret.name = name
+
+    return ret
+
+
+def test_lazy_jit():
+    main.init_llvm()
+
+    ee = create_lazy_jit(Pipeline().target_machine(), [
+        fragment("g", """
+define i32 @g(i32 %a) {
+    %r = mul i32 %a, 3
+    ret i32 %r
+}"""),
+        fragment("f", """
+declare i32 @g(i32)
+define i32 @f(i32 %a) {
+    %r = call i32 @g(i32 %a)
+    %s = add i32 %r, 1
+    ret i32 %s
+}"""),
+        fragment("h", """
+define i32 @h(i32 %a) {
+    ret i32 %a
+}""")])
+
+    # Notified of every fragment as it is compiled
+    compiled = []
+    ee.set_object_cache(lambda m, buffer: compiled.append(m.name),
+                        lambda m: None)
+
+    with ee:
+        assert compiled == []
+
+        # Only the fragment looked up, and those defining its callees
+        f = main.get_func(ee, "f", c_int, c_int)
+        assert sorted(compiled) == ["f", "g"]
+
+        assert f(5) == 16
+
+
+def test_compile_fragments(tmp_path):
+    main.init_llvm()
+
+    source = tmp_path / "f.wappa"
+    source.write_text("""
+fun g(a: Int) => Int = a * 3;
+fun f(a: Int) => Int = g(a) + 1;
+""")
+
+    fragments = main.compile_fragments(
+        [str(source)], Pipeline("O2"),
+        CompileOptions(internalize=False))
+    assert len(fragments) == 2
+
+    with create_lazy_jit(Pipeline().target_machine(), fragments) as ee:
+        assert main.get_func(ee, "f", c_int, c_int)(5) == 16
+
+
+EXPORTS = """
+public fun f(b: Bool, a: Int) => Bool = b && a > 0;
+private fun g(a: Int) => Int = a;
+"""
+
+
+def test_emit_header(tmp_path):
+    output = run(tmp_path, {"exports.wappa": EXPORTS})
+
+    assert os.path.getsize(output) > 0
+
+    with open(join(tmp_path, "out.h"), encoding="utf-8") as f:
+        header = f.read()
+
+    assert header.startswith("#ifndef OUT_H\n#define OUT_H\n")
+    assert 'extern "C" {' in header
+
+    # Only public functions, in C's types
+    assert "bool f(bool b, int32_t a);" in header
+    assert " g(" not in header
+
+    with open(join(tmp_path, "dump", "exports.ll"), encoding="utf-8") as f:
+        assert 'zeroext i1 @"f"(i1 zeroext %"b", i32 %"a")' in f.read()
+
+
+@pytest.mark.skipif(shutil.which("cc") is None, reason="needs a C compiler")
+def test_emit_called_from_c(tmp_path):
+    run(tmp_path, {"exports.wappa": EXPORTS})
+
+    program = tmp_path / "main.c"
+    program.write_text("""
+#include "out.h"
+
+int main(void) {
+    return !(f(true, 1) && !f(true, 0) && !f(false, 1));
+}
+""")
+
+    subprocess.run(["cc", "-o", str(tmp_path / "main"), str(program),
+                    str(tmp_path / "out.o")], check=True)
+    subprocess.run([str(tmp_path / "main")], check=True)
+
+
+@pytest.mark.parametrize("jobs, stream", [(1, False), (2, False), (2, True)])
+def test_compile_files(tmp_path, jobs, stream):
+    main.init_llvm()
+
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "g.wappa").write_text(
+        "public fun g(a: Int) => Int = a * 3;\n")
+    (tmp_path / "src" / "f.wappa").write_text(
+        "fun f(a: Int) => Int = g(a) + 1;\n")
+
+    paths = main.collect_sources([str(tmp_path / "src")], ".wappa")
+    assert [os.path.basename(p) for p in paths] == ["f.wappa", "g.wappa"]
+
+    pipeline = Pipeline("O2")
+
+    _, llvm_module, declarations = main.compile_files(
+        paths, pipeline, str(tmp_path / "cache"), CompileOptions(), jobs,
+        front_end="pratt", stream=stream)
+
+    # Each file only declares its own functions
+    assert declarations == ["int32_t f(int32_t a);", "int32_t g(int32_t a);"]
+
+    ee = llvm.create_mcjit_compiler(llvm_module, pipeline.target_machine())
+    ee.finalize_object()
+
+    with ee:
+        assert main.get_func(ee, "f", c_int, c_int)(5) == 16
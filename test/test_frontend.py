@@ -0,0 +1,562 @@
+import io
+import math
+from collections import Counter
+from ctypes import CFUNCTYPE, c_double, c_int
+from glob import glob
+from os.path import basename, dirname, join
+
+import llvmlite.binding as llvm
+import pytest
+from antlr4 import InputStream
+
+from compiler import WappaLexer, WappaVisitor
+from compiler.IDGenerator import IDGenerator
+from compiler.incremental import IncrementalCompiler
+from compiler.input_stream import MmapInputStream
+from compiler.lexer import tokenize
+from compiler.optimizer import (Pipeline, function_modifiers, optimize,
+                                to_llvm)
+from compiler.options import CompileOptions
+from compiler.parser import Parser
+from compiler.parsing import parse
+from compiler.streaming import StreamingCompiler
+from compiler.structs.Block import Block
+from compiler.structs.Class import Class
+from compiler.structs.Expression import CompoundExpression, Expression
+from compiler.structs.Function import Function
+from compiler.structs.Scope import Scope
+from compiler.structs.Statement import Statement
+from compiler.structs.Type import WappaType
+from compiler.traversal import walk
+from compiler.type_system import BoolType, IntType
+from compiler.util import EXCEPTION_LIST
+
+ROOT = dirname(dirname(__file__))
+CORPUS = [join(ROOT, "test.txt")] + sorted(
+    glob(join(ROOT, "test", "corpus", "*.wappa")))
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def compile_with(front_end, source, stream=False):
+    EXCEPTION_LIST.clear()
+    WappaType.idgen = IDGenerator()
+
+    if stream:
+        out = io.StringIO()
+        StreamingCompiler(front_end=front_end).compile(source, out)
+
+        return out.getvalue(), sorted(set(EXCEPTION_LIST))
+
+    visitor = WappaVisitor()
+
+    if front_end == "pratt":
+        Parser(source, visitor).parse()
+        module = visitor.compile()
+    else:
+        module = visitor.visit(parse(source))
+
+    return str(module), sorted(set(EXCEPTION_LIST))
+
+
+@pytest.mark.parametrize("path", CORPUS, ids=basename)
+def test_tokens(path):
+    source = read(path)
+
+    expected = [(WappaLexer.symbolicNames[t.type], t.text, t.line, t.column)
+                for t in WappaLexer(InputStream(source)).getAllTokens()]
+
+    assert [(t.type, t.text, t.line, t.column)
+            for t in tokenize(source)[:-1]] == expected
+
+
+@pytest.mark.parametrize("path", CORPUS, ids=basename)
+def test_mmap_input_stream(path):
+    source = read(path)
+    expected = InputStream(source)
+
+    # Small enough for tokens to straddle chunks
+    with MmapInputStream(path, chunk_size=16) as stream:
+        assert stream.size == expected.size
+        assert [(t.type, t.text, t.line, t.column, t.start)
+                for t in tokenize(stream)] == [
+                    (t.type, t.text, t.line, t.column, t.start)
+                    for t in tokenize(source)]
+
+        for i in range(expected.size):
+            assert stream.LA(1) == expected.LA(1)
+            assert stream.getText(i, i + 40) == expected.getText(i, i + 40)
+
+            stream.consume()
+            expected.consume()
+
+
+@pytest.mark.parametrize("path", CORPUS, ids=basename)
+def test_front_ends_agree(path):
+    source = read(path)
+
+    assert compile_with("pratt", source) == compile_with("antlr", source)
+
+
+def definitions(module):
+    return sorted(str(f) for f in llvm.parse_assembly(
+        module, context=llvm.create_context()).functions
+        if not f.is_declaration)
+
+
+@pytest.mark.parametrize("front_end", ["antlr", "pratt"])
+@pytest.mark.parametrize("path", CORPUS, ids=basename)
+def test_streaming(path, front_end):
+    source = read(path)
+
+    module, exceptions = compile_with(front_end, source)
+    streamed, streamed_exceptions = compile_with(front_end, source, True)
+
+    assert streamed_exceptions == exceptions
+    assert definitions(streamed) == definitions(module)
+
+
+def test_streaming_forward_reference():
+    module, exceptions = compile_with("pratt", """
+fun f(a: Int) => Int = g(a) + 1;
+fun g(a: Int) => Int = a * 2;
+""", True)
+
+    assert exceptions == []
+    assert not llvm.parse_assembly(module).get_function("g").is_declaration
+
+
+@pytest.mark.parametrize("front_end", ["antlr", "pratt"])
+def test_deep_expression(front_end):
+    # Deeper than the recursion limit, as in generated code
+    terms = " + ".join(["a"] * 1500)
+
+    module, exceptions = compile_with(front_end, """
+fun f(a: Int) => Int = {};
+""".format(terms))
+
+    assert exceptions == []
+    assert str(module).count(" add ") == 1499
+
+
+def test_symbol_index():
+    outer = Scope(None)
+    inner = Scope(None, parent=Scope(None, parent=outer))
+
+    outer.add_symbol(None, "x", IntType)
+    assert inner.get_symbol(None, "x") is IntType
+    assert inner.get_symbol(None, "x") is IntType
+
+    # Shadowing the memoized symbol
+    inner.parent.add_symbol(None, "x", BoolType)
+    assert inner.get_symbol(None, "x") is BoolType
+    assert inner.get_symbol(None, "y", report=False) is None
+
+    assert outer.index.stats() == {
+        "lookups": 4, "indexed": 0, "hits": 1, "unresolved": 1,
+        "depths": {1: 1, 2: 2}}
+
+
+def test_symbol_index_entered():
+    outer = Scope(None)
+    outer.enter()
+    outer.add_symbol(None, "x", IntType)
+
+    middle = Scope(None, parent=outer)
+    middle.enter()
+
+    inner = Scope(None, parent=middle)
+    inner.enter()
+    assert inner.get_symbol(None, "x") is IntType
+
+    # Declared in a scope the innermost one is nested in
+    middle.add_symbol(None, "x", BoolType)
+    assert inner.get_symbol(None, "x") is BoolType
+
+    inner.exit()
+    middle.exit()
+    assert outer.get_symbol(None, "x") is IntType
+
+    # Looked into after being exited, by walking up its parents
+    assert inner.get_symbol(None, "x") is BoolType
+    assert inner.get_symbol(None, "y", report=False) is None
+
+    assert outer.index.stats() == {
+        "lookups": 5, "indexed": 3, "hits": 0, "unresolved": 1,
+        "depths": {0: 1, 1: 2, 2: 1}}
+    assert outer.index.bindings == {"x": [(outer, IntType)]}
+
+
+def test_pipeline_overrides():
+    llvm.initialize_native_target()
+
+    EXCEPTION_LIST.clear()
+    WappaType.idgen = IDGenerator()
+
+    pipeline = Pipeline("O2", overrides={"private": "O0", "const": "Oz"})
+
+    visitor = WappaVisitor(CompileOptions(attributes=pipeline.attributes()))
+    Parser("""
+private fun f(a: Int) => Int = a * 2;
+const fun g(a: Int) => Int = a + 1;
+fun h(a: Int) => Int = f(a) + g(a);
+""", visitor).parse()
+
+    llvm_module = to_llvm(visitor.compile())
+    optimize(llvm_module, pipeline, function_modifiers(
+        visitor.global_scope.symbols(values=True)))
+
+    attributes = {f.name: b" ".join(f.attributes).split()
+                  for f in llvm_module.functions}
+
+    assert b"optnone" in attributes["f"]
+    assert b"minsize" in attributes["g"]
+    assert b"optnone" not in attributes["h"]
+
+    # Only the module's passes run a preset in full, and they run O2's on
+    # every function without attributes to say otherwise
+    for preset, override in [("O2", "O1"), ("O2", "O3"), ("O0", "O2"),
+                             ("O0", "Os")]:
+        with pytest.raises(ValueError):
+            Pipeline(preset, overrides={"private": override})
+
+    assert Pipeline("O0", overrides={"private": "O0"}).preset_for(
+        ["private"]) == "O0"
+
+
+def test_incremental_type_index():
+    EXCEPTION_LIST.clear()
+    WappaType.idgen = IDGenerator()
+
+    compiler = IncrementalCompiler()
+    source = """
+class A where
+    var x: Int;
+end
+"""
+
+    compiler.update(parse(source))
+    compiler.update(parse(source + """
+class B where
+    var y: Int;
+end
+"""))
+
+    assert compiler.rebuilt == ["B"]
+
+    # The reused class keeps its bit, which the new one must not share
+    A, B = compiler.units["A"].symbol, compiler.units["B"].symbol
+    assert A.bit != B.bit
+    assert not A.is_a(B) and not B.is_a(A)
+
+    # Every edit of B numbers it in the bits of its previous version
+    size = compiler.tindex.size
+
+    for i in range(5):
+        compiler.update(parse(source + """
+class B where
+    var y{}: Int;
+end
+""".format(i)))
+
+        assert compiler.rebuilt == ["B"]
+
+    assert compiler.tindex.size == size
+    assert compiler.units["A"].symbol is A
+    assert not A.is_a(compiler.units["B"].symbol)
+
+
+def test_fast_math():
+    EXCEPTION_LIST.clear()
+    WappaType.idgen = IDGenerator()
+
+    visitor = WappaVisitor(CompileOptions(
+        fast_math_functions={"f": ("nnan", "contract")}))
+    Parser("""
+fun f(a: Double, b: Double) => Double = a * b + a;
+fun g(a: Double, b: Double) => Double = a * b + a;
+""", visitor).parse()
+
+    module = visitor.compile()
+
+    assert "fmul nnan contract" in str(module.get_global("f"))
+    assert "fadd nnan contract" in str(module.get_global("f"))
+    assert "nnan" not in str(module.get_global("g"))
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_inferred_attributes(stream):
+    module, exceptions = compile_with("pratt", """
+private fun g(a: Int) => Int = a * 2;
+fun f(a: Int) => Int = g(a) + 1;
+""", stream)
+
+    assert exceptions == []
+
+    functions = {f.name: str(f) for f in llvm.parse_assembly(
+        module).functions}
+
+    assert "define internal fastcc" in functions["g"]
+    assert "call fastcc" in functions["f"]
+    assert "readnone" in functions["f"]
+
+
+def test_inferred_attributes_recursion():
+    # Only the streaming compiler declares functions before their bodies
+    module, exceptions = compile_with("pratt", """
+fun f(a: Int) => Int = a > 0 ? f(a - 1) : g(a);
+fun g(a: Int) => Int = a;
+""", True)
+
+    assert exceptions == []
+
+    f = str(llvm.parse_assembly(module).get_function("f"))
+
+    # Only calls itself, but 'g' was called before its body was compiled
+    assert "nounwind" in f
+    assert "readnone" not in f
+
+
+@pytest.mark.parametrize("front_end", ["antlr", "pratt"])
+def test_mixed_arithmetic(front_end):
+    module, exceptions = compile_with(front_end, """
+fun f(a: Int) => Double where
+    var x = a + 1.5;
+    return x;
+end
+
+fun g(a: Double, b: Int) => Int = b + a;
+""")
+
+    assert exceptions == []
+
+    functions = {f.name: str(f) for f in llvm.parse_assembly(
+        module).functions}
+
+    # Computed in Double, and only converted back to Int when returned
+    assert "sitofp" in functions["f"]
+    assert "fadd double" in functions["g"]
+    assert "fptosi double" in functions["g"]
+
+
+def call(module, name, restype, *argtypes):
+    """Returns a function of a module, compiled in a JIT kept alive by it"""
+
+    llvm.initialize_native_target()
+    llvm.initialize_native_asmprinter()
+
+    tm = llvm.Target.from_default_triple().create_target_machine()
+    ee = llvm.create_mcjit_compiler(llvm.parse_assembly(module), tm)
+    ee.finalize_object()
+
+    ret = CFUNCTYPE(restype, *argtypes)(ee.get_function_address(name))
+    ret.ee = ee
+
+    return ret
+
+
+def test_shadowing_initializer():
+    module, exceptions = compile_with("pratt", """
+fun f(a: Int) => Int where
+    var x = a;
+    if a > 0 where
+        var x = x + 1;
+        return x;
+    end
+    return x;
+end
+""")
+
+    assert exceptions == []
+
+    # The inner 'x' starts from the outer one, not from itself
+    assert call(module, "f", c_int, c_int)(41) == 42
+
+
+def test_induction_variable():
+    module, exceptions = compile_with("pratt", """
+fun f(a: Int) => Int where
+    var s = 0;
+    for (var i = a; i < 1_0; i += 0x2L) where
+        s += 1;
+    end
+    return s;
+end
+""")
+
+    assert exceptions == []
+
+    body = str(llvm.parse_assembly(module).get_function("f"))
+
+    # Lowered to a phi, wrapping like the generic loop would
+    assert "phi i32" in body
+    assert "nsw" not in body
+
+    assert call(module, "f", c_int, c_int)(0) == 5
+
+
+@pytest.mark.parametrize("loop, expected", [
+    ("while (k < n) where k += 2; end", {0: 0, 5: 6}),
+    ("until (k >= n) where k += 2; end", {0: 0, 5: 6}),
+    # The body runs once before the first test
+    ("do where k += 2; end while (k < n);", {0: 2, 5: 6}),
+    ("do where k += 2; end until (k >= n);", {0: 2, 5: 6}),
+], ids=["while", "until", "do-while", "do-until"])
+def test_loops(loop, expected):
+    module, exceptions = compile_with("pratt", """
+fun f(n: Int) => Int where
+    var k = 0;
+    %s
+    return k;
+end
+""" % loop)
+
+    assert exceptions == []
+
+    f = call(module, "f", c_int, c_int)
+    assert {n: f(n) for n in expected} == expected
+
+
+def compile_folded(source, fold):
+    EXCEPTION_LIST.clear()
+    WappaType.idgen = IDGenerator()
+
+    visitor = WappaVisitor(CompileOptions(fold_constants=fold))
+    Parser(source, visitor).parse()
+    module = str(visitor.compile())
+
+    assert EXCEPTION_LIST == []
+
+    return module
+
+
+@pytest.mark.parametrize("expr", [
+    # Wrapping overflow
+    "2147483647 + 1", "2147483647 * 2", "-2147483647 - 2",
+    # Signed division and remainder truncate towards zero
+    "-7 // 2", "-7 % 2", "7 // -2", "7 % -2",
+    "-8 >> 1", "-8 >>> 1", "1 << 31", "0x7fffffff + 1_0",
+])
+def test_fold_constants(expr):
+    source = "fun f(a: Int) => Int = {};".format(expr)
+
+    folded = compile_folded(source, True)
+    unfolded = compile_folded(source, False)
+
+    # Computed at compile time, to what the instructions would compute
+    assert "ret i32 %" not in folded
+    assert call(folded, "f", c_int, c_int)(0) == call(
+        unfolded, "f", c_int, c_int)(0)
+
+
+def test_fold_dead_branches():
+    source = """
+fun f(a: Int) => Int where
+    if (1 > 2) where
+        return 1;
+    end elsif (a > 0) where
+        return 2;
+    end elsif (2 > 1) where
+        return 3;
+    end else where
+        return 4;
+    end
+end
+"""
+
+    folded = compile_folded(source, True)
+
+    # The always taken branch is the else of those before it
+    assert "ret i32 1" not in folded and "ret i32 4" not in folded
+
+    for fold in [True, False]:
+        f = call(compile_folded(source, fold), "f", c_int, c_int)
+        assert (f(1), f(-1)) == (2, 3)
+
+
+def test_fold_float_identity():
+    # -0.0 + 0.0 is 0.0, so 'a + 0.0' is not 'a'
+    source = "fun f(a: Double) => Double = a + 0.0;"
+
+    folded = compile_folded(source, True)
+    assert "fadd" in folded
+
+    for fold in [True, False]:
+        f = call(compile_folded(source, fold), "f", c_double, c_double)
+        assert math.copysign(1.0, f(-0.0)) == 1.0
+
+
+def test_fold_ternary():
+    # Dividing by zero would trap, were both operands evaluated
+    source = "fun f(a: Int) => Int = a != 0 ? (4 + 4) // a : 0 * a;"
+
+    folded = compile_folded(source, True)
+    assert "select" not in folded and "sdiv i32 8" in folded
+
+    for fold in [True, False]:
+        f = call(compile_folded(source, fold), "f", c_int, c_int)
+        assert (f(0), f(2)) == (0, 4)
+
+
+def test_types_resolved_once(monkeypatch):
+    calls = Counter()
+
+    def count(type_node):
+        def wrapper(self):
+            calls[id(self)] += 1
+            return type_node(self)
+
+        return wrapper
+
+    classes = [CompoundExpression]
+    while classes:
+        cls = classes.pop()
+        classes.extend(cls.__subclasses__())
+
+        if "type_node" in vars(cls):
+            monkeypatch.setattr(cls, "type_node", count(cls.type_node))
+
+    terms = 200
+    module, exceptions = compile_with(
+        "pratt", "fun f(a: Int) => Int = {};".format(
+            " + ".join(["(a * 2)"] * terms)))
+
+    assert exceptions == []
+
+    # The sum's additions and each term's multiplication, once each
+    assert len(calls) == 2 * terms - 1
+    assert set(calls.values()) == {1}
+
+
+@pytest.mark.parametrize("path", CORPUS, ids=basename)
+def test_nodes_slotted(path):
+    EXCEPTION_LIST.clear()
+    WappaType.idgen = IDGenerator()
+
+    visitor = WappaVisitor()
+    Parser(read(path), visitor).parse()
+
+    functions = []
+    for symbol in visitor.global_scope.symbols(values=True):
+        if isinstance(symbol, Class):
+            functions.extend(symbol.scope.symbols(values=True))
+        else:
+            functions.append(symbol)
+
+    # 'children' only finds what is in a node's slots
+    nodes = [n for f in functions if isinstance(f, Function)
+             for n in walk(f.block)]
+
+    assert len(nodes) > len(functions)
+    assert [n for n in nodes if hasattr(n, "__dict__")] == []
+
+    # Including the kinds of node the corpus doesn't use
+    classes = [Block, Expression, Statement]
+    while classes:
+        cls = classes.pop()
+        classes.extend(cls.__subclasses__())
+
+        assert "__slots__" in vars(cls), cls
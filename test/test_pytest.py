@@ -1,7 +1,8 @@
-from compiler.structs.Type import WappaType
-from compiler.TypeSystem import (AnyType, BoolType, ByteType, DoubleType,
-                                 FloatType, IntType, LongType, ShortType,
-                                 StringType, TypeSolver)
+from compiler.IDGenerator import IDGenerator
+from compiler.structs.Type import TypeIndex, WappaType
+from compiler.type_system import (AnyType, BoolType, ByteType, DoubleType,
+                                  FloatType, IntType, LongType, ShortType,
+                                  StringType, TypeSolver)
 
 
 def test_linearize():
@@ -9,17 +10,17 @@ def test_linearize():
         "Test Type", supertypes=[BoolType, StringType])
 
     assert TypeSolver().linearize_hierarchy(
-        ttype) == [ttype, BoolType, ByteType, ShortType, IntType, LongType,
-                   FloatType, DoubleType, StringType, AnyType]
+        ttype) == (ttype, BoolType, ByteType, ShortType, IntType, LongType,
+                   FloatType, DoubleType, StringType, AnyType)
 
 
 def test_nca():
-    assert TypeSolver().ncas((BoolType, StringType)) == [AnyType]
+    assert TypeSolver().ncas((BoolType, StringType)) == (AnyType,)
 
 
 def test_shared():
-    assert TypeSolver().shared_hierarchy((BoolType, FloatType)) == [
-        ByteType, IntType, FloatType, DoubleType, AnyType]
+    assert TypeSolver().shared_hierarchy((BoolType, FloatType)) == (
+        FloatType, DoubleType, AnyType)
 
 
 def test_simplfied():
@@ -27,5 +28,52 @@ def test_simplfied():
     hierarchy = tsolver.linearize_hierarchy(WappaType(
         "Test Type", supertypes=[BoolType, StringType]))[1:]
 
-    assert tsolver._TypeSolver__simplify_hierarchy(hierarchy) == [
-        BoolType, StringType]
+    assert tsolver._TypeSolver__simplify_hierarchy(hierarchy) == (
+        BoolType, StringType)
+
+
+def test_cache():
+    tsolver = TypeSolver(cache_size=1)
+
+    tsolver.shared_hierarchy((BoolType, FloatType))
+    tsolver.shared_hierarchy((BoolType, FloatType))
+    tsolver.shared_hierarchy((IntType, StringType))
+    tsolver.shared_hierarchy((BoolType, FloatType))
+
+    assert tsolver.cache.stats() == {"entries": 1, "hits": 1, "misses": 3}
+
+
+def test_generate_id():
+    idgen = IDGenerator()
+
+    assert [idgen.generate_id() for _ in range(3)] == ["gen", "gen.1", "gen.2"]
+
+    idgen.append("A Class")
+    assert idgen.generate_id("x") == "A_Class.x"
+    assert idgen.generate_id("x") == "A_Class.x.1"
+    idgen.pop()
+
+    assert idgen.generate_id("9lives") == "_9lives"
+    assert idgen.intern("".join(["a", "b"])) is idgen.intern("ab")
+
+
+def test_type_index_release():
+    tindex = TypeIndex()
+    WappaType.tindex, builtins = tindex, WappaType.tindex
+
+    try:
+        base = WappaType("Base")
+        tindex.claimed()
+
+        first = WappaType("First", supertypes=[base])
+        tindex.release(tindex.claimed())
+
+        # Numbered in the bit the released type had
+        second = WappaType("Second", supertypes=[base])
+
+        assert second.bit == first.bit
+        assert tindex.size == 2
+        assert second.is_a(base) and not base.is_a(second)
+
+    finally:
+        WappaType.tindex = builtins